@@ -1,13 +1,14 @@
 import React, { useState, useEffect } from 'react';
-import { useNavigate } from 'react-router-dom';
-import { API_BASE, commonStyles, buttonColors } from '../utils/constants';
+import { useNavigate, useLocation } from 'react-router-dom';
+import { commonStyles, buttonColors } from '../utils/constants';
 
 function Landing() {
   const [playerName, setPlayerName] = useState('');
   const [roomName, setRoomName] = useState('');
-  const [loading, setLoading] = useState(false);
-  const [error, setError] = useState('');
   const navigate = useNavigate();
+  const location = useLocation();
+  // A refused handshake join sends the player back here with the reason
+  const [error, setError] = useState(location.state?.error || '');
 
   // Generate random username in dev mode
   useEffect(() => {
@@ -25,7 +26,7 @@ function Landing() {
     return /^[a-zA-Z0-9]+$/.test(value);
   };
 
-  const handleJoinRoom = async (e) => {
+  const handleJoinRoom = (e) => {
     e.preventDefault();
     setError('');
 
@@ -39,33 +40,8 @@ function Landing() {
       return;
     }
 
-    setLoading(true);
-
-    try {
-      const response = await fetch(`${API_BASE}/api/join-room/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          player_name: playerName.trim(),
-          room_name: roomName.trim(),
-        }),
-      });
-
-      const data = await response.json();
-
-      if (response.ok) {
-        navigate(`/waiting/${roomName.trim()}/${playerName.trim()}`);
-      } else {
-        setError(data.error || 'Failed to join room');
-      }
-    } catch (err) {
-      setError('Unable to connect to server');
-      console.error('Join room error:', err);
-    } finally {
-      setLoading(false);
-    }
+    // The waiting room's WebSocket joins during its handshake
+    navigate(`/waiting/${roomName.trim()}/${playerName.trim()}`, { state: { join: true } });
   };
 
   const isMobile = window.innerWidth <= 768;
@@ -116,15 +92,14 @@ function Landing() {
 
         <button
           type="submit"
-          disabled={loading}
           style={{
             ...commonStyles.button,
             width: '100%',
-            backgroundColor: loading ? '#ccc' : buttonColors.primary,
-            cursor: loading ? 'not-allowed' : 'pointer'
+            backgroundColor: buttonColors.primary,
+            cursor: 'pointer'
           }}
         >
-          {loading ? 'Joining...' : 'Join Room'}
+          Join Room
         </button>
       </form>
 
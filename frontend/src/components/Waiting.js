@@ -1,11 +1,12 @@
 import React, { useState, useCallback } from 'react';
-import { useParams, useNavigate } from 'react-router-dom';
+import { useParams, useNavigate, useLocation } from 'react-router-dom';
 import { useWebSocket } from '../hooks/useWebSocket';
 import { commonStyles, statusColors, buttonColors } from '../utils/constants';
 
 function Waiting() {
   const { roomName, playerName } = useParams();
   const navigate = useNavigate();
+  const location = useLocation();
   const [roomData, setRoomData] = useState(null);
 
   const handleMessage = useCallback((data) => {
@@ -20,12 +21,15 @@ function Waiting() {
       case 'error':
         setError(data.message);
         break;
+      case 'join_error':
+        navigate('/', { state: { error: data.message } });
+        break;
       default:
         console.log('Unknown message type:', data.type);
     }
   }, [navigate, roomName, playerName]);
 
-  const { connectionStatus, error, setError, sendMessage } = useWebSocket(roomName, playerName, handleMessage);
+  const { connectionStatus, error, setError, sendMessage } = useWebSocket(roomName, playerName, handleMessage, { join: Boolean(location.state?.join) });
 
   const handleStartGame = () => {
     const success = sendMessage({ type: 'start_game' });
@@ -1,49 +1,90 @@
 import { useRef, useEffect, useState } from 'react';
 import { WS_BASE } from '../utils/constants';
 
-export const useWebSocket = (roomName, playerName, onMessage) => {
+export const useWebSocket = (roomName, playerName, onMessage, { join = false } = {}) => {
   const [connectionStatus, setConnectionStatus] = useState('connecting');
   const [error, setError] = useState('');
   const ws = useRef(null);
   const isClosing = useRef(false);
-  const heartbeatInterval = useRef(null);
+  const lastSeq = useRef(null);
+  const joinPending = useRef(join);
 
   useEffect(() => {
-    const startHeartbeat = () => {
-      heartbeatInterval.current = setInterval(() => {
-        if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-          ws.current.send(JSON.stringify({ type: 'ping' }));
-        }
-      }, 30000); // Send ping every 30 seconds
-    };
-
-    const stopHeartbeat = () => {
-      if (heartbeatInterval.current) {
-        clearInterval(heartbeatInterval.current);
-        heartbeatInterval.current = null;
-      }
-    };
+    const sessionKey = `session:${roomName}:${playerName}`;
+    // Only reconnects within this hook instance resume; a fresh page needs full state
+    lastSeq.current = null;
 
     const connectWebSocket = () => {
-      ws.current = new WebSocket(`${WS_BASE}/ws/game/${roomName}/${playerName}/`);
+      const params = new URLSearchParams();
+      // Acknowledge received frames so the server can tell when this client falls behind
+      params.set('ack', '1');
+      // Join during the handshake instead of a separate POST; only the first connect joins
+      if (joinPending.current) {
+        params.set('join', '1');
+      }
+      const session = sessionStorage.getItem(sessionKey);
+      if (session) {
+        params.set('session', session);
+        if (lastSeq.current !== null) {
+          params.set('last_seq', lastSeq.current);
+        }
+      }
+      const query = params.toString() ? `?${params.toString()}` : '';
+      const socket = new WebSocket(`${WS_BASE}/ws/game/${roomName}/${playerName}/${query}`);
+      ws.current = socket;
+      let received = 0;
+      let ackScheduled = false;
 
       ws.current.onopen = () => {
         console.log('WebSocket connected');
         setConnectionStatus('connected');
         setError('');
         isClosing.current = false;
-        startHeartbeat();
       };
 
       ws.current.onmessage = (event) => {
+        // One ack per batch of frames handled in the same task
+        received += 1;
+        if (!ackScheduled) {
+          ackScheduled = true;
+          setTimeout(() => {
+            ackScheduled = false;
+            if (socket.readyState === WebSocket.OPEN) {
+              socket.send(JSON.stringify({ type: 'ack', received }));
+            }
+          }, 0);
+        }
+
         try {
           const data = JSON.parse(event.data);
           console.log('WebSocket message:', data);
           
+          if (typeof data.seq === 'number') {
+            lastSeq.current = Math.max(lastSeq.current ?? 0, data.seq);
+          }
+
           // Handle pong messages silently
           if (data.type === 'pong') {
             return;
           }
+
+          // Remember the resume token for reconnects
+          if (data.type === 'session') {
+            sessionStorage.setItem(sessionKey, data.session);
+            lastSeq.current = data.seq;
+            return;
+          }
+
+          // The server is handing this room to a new process; the close follows
+          if (data.type === 'reconnect') {
+            return;
+          }
+
+          // A handshake join sends its session token with the first state frame
+          if (data.session) {
+            sessionStorage.setItem(sessionKey, data.session);
+            joinPending.current = false;
+          }
           
           onMessage(data);
         } catch (err) {
@@ -54,10 +95,11 @@ export const useWebSocket = (roomName, playerName, onMessage) => {
       ws.current.onclose = (event) => {
         console.log('WebSocket closed:', event.code, event.reason);
         setConnectionStatus('disconnected');
-        stopHeartbeat();
-        
-        if (event.code !== 1000) {
-          setTimeout(connectWebSocket, 3000);
+
+        // 4003 means a handshake join was refused; the join_error frame says why
+        if (event.code !== 1000 && event.code !== 4003) {
+          // 4001 is a planned handoff, so the new process is already up
+          setTimeout(connectWebSocket, event.code === 4001 ? 500 : 3000);
         }
       };
 
@@ -71,7 +113,6 @@ export const useWebSocket = (roomName, playerName, onMessage) => {
     connectWebSocket();
 
     return () => {
-      stopHeartbeat();
       if (ws.current && !isClosing.current) {
         try {
           if (ws.current.readyState === WebSocket.OPEN || ws.current.readyState === WebSocket.CONNECTING) {
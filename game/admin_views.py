@@ -0,0 +1,219 @@
+import asyncio
+from functools import wraps
+import json
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from channels.layers import get_channel_layer
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+import logging
+from pathlib import Path
+import time
+from .handoff import drain
+from . import metrics
+from .outbound import queue_stats
+from .profiler import ProfilerBusy, profile
+from .room_manager import room_manager, RoomState
+from .spectators import spectators
+from .tracing import tracer
+from thegang.log_queue import log_stats
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+def admin_only(view):
+    """Allow requests from the local host, or carrying the configured ADMIN_TOKEN"""
+    def allowed(request):
+        token = getattr(settings, 'ADMIN_TOKEN', None)
+        # Prometheus sends credentials as a bearer token
+        return request.META.get('REMOTE_ADDR') in LOCAL_ADDRESSES or bool(token and token in (
+            request.headers.get('X-Admin-Token'), request.headers.get('Authorization', '').removeprefix('Bearer ')))
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not allowed(request):
+                return JsonResponse({'error': 'Forbidden'}, status=403)
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not allowed(request):
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@admin_only
+def cleanup_rooms(request):
+    """GET reports what the expiry scheduler would clean now, POST cleans it"""
+    scheduler = room_manager.expiry
+    if request.method == 'POST':
+        cleaned = scheduler.expire_due()
+        if cleaned:
+            logger.info(f"Admin cleanup removed {len(cleaned)} stale rooms")
+        return JsonResponse({
+            'cleaned': cleaned,
+            'total_rooms': len(room_manager.rooms),
+        })
+    return JsonResponse({
+        'would_clean': scheduler.due(),
+        'recently_cleaned': list(scheduler.history),
+        'scheduled_rooms': len(scheduler.scheduled),
+        'total_rooms': len(room_manager.rooms),
+    })
+
+@require_http_methods(["GET"])
+@admin_only
+def memory_stats(request):
+    """Measured room memory, budget limits and evictions"""
+    return JsonResponse(room_manager.budget.stats())
+
+@require_http_methods(["GET"])
+@admin_only
+def sessions(request):
+    """Resolve ?channel= to its room and player, or list ?player='s connected rooms"""
+    index = room_manager.sessions
+    report = {'connections': len(index)}
+    channel_name = request.GET.get('channel')
+    if channel_name:
+        session = index.lookup(channel_name)
+        report['session'] = {'room': session[0], 'player': session[1]} if session else None
+    player_name = request.GET.get('player')
+    if player_name:
+        report['rooms'] = sorted(index.rooms_for(player_name))
+    return JsonResponse(report)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@admin_only
+async def drain_server(request):
+    """Freeze all rooms and hand them to the process listening on the target socket"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if room_manager.draining:
+        return JsonResponse({'error': 'Already draining'}, status=409)
+    try:
+        report = await drain(data.get('target'))
+    except OSError as e:
+        logger.error(f"Room handoff failed: {e}")
+        return JsonResponse({'error': f'Handoff failed: {e}'}, status=502)
+    return JsonResponse(report)
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@admin_only
+async def traces(request):
+    """GET lists recent traces (?limit=, ?min_ms=), POST sets the sample rate"""
+    if request.method == 'POST':
+        try:
+            sample_rate = float(json.loads(request.body or b'{}')['sample_rate'])
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return JsonResponse({'error': 'sample_rate is required'}, status=400)
+        if not 0 <= sample_rate <= 1:
+            return JsonResponse({'error': 'sample_rate must be between 0 and 1'}, status=400)
+        tracer.sample_rate = sample_rate
+        logger.info(f"Trace sample rate set to {sample_rate}")
+        return JsonResponse(tracer.stats())
+    try:
+        limit = int(request.GET.get('limit', 50))
+        min_ms = float(request.GET.get('min_ms', 0))
+    except ValueError:
+        return JsonResponse({'error': 'limit and min_ms must be numbers'}, status=400)
+    return JsonResponse({**tracer.stats(), 'traces': tracer.traces(limit, min_ms)})
+
+MAX_PROFILE_SECONDS = 120
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@admin_only
+async def profile_server(request):
+    """Sample this process's stacks for a while and save them as folded stacks"""
+    try:
+        data = json.loads(request.body or b'{}')
+        seconds = float(data.get('seconds', 10))
+        interval = float(data.get('interval', 0.005))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'error': 'seconds and interval must be numbers'}, status=400)
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or not 0.001 <= interval <= 1:
+        return JsonResponse({'error': f'seconds must be in (0, {MAX_PROFILE_SECONDS}] and interval in [0.001, 1]'},
+                            status=400)
+    module_prefix = data.get('module') or None
+
+    try:
+        # Sampled from a worker thread so the loop keeps serving the load being profiled
+        result = await asyncio.to_thread(profile, seconds, interval, module_prefix)
+    except ProfilerBusy as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+    folded = result.collapsed()
+    report = result.summary()
+    profile_dir = getattr(settings, 'PROFILE_DIR', None)
+    if profile_dir:
+        path = Path(profile_dir) / time.strftime('profile-%Y%m%d-%H%M%S.folded')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(folded)
+            report['path'] = str(path)
+        except OSError as e:
+            logger.error(f"Failed to save profile: {e}")
+    report['folded'] = folded
+    return JsonResponse(report)
+
+def _live_metrics():
+    """Gauges and totals read from the live process at scrape time"""
+    rooms = {(state.value,): 0 for state in RoomState}
+    for room in list(room_manager.rooms.values()):
+        rooms[(room.state.value,)] += 1
+    lines = metrics.family('thegang_rooms', 'gauge', 'Live rooms by state', rooms, ('state',))
+    lines += metrics.family('process_cpu_seconds_total', 'counter', 'CPU time used by this process',
+                            {(): time.process_time()})
+    lines += metrics.family('thegang_connected_sockets', 'gauge', 'Open WebSocket connections by kind', {
+        ('player',): len(room_manager.sessions),
+        ('spectator',): spectators.count(),
+    }, ('kind',))
+    lines += metrics.family('thegang_outbound_messages_total', 'counter', 'Outbound queue outcomes', {
+        (outcome,): queue_stats[outcome] for outcome in ('sent', 'superseded', 'dropped', 'slow_disconnects')
+    }, ('outcome',))
+    lines += metrics.family('thegang_outbound_bytes_total', 'counter', 'Bytes written to WebSockets',
+                            {(): queue_stats['bytes_sent']})
+    # The budget's running totals; scraping must not measure rooms
+    budget = room_manager.budget
+    lines += metrics.family('thegang_room_memory_bytes', 'gauge', 'Measured bytes held by live rooms',
+                            {(): budget.bytes})
+    lines += metrics.family('thegang_room_memory_rooms', 'gauge', 'Rooms counted in the room memory total',
+                            {(): len(budget.sizes)})
+    lines += metrics.family('thegang_room_budget_limit', 'gauge', 'Room budget limits by resource', {
+        ('bytes',): budget.max_bytes,
+        ('rooms',): budget.max_rooms,
+    }, ('resource',))
+    lines += metrics.family('thegang_room_evictions_total', 'counter', 'Idle rooms evicted to stay within the budget',
+                            {(): budget.evicted})
+    lines += metrics.family('thegang_room_refusals_total', 'counter', 'New rooms refused because the budget was full',
+                            {(): budget.refused})
+    lines += metrics.family('thegang_log_records_total', 'counter', 'Log records by outcome', {
+        (outcome,): count for outcome, count in log_stats.items()
+    }, ('outcome',))
+
+    channels = getattr(get_channel_layer(), 'channels', None)
+    if channels is not None:
+        depths = [queue.qsize() for queue in list(channels.values())]
+        lines += metrics.family('thegang_channel_layer_queued_messages', 'gauge',
+                                'Messages waiting in channel layer queues', {(): sum(depths)})
+        lines += metrics.family('thegang_channel_layer_max_queue_depth', 'gauge',
+                                'Deepest channel layer queue', {(): max(depths, default=0)})
+    return lines
+
+metrics.collectors.append(_live_metrics)
+
+@require_http_methods(["GET"])
+@admin_only
+async def prometheus_metrics(request):
+    """Process metrics in the Prometheus text exposition format"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
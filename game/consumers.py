@@ -1,16 +1,122 @@
+import asyncio
 import json
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from channels.consumer import get_handler_name
+from channels.exceptions import StopConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .liveness import liveness
+from .metrics import BROADCAST_BYTES, BROADCAST_FANOUT, HANDLER_SECONDS
+from .outbound import OutboundQueue, STATE_MESSAGE_TYPES
 from .room_manager import room_manager, RoomState
+from .spectators import spectators
+from .tracing import tracer
+from .watchdog import watchdog
 import logging
 
 logger = logging.getLogger(__name__)
 
-class GameConsumer(AsyncWebsocketConsumer):
+def _group_name(room_name):
+    return f'game_{room_name}'
+
+async def broadcast_to_room(channel_layer, room_name, message_type, room_data=None, target_player=None,
+                            exclude_channel=None):
+    """Encode a message once, record it for replay and send it to the room group"""
+    message = {'type': message_type}
+    if room_data:
+        message['room_data'] = room_data
+    if target_player:
+        message['target_player'] = target_player
+    room = room_manager.get_room(room_name)
+    if room:
+        message['seq'] = room.replay.next_seq()
+    with tracer.span('broadcast', message_type=message_type, target_player=target_player):
+        with tracer.span('json.dumps'):
+            text = json.dumps(message)
+        if room:
+            room.replay.record(message_type, text, target_player)
+        fanout = len(getattr(channel_layer, 'groups', {}).get(_group_name(room_name), ()))
+        BROADCAST_FANOUT.observe(fanout, message_type)
+        BROADCAST_BYTES.observe(len(text) * (1 if target_player else fanout), message_type)
+        # Deliveries hang off the broadcast span, next to the group_send
+        trace = tracer.context(1 if target_player else fanout - (1 if exclude_channel else 0))
+        with tracer.span('group_send', fanout=fanout):
+            await channel_layer.group_send(_group_name(room_name), {
+                'type': message_type,
+                'text': text,
+                'target_player': target_player,
+                'exclude_channel': exclude_channel,
+                'trace': trace,
+            })
+        spectators.publish(room_name)
+
+async def _remove_player_and_notify(room_name, player_name):
+    if room_manager.leave_room(room_name, player_name):
+        logger.info("Released held seat for %s in %s", player_name, room_name)
+        room = room_manager.get_room(room_name)
+        if room:
+            await broadcast_to_room(get_channel_layer(), room_name, 'room_update', room.to_dict())
+
+def _release_held_seat(room_name, player_name):
+    asyncio.ensure_future(_remove_player_and_notify(room_name, player_name))
+
+def _parse_resume(scope):
+    """Extract the session token and last seen sequence number from the query string"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    session = query.get('session', [None])[0]
+    try:
+        last_seq = int(query.get('last_seq', [''])[0])
+    except ValueError:
+        last_seq = None
+    return session, last_seq
+
+def _wants_join(scope):
+    return parse_qs(scope.get('query_string', b'').decode()).get('join', [''])[0] == '1'
+
+def _ack_window(scope):
+    """Unacknowledged frames allowed in flight, for clients that send acks (?ack=1)"""
+    if parse_qs(scope.get('query_string', b'').decode()).get('ack', [''])[0] != '1':
+        return None
+    return getattr(settings, 'OUTBOUND_ACK_WINDOW', 8)
+
+class NoDatabaseMixin:
+    """Skip channels' per-message close_old_connections.
+
+    The stock dispatch and disconnect hop through the single sync thread to
+    recycle database connections. These consumers never touch the
+    database, so the hop only serializes connects and messages.
+    """
+
+    async def dispatch(self, message):
+        handler_name = get_handler_name(message)
+        handler = getattr(self, handler_name, None)
+        if handler:
+            watchdog.track(self, handler_name)
+            await handler(message)
+        else:
+            raise ValueError(f"No handler for message type {message['type']}")
+
+    async def websocket_disconnect(self, message):
+        for group in self.groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await self.disconnect(message['code'])
+        raise StopConsumer()
+
+class GameConsumer(NoDatabaseMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.player_name = self.scope['url_route']['kwargs']['player_name']
-        self.room_group_name = f'game_{self.room_name}'
+        self.room_group_name = _group_name(self.room_name)
+        self.outbound = OutboundQueue(
+            self._send_frame,
+            self._close_slow_consumer,
+            max_depth=getattr(settings, 'OUTBOUND_QUEUE_MAX_DEPTH', 32),
+            max_lag=getattr(settings, 'OUTBOUND_QUEUE_MAX_LAG', 15.0),
+            window=_ack_window(self.scope),
+        )
+        self.refused = False
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -18,17 +124,45 @@ class GameConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
-        logger.info(f"WebSocket connected: {self.player_name} to {self.room_name}")
+        if room_manager.draining:
+            # Rooms are being handed to a new process; come back there
+            await self.server_handoff({'type': 'server_handoff'})
+            return
+        self.outbound.start()
+        room_manager.expiry.start()
+        watchdog.start()
+        logger.info("WebSocket connected: %s to %s", self.player_name, self.room_name)
+
+        if _wants_join(self.scope):
+            await self._join_on_connect()
+            return
 
         # Ensure player is in the room (in case they joined via API before connecting WebSocket)
         room = room_manager.get_room(self.room_name)
         if room and self.player_name not in room.players:
-            if room.state == RoomState.WAITING:
-                room.add_player(self.player_name)
-        
-        # Mark player as connected
-        room_manager.connect_to_room(self.room_name, self.player_name)
+            with room_manager.lock_for(self.room_name):
+                if room.state == RoomState.WAITING:
+                    room.add_player(self.player_name)
         
+        if room and self.player_name in room.players:
+            session, last_seq = _parse_resume(self.scope)
+            token = self._claim_seat(room)
+            if token is None:
+                await self._refuse(f"Player {self.player_name} is already in the room")
+                return
+            # Mark player as connected
+            room_manager.connect_to_room(self.room_name, self.player_name, self.channel_name)
+            self.outbound.put(json.dumps({'type': 'session', 'session': token, 'seq': room.replay.last_seq}))
+
+            # A resuming client only needs what it missed while it was away
+            if session == token and last_seq is not None:
+                missed = room.replay.since(last_seq, self.player_name)
+                if missed is not None:
+                    for entry in missed:
+                        self._forward(entry.message_type, entry.text)
+                    logger.info("Resumed %s in %s from seq %s (%s missed)", self.player_name, self.room_name, last_seq, len(missed))
+                    return
+
         # Send initial room state to this player
         if room:
             if room.state == RoomState.STARTED:
@@ -39,18 +173,85 @@ class GameConsumer(AsyncWebsocketConsumer):
             if room.state != RoomState.STARTED:
                 await self._broadcast_to_room('room_update', room.to_dict())
 
+    def _claim_seat(self, room):
+        """The seat's session token if this connection may take the seat, else None.
+
+        The first connection for a seat is issued its token; after that, only
+        a connection presenting that token (?session=) gets the seat.
+        """
+        session, _ = _parse_resume(self.scope)
+        with room_manager.lock_for(self.room_name):
+            token = room.session_tokens.get(self.player_name)
+            if token is not None and session != token:
+                logger.warning("Refused %s in %s without its session token", self.player_name, self.room_name)
+                return None
+            return room.session_token(self.player_name)
+
+    async def _refuse(self, message):
+        self.refused = True
+        await self.send(text_data=json.dumps({'type': 'join_error', 'message': message}))
+        await self.close(code=4003)
+
+    async def _join_on_connect(self):
+        """Join the room as part of the handshake and send the state as the first frame"""
+        room = room_manager.get_room(self.room_name)
+        if room is None or self.player_name not in room.players:
+            if not self.room_name.isalnum() or not self.player_name.isalnum():
+                success, message = False, 'Room name and player name must be alphanumeric'
+            else:
+                success, message = room_manager.join_room(self.room_name, self.player_name)
+            if not success:
+                await self._refuse(message)
+                return
+            room = room_manager.get_room(self.room_name)
+
+        token = self._claim_seat(room)
+        if token is None:
+            await self._refuse(f"Player {self.player_name} is already in the room")
+            return
+        room_manager.connect_to_room(self.room_name, self.player_name, self.channel_name)
+        with room_manager.lock_for(self.room_name):
+            started = room.state == RoomState.STARTED
+            room_data = room.to_dict(self.player_name) if started else room.to_dict()
+
+        if not started:
+            # Everyone else hears about the new player; this connection gets it below
+            await broadcast_to_room(self.channel_layer, self.room_name, 'room_update', room_data,
+                                    exclude_channel=self.channel_name)
+        message_type = 'game_update' if started else 'room_update'
+        self._forward(message_type, json.dumps({
+            'type': message_type,
+            'room_data': room_data,
+            'session': token,
+            'seq': room.replay.last_seq,
+        }))
+        logger.info("%s joined %s over the WebSocket handshake", self.player_name, self.room_name)
+
     async def disconnect(self, close_code):
+        liveness.unregister(self.channel_name)
+        await self.outbound.stop()
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if room_manager.draining or self.refused:
+            # Seats move with the room and the client resumes in the new
+            # process; a refused connection never held the seat
+            return
+
+        # A reconnect that already replaced this connection keeps the seat
+        room = room_manager.get_room(self.room_name)
+        if room and room_manager.sessions.lookup(self.channel_name) is None and self.player_name in room.player_channels:
+            logger.info("WebSocket disconnected: %s from %s (code: %s, superseded)", self.player_name, self.room_name, close_code)
+            return
 
         # Mark player as disconnected
-        room_manager.disconnect_from_room(self.room_name, self.player_name)
+        room_manager.disconnect_from_room(self.room_name, self.player_name, self.channel_name)
         
         # Handle different disconnect scenarios more aggressively
         room = room_manager.get_room(self.room_name)
         should_remove_player = False
+        seat_held = False
         
         if close_code == 1000:
             # Explicit close - always remove player
@@ -60,8 +261,11 @@ class GameConsumer(AsyncWebsocketConsumer):
             if room and room.state == RoomState.WAITING:
                 should_remove_player = True
         elif room and not room.has_connected_players():
-            # If no other players are connected, remove this player too
-            should_remove_player = True
+            # If no other players are connected, remove this player too once
+            # the reconnect grace period has passed
+            grace = getattr(settings, 'RECONNECT_GRACE_SECONDS', 30)
+            seat_held = room_manager.hold_seat(self.room_name, self.player_name, grace, _release_held_seat)
+            should_remove_player = not seat_held
             
         if should_remove_player:
             success = room_manager.leave_room(self.room_name, self.player_name)
@@ -70,34 +274,54 @@ class GameConsumer(AsyncWebsocketConsumer):
                 if room:
                     await self._broadcast_to_room('room_update', room.to_dict())
 
-        logger.info(f"WebSocket disconnected: {self.player_name} from {self.room_name} (code: {close_code}, removed: {should_remove_player})")
+        logger.info("WebSocket disconnected: %s from %s (code: %s, removed: %s, held: %s)", self.player_name, self.room_name, close_code, should_remove_player, seat_held)
+
+    async def _send_frame(self, text_data):
+        await self.send(text_data=text_data)
+
+    async def _close_slow_consumer(self):
+        logger.warning("Disconnecting slow consumer %s in %s", self.player_name, self.room_name)
+        await self.close(code=4008)
+
+    async def _close_idle(self):
+        logger.info("Closing idle connection for %s in %s", self.player_name, self.room_name)
+        await self.close(code=4000)
 
     async def _send_error(self, message):
-        await self.send(text_data=json.dumps({
+        self.outbound.put(json.dumps({
             'type': 'error',
             'message': message
         }))
 
+    def _forward(self, message_type, text, trace=None):
+        supersede_key = message_type if message_type in STATE_MESSAGE_TYPES else None
+        self.outbound.put(text, supersede_key, tracer.delivery(trace, player=self.player_name))
+
     async def _send_message(self, message_type, room_data=None, target_player=None):
         message = {'type': message_type}
         if room_data:
             message['room_data'] = room_data
         if target_player:
             message['target_player'] = target_player
-        await self.send(text_data=json.dumps(message))
+        room = room_manager.get_room(self.room_name)
+        if room:
+            message['seq'] = room.replay.last_seq
+        self._forward(message_type, json.dumps(message))
 
     async def _broadcast_to_room(self, message_type, room_data=None, target_player=None):
-        message = {'type': message_type}
-        if room_data:
-            message['room_data'] = room_data
-        if target_player:
-            message['target_player'] = target_player
-        await self.channel_layer.group_send(self.room_group_name, message)
+        await broadcast_to_room(self.channel_layer, self.room_name, message_type, room_data, target_player)
 
     async def receive(self, text_data):
+        liveness.touch(self.channel_name)
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
+            if message_type == 'ack':
+                self.outbound.ack(data.get('received'))
+                return
+            if room_manager.draining:
+                await self._send_error('Server is restarting, please wait')
+                return
 
             handlers = {
                 'start_game': self.handle_start_game,
@@ -113,32 +337,50 @@ class GameConsumer(AsyncWebsocketConsumer):
             }
             
             handler = handlers.get(message_type)
+            # Stall and metrics labels only ever name known handlers, never client-chosen strings
+            self.message_type = message_type if handler else 'unknown'
             if handler:
-                await handler()
+                start = time.perf_counter()
+                with tracer.start('receive', message_type=message_type, room=self.room_name, player=self.player_name):
+                    await handler()
+                HANDLER_SECONDS.observe(time.perf_counter() - start, message_type)
         except Exception as e:
             logger.error(f"Error handling message: {e}")
             await self._send_error('Invalid message format')
 
     async def handle_start_game(self):
         room = room_manager.get_room(self.room_name)
-        if room and room.can_start_game():
+        if not room:
+            return
+        with room_manager.lock_for(self.room_name):
+            if not room.can_start_game():
+                return
             room.start_game()
-            for player in room.players:
-                await self._broadcast_to_room('game_started', room.to_dict(player), player)
+            snapshots = self._player_snapshots(room)
+        for player, room_data in snapshots:
+            await self._broadcast_to_room('game_started', room_data, player)
 
     async def handle_end_game(self):
         room = room_manager.get_room(self.room_name)
-        if room and room.state == RoomState.STARTED:
+        if not room:
+            return
+        with room_manager.lock_for(self.room_name):
+            if room.state != RoomState.STARTED:
+                return
             room.end_game()
-            await self._broadcast_to_room('game_ended', room.to_dict())
+            room_data = room.to_dict()
+        await self._broadcast_to_room('game_ended', room_data)
 
     async def handle_restart_game(self):
         room = room_manager.get_room(self.room_name)
-        if room:
-            success = room.restart_game()
-            if success:
-                for player in room.players:
-                    await self._broadcast_to_room('game_started', room.to_dict(player), player)
+        if not room:
+            return
+        with room_manager.lock_for(self.room_name):
+            if not room.restart_game():
+                return
+            snapshots = self._player_snapshots(room)
+        for player, room_data in snapshots:
+            await self._broadcast_to_room('game_started', room_data, player)
 
     async def handle_leave_room(self):
         success = room_manager.leave_room(self.room_name, self.player_name)
@@ -153,7 +395,10 @@ class GameConsumer(AsyncWebsocketConsumer):
         if room and room.poker_game:
             chip_number = data.get('chip_number')
             if chip_number is not None:
-                success = room.poker_game.take_chip_from_public(self.player_name, chip_number)
+                with room_manager.lock_for(self.room_name):
+                    success = room.poker_game.take_chip_from_public(self.player_name, chip_number)
+                    if success:
+                        room.mark_changed()
                 if success:
                     await self.broadcast_game_update(room)
 
@@ -162,26 +407,36 @@ class GameConsumer(AsyncWebsocketConsumer):
         if room and room.poker_game:
             target_player = data.get('target_player')
             if target_player:
-                success = room.poker_game.take_chip_from_player(self.player_name, target_player)
+                with room_manager.lock_for(self.room_name):
+                    success = room.poker_game.take_chip_from_player(self.player_name, target_player)
+                    if success:
+                        room.mark_changed()
                 if success:
                     await self.broadcast_game_update(room)
 
     async def handle_return_chip(self):
         room = room_manager.get_room(self.room_name)
         if room and room.poker_game:
-            success = room.poker_game.return_chip_to_public(self.player_name)
+            with room_manager.lock_for(self.room_name):
+                success = room.poker_game.return_chip_to_public(self.player_name)
+                if success:
+                    room.mark_changed()
             if success:
                 await self.broadcast_game_update(room)
 
     async def handle_advance_round(self):
         room = room_manager.get_room(self.room_name)
         if room and room.poker_game:
-            if room.poker_game.can_advance_round():
-                success = room.poker_game.advance_round()
+            with room_manager.lock_for(self.room_name):
+                success = room.poker_game.can_advance_round() and room.poker_game.advance_round()
                 if success:
-                    await self.broadcast_game_update(room)
+                    room.mark_changed()
+            if success:
+                await self.broadcast_game_update(room)
 
     async def handle_ping(self):
+        # Older clients ping on a timer, so going quiet means they are gone
+        liveness.register(self.channel_name, self._close_idle)
         room_manager.connect_to_room(self.room_name, self.player_name)
         await self._send_message('pong')
 
@@ -189,39 +444,89 @@ class GameConsumer(AsyncWebsocketConsumer):
         """Dev helper: distribute chips to all players"""
         room = room_manager.get_room(self.room_name)
         if room and room.poker_game:
-            current_chip_color = room.poker_game.get_current_chip_color()
-            available_chips = room.poker_game.available_chips.get(current_chip_color, []).copy()
-            players = room.players
-            
-            # Distribute chips to players in order
-            for i, player in enumerate(players):
-                if i < len(available_chips):
-                    chip_number = available_chips[i]
-                    success = room.poker_game.take_chip_from_public(player, chip_number)
-                    if success:
-                        logger.info(f"[DEV] Distributed {current_chip_color.value} chip {chip_number} to {player}")
-                    else:
-                        logger.warning(f"[DEV] Failed to distribute {current_chip_color.value} chip {chip_number} to {player}")
+            with room_manager.lock_for(self.room_name):
+                current_chip_color = room.poker_game.get_current_chip_color()
+                available_chips = room.poker_game.available_chips.get(current_chip_color, []).copy()
+                players = room.players
+                
+                # Distribute chips to players in order
+                for i, player in enumerate(players):
+                    if i < len(available_chips):
+                        chip_number = available_chips[i]
+                        success = room.poker_game.take_chip_from_public(player, chip_number)
+                        if success:
+                            logger.info(f"[DEV] Distributed {current_chip_color.value} chip {chip_number} to {player}")
+                        else:
+                            logger.warning(f"[DEV] Failed to distribute {current_chip_color.value} chip {chip_number} to {player}")
+                room.mark_changed()
             
             await self.broadcast_game_update(room)
 
+    def _player_snapshots(self, room):
+        """Per-player state, taken under the room lock so it is consistent"""
+        with room_manager.lock_for(room.name):
+            return [(player, room.to_dict(player)) for player in room.players]
+
     async def broadcast_game_update(self, room):
-        for player in room.players:
-            await self._broadcast_to_room('game_update', room.to_dict(player), player)
+        for player, room_data in self._player_snapshots(room):
+            await self._broadcast_to_room('game_update', room_data, player)
 
     async def send_room_update(self, room):
         await self._send_message('room_update', room.to_dict(self.player_name))
 
     async def room_update(self, event):
-        await self._send_message(event['type'], event.get('room_data'))
+        if event.get('exclude_channel') != self.channel_name:
+            self._forward(event['type'], event['text'], event.get('trace'))
 
     async def game_update(self, event):
         if event.get('target_player') == self.player_name:
-            await self._send_message(event['type'], event.get('room_data'))
+            self._forward(event['type'], event['text'], event.get('trace'))
 
     async def game_started(self, event):
         if event.get('target_player') == self.player_name:
-            await self._send_message(event['type'], event.get('room_data'))
+            self._forward(event['type'], event['text'], event.get('trace'))
 
     async def game_ended(self, event):
-        await self._send_message(event['type'], event.get('room_data'))
\ No newline at end of file
+        self._forward(event['type'], event['text'], event.get('trace'))
+
+    async def server_handoff(self, event):
+        """Tell the client to reconnect and resume its session elsewhere"""
+        liveness.unregister(self.channel_name)
+        await self.outbound.stop()
+        await self.send(text_data=json.dumps({'type': 'reconnect'}))
+        await self.close(code=4001)
+
+class SpectatorConsumer(NoDatabaseMixin, AsyncWebsocketConsumer):
+    """Read-only view of a room that never joins the players or the room group"""
+
+    async def connect(self):
+        self.room_name = self.scope['url_route']['kwargs']['room_name']
+        self.outbound = OutboundQueue(
+            self._send_frame,
+            self._close_slow_consumer,
+            max_depth=getattr(settings, 'OUTBOUND_QUEUE_MAX_DEPTH', 32),
+            max_lag=getattr(settings, 'OUTBOUND_QUEUE_MAX_LAG', 15.0),
+            window=_ack_window(self.scope),
+        )
+        await self.accept()
+        self.outbound.start()
+        spectators.subscribe(self.room_name, self.outbound)
+        self.outbound.put(spectators.snapshot(self.room_name), 'spectator_update')
+
+    async def disconnect(self, close_code):
+        spectators.unsubscribe(self.room_name, self.outbound)
+        await self.outbound.stop()
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if isinstance(data, dict) and data.get('type') == 'ack':
+            self.outbound.ack(data.get('received'))
+
+    async def _send_frame(self, text_data):
+        await self.send(text_data=text_data)
+
+    async def _close_slow_consumer(self):
+        await self.close(code=4008)
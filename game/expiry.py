@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+if TYPE_CHECKING:
+    from .room_manager import RoomManager
+
+logger = logging.getLogger(__name__)
+
+class ExpiryScheduler:
+    """Deletes stale rooms from a deadline heap instead of scanning every room.
+
+    Each room has at most one heap entry, pushed with the deadline implied
+    by its last_activity. Activity only ever moves a deadline later, so an
+    entry that comes due is re-checked against the live room: if the room
+    has been active (or still has connected players) it is pushed again
+    with its new deadline, otherwise it is deleted. Each expiry costs
+    O(log n) and rooms that are not due are never looked at.
+    """
+
+    def __init__(self, manager: 'RoomManager', idle_timeout: float = 600, max_sleep: float = 30):
+        self.manager = manager
+        self.idle_timeout = idle_timeout
+        self.max_sleep = max_sleep
+        self.heap: List[Tuple[float, str]] = []
+        self.scheduled: Dict[str, float] = {}
+        self.history: Deque[Dict] = deque(maxlen=100)
+        self._task: Optional[asyncio.Task] = None
+        # Rooms can be created from view threads while the loop expires others
+        self._heap_lock = threading.Lock()
+
+    def schedule(self, room_name: str, last_activity: float) -> None:
+        with self._heap_lock:
+            if room_name in self.scheduled:
+                return
+            self._push(room_name, last_activity + self.idle_timeout)
+        self.start()
+
+    def _push(self, room_name: str, deadline: float) -> None:
+        self.scheduled[room_name] = deadline
+        heapq.heappush(self.heap, (deadline, room_name))
+
+    def _is_stale(self, room, now: float) -> bool:
+        return not room.has_connected_players() and now - room.last_activity > self.idle_timeout
+
+    def due(self, now: Optional[float] = None) -> List[Dict]:
+        """Rooms that would be cleaned at now, without changing anything"""
+        now = time.time() if now is None else now
+        report = []
+        with self._heap_lock:
+            pending = list(self.heap)
+        while pending and pending[0][0] <= now:
+            _, room_name = heapq.heappop(pending)
+            room = self.manager.get_room(room_name)
+            if room and self._is_stale(room, now):
+                report.append({'room': room_name, 'idle_seconds': int(now - room.last_activity)})
+        return report
+
+    def expire_due(self, now: Optional[float] = None) -> List[Dict]:
+        """Delete every stale room whose deadline has passed"""
+        now = time.time() if now is None else now
+        cleaned = []
+        while True:
+            with self._heap_lock:
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                _, room_name = heapq.heappop(self.heap)
+                self.scheduled.pop(room_name, None)
+            with self.manager.lock_for(room_name):
+                room = self.manager.get_room(room_name)
+                if room is None:
+                    continue
+                if self._is_stale(room, now):
+                    self.manager.delete_room(room_name)
+                    entry = {'room': room_name, 'idle_seconds': int(now - room.last_activity), 'cleaned_at': now}
+                    cleaned.append(entry)
+                    self.history.append(entry)
+                    logger.info("Cleaned up stale room %s", room_name)
+                else:
+                    # Still in use; come back when it could next go stale
+                    with self._heap_lock:
+                        if room_name not in self.scheduled:
+                            self._push(room_name, max(room.last_activity + self.idle_timeout, now + 1))
+        return cleaned
+
+    def start(self):
+        """Run the expiry task on the current event loop, if there is one"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from a sync view thread; the next call on the loop starts it
+            return
+        if self._task and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self.heap:
+            delay = min(max(self.heap[0][0] - time.time(), 0), self.max_sleep)
+            await asyncio.sleep(delay)
+            self.expire_due()
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+from typing import Callable, Dict, List, Optional
+import logging
+from channels.layers import get_channel_layer
+from .persistence import RECORD_HEADER, OP_PUT, room_store
+from .room_manager import GameRoom, RoomManager, room_manager
+
+logger = logging.getLogger(__name__)
+
+ACK = struct.Struct('>I')
+
+def serialize_rooms(manager: RoomManager) -> Dict[str, bytes]:
+    payloads = {}
+    for room_name in list(manager.rooms):
+        with manager.lock_for(room_name):
+            room = manager.get_room(room_name)
+            if room:
+                # Snapshots are plain builtins; JSON keeps the receiver from running anything it is sent
+                payloads[room_name] = json.dumps(room.to_snapshot()).encode()
+    return payloads
+
+def send_rooms(socket_path: str, payloads: Dict[str, bytes], timeout: float = 30) -> int:
+    """Stream rooms to a receiving process and wait for its acknowledgement"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        for room_name, payload in payloads.items():
+            name = room_name.encode()
+            sock.sendall(RECORD_HEADER.pack(OP_PUT, len(name), len(payload)) + name + payload)
+        sock.shutdown(socket.SHUT_WR)
+        ack = b''
+        while len(ack) < ACK.size:
+            chunk = sock.recv(ACK.size - len(ack))
+            if not chunk:
+                raise ConnectionError("Receiver closed the connection without acknowledging")
+            ack += chunk
+    return ACK.unpack(ack)[0]
+
+def _check_private_dir(socket_path: str) -> None:
+    """Create the socket's directory if needed and make sure no other user can reach it"""
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Handoff socket directory {directory} must be owned by this user with mode 0700")
+
+def receive_rooms(socket_path: str, manager: RoomManager = room_manager,
+                  on_complete: Optional[Callable[[], None]] = None, timeout: float = 300) -> threading.Thread:
+    """Accept one handoff on socket_path in a background thread.
+
+    The socket must live in a directory private to this user. Until the
+    handoff is installed or gives up, the manager refuses to create rooms,
+    so no live room can be replaced by a handed-off one; rooms that exist
+    anyway are kept. on_complete runs before the received rooms are
+    installed, so it can restore older persisted state that the handoff
+    then overrides. It also runs if no handoff arrives within timeout
+    seconds or the handoff fails.
+    """
+    _check_private_dir(socket_path)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(1)
+    server.settimeout(timeout)
+    manager.awaiting_handoff = True
+
+    def run():
+        rooms: List[GameRoom] = []
+        completed = False
+        try:
+            conn, _ = server.accept()
+            with conn:
+                conn.settimeout(timeout)
+                data = b''
+                while True:
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                offset = 0
+                while offset + RECORD_HEADER.size <= len(data):
+                    _, name_len, payload_len = RECORD_HEADER.unpack_from(data, offset)
+                    offset += RECORD_HEADER.size + name_len
+                    if offset + payload_len > len(data):
+                        raise ValueError("Truncated handoff record")
+                    rooms.append(GameRoom.from_snapshot(json.loads(data[offset:offset + payload_len])))
+                    offset += payload_len
+                live = set(manager.rooms)
+                completed = True
+                if on_complete:
+                    on_complete()
+                for room in rooms:
+                    if room.name in live:
+                        logger.warning(f"Room {room.name} already exists here; keeping it over the handed-off one")
+                        continue
+                    manager.add_restored_room(room)
+                    room.mark_changed()
+                conn.sendall(ACK.pack(len(rooms)))
+            logger.info(f"Received {len(rooms)} rooms by handoff")
+        except socket.timeout:
+            logger.warning(f"No handoff arrived on {socket_path} within {timeout}s")
+        except Exception:
+            logger.exception(f"Handoff on {socket_path} failed; starting without handed-off rooms")
+        finally:
+            if not completed and on_complete:
+                on_complete()
+            manager.awaiting_handoff = False
+            server.close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    thread = threading.Thread(target=run, name='room-handoff', daemon=True)
+    thread.start()
+    return thread
+
+async def drain(target: Optional[str] = None, manager: RoomManager = room_manager) -> Dict:
+    """Freeze every room, hand the rooms over, and tell clients to reconnect.
+
+    With a target socket, rooms are streamed to the process listening there
+    and this process stops persisting them, since the new process owns the
+    snapshot store from then on. Without one, the rooms are only flushed to
+    the snapshot store so the next process restores them on startup. If the
+    handoff fails, the rooms are unfrozen and keep running here.
+    """
+    manager.draining = True
+    loop = asyncio.get_running_loop()
+
+    room_names = list(manager.rooms)
+    handed_off = 0
+    if target:
+        try:
+            if room_store:
+                await loop.run_in_executor(None, room_store.flush)
+            payloads = serialize_rooms(manager)
+            handed_off = await loop.run_in_executor(None, send_rooms, target, payloads)
+        except Exception:
+            manager.draining = False
+            raise
+        if room_store:
+            await loop.run_in_executor(None, lambda: room_store.close(persist=False))
+        for room_name in payloads:
+            manager.delete_room(room_name)
+    elif room_store:
+        await loop.run_in_executor(None, room_store.close)
+
+    channel_layer = get_channel_layer()
+    for room_name in room_names:
+        await channel_layer.group_send(f'game_{room_name}', {'type': 'server_handoff'})
+
+    logger.info(f"Drained {len(room_names)} rooms (handed off: {handed_off})")
+    return {'rooms': len(room_names), 'handed_off': handed_off}
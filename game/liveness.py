@@ -0,0 +1,72 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+import logging
+import time
+from django.conf import settings
+from .timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+class LivenessMonitor:
+    """Expires WebSocket connections that have gone quiet for too long.
+
+    Protocol-level ping/pong is handled by the ASGI server (daphne sends a
+    ping after --ping-interval idle seconds and closes the socket after
+    --ping-timeout), but pong frames never reach the application, so a
+    healthy client that has nothing to say looks idle. Only connections from
+    clients that send application pings are registered here: any inbound
+    message refreshes the connection's deadline in a timer wheel, and
+    connections whose deadline passes are handed to their expiry callback.
+    """
+
+    def __init__(self, timeout: float, tick: float = 1.0, slots: int = 1024):
+        self.timeout = timeout
+        self.wheel = TimerWheel(tick, slots)
+        self.callbacks: Dict[Hashable, Callable[[], Awaitable[None]]] = {}
+        self.expired_count = 0
+        self._task: Optional[asyncio.Task] = None
+        self._last_tick = time.monotonic()
+
+    def register(self, key: Hashable, on_expire: Callable[[], Awaitable[None]]) -> None:
+        self.callbacks[key] = on_expire
+        self.wheel.schedule(key, self.timeout)
+        self._ensure_running()
+
+    def touch(self, key: Hashable) -> None:
+        if key in self.callbacks:
+            self.wheel.schedule(key, self.timeout)
+
+    def unregister(self, key: Hashable) -> None:
+        self.callbacks.pop(key, None)
+        self.wheel.cancel(key)
+
+    def expire_due(self, now: Optional[float] = None) -> List[Hashable]:
+        """Advance the wheel to now and fire callbacks for expired connections"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        while now - self._last_tick >= self.wheel.tick:
+            self._last_tick += self.wheel.tick
+            expired.extend(self.wheel.advance())
+        for key in expired:
+            callback = self.callbacks.pop(key, None)
+            if callback:
+                self.expired_count += 1
+                asyncio.ensure_future(callback())
+        if expired:
+            logger.info("Expired %s idle WebSocket connections", len(expired))
+        return expired
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._last_tick = time.monotonic()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        # Stops by itself once the last connection is gone
+        while self.callbacks:
+            await asyncio.sleep(self.wheel.tick)
+            self.expire_due()
+
+liveness = LivenessMonitor(getattr(settings, 'WEBSOCKET_IDLE_TIMEOUT', 600))
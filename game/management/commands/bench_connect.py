@@ -0,0 +1,99 @@
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from game.room_manager import room_manager
+from game.routing import websocket_urlpatterns
+import asyncio
+import gc
+import secrets
+import statistics
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Measure WebSocket connect latency in-process through the auth stack, with and without a '
+            'session cookie, and the lean stack')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=500, help='Connections per stack (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=100, help='Connects in flight at once (default: 100)')
+        parser.add_argument(
+            '--stack',
+            choices=['auth', 'lean', 'both'],
+            default='both',
+            help='Middleware stack to measure (default: both)',
+        )
+        parser.add_argument(
+            '--session-cookie',
+            choices=['on', 'off', 'both'],
+            default='both',
+            help='Send a sessionid cookie, as returning browsers do, so the auth stack queries the session '
+                 'table; off measures the auth stack without touching the database (default: both)',
+        )
+
+    def handle(self, *args, **options):
+        cases = []
+        if options['stack'] in ('auth', 'both'):
+            if 'django.contrib.sessions' not in settings.INSTALLED_APPS:
+                raise CommandError("The auth stack needs the sessions and auth apps; use the default settings")
+            from channels.auth import AuthMiddlewareStack
+            application = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+            if options['session_cookie'] in ('on', 'both'):
+                # Every connect then looks up its session in SQLite, as in a reconnect storm
+                call_command('migrate', verbosity=0, interactive=False)
+                cases.append(('auth+cookie', application, True))
+            if options['session_cookie'] in ('off', 'both'):
+                cases.append(('auth', application, False))
+        if options['stack'] in ('lean', 'both'):
+            cases.append(('lean', URLRouter(websocket_urlpatterns), options['session_cookie'] != 'off'))
+
+        for name, application, session_cookie in cases:
+            latencies, errors, elapsed = asyncio.run(self._bench(
+                application, options['connections'], options['concurrency'], session_cookie))
+            room_manager.rooms.clear()
+            # A fresh channel layer per case, so one case's leftover queues do not slow the next
+            channel_layers.backends.clear()
+            gc.collect()
+            if not latencies:
+                raise CommandError(f"No {name} connects succeeded ({errors} errors)")
+            p50, p90, p99 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 89, 98))
+            self.stdout.write(
+                f"{name:>11}: {len(latencies)} connects in {elapsed:.2f}s "
+                f"({len(latencies) / elapsed:.0f}/s), "
+                f"p50 {p50 * 1000:.1f}ms p90 {p90 * 1000:.1f}ms p99 {p99 * 1000:.1f}ms "
+                f"max {max(latencies) * 1000:.1f}ms, errors {errors}"
+            )
+
+    async def _bench(self, application, connections, concurrency, session_cookie):
+        """Connect, wait for the first frame, then close; returns latencies, errors and wall time"""
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def connect_once(i):
+            nonlocal errors
+            headers = [(b'cookie', f'sessionid={secrets.token_hex(16)}'.encode())] if session_cookie else []
+            async with semaphore:
+                communicator = WebsocketCommunicator(
+                    application, f'/ws/game/bench{i // 4}/p{i}/?join=1', headers=headers)
+                start = time.perf_counter()
+                try:
+                    connected, _ = await communicator.connect(timeout=30)
+                    if not connected:
+                        errors += 1
+                        return
+                    await communicator.receive_from(timeout=30)
+                    latencies.append(time.perf_counter() - start)
+                    await communicator.disconnect(code=1000)
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Benchmark connect {i} failed: {e!r}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connect_once(i) for i in range(connections)))
+        return latencies, errors, time.perf_counter() - start
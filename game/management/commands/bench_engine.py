@@ -0,0 +1,263 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game.poker_engine import ChipColor, PokerGame
+from game.room_manager import GameRoom
+import gc
+import itertools
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'engine_baseline.json'
+
+ROUND_COLORS = (ChipColor.WHITE, ChipColor.YELLOW, ChipColor.ORANGE, ChipColor.RED)
+
+def _players(count):
+    return [f'player{i}' for i in range(count)]
+
+def _give_everyone_a_chip(game):
+    for chip, player in enumerate(game.players, 1):
+        game.take_chip_from_public(player, chip)
+
+def _game_at_flop(count, seed):
+    random.seed(seed)
+    game = PokerGame(_players(count))
+    _give_everyone_a_chip(game)
+    game.advance_round()
+    _give_everyone_a_chip(game)
+    return game
+
+def _room_at_flop(count, seed):
+    random.seed(seed)
+    room = GameRoom('bench')
+    for player in _players(count):
+        room.add_player(player)
+    room.start_game()
+    _give_everyone_a_chip(room.poker_game)
+    room.poker_game.advance_round()
+    _give_everyone_a_chip(room.poker_game)
+    return room
+
+# Each benchmark takes (players, seed) and returns a setup function; the setup
+# builds fresh state and returns the operation to measure, which is called
+# repeatedly on that state. Operations leave the state valid for the next call.
+
+def bench_take_chip_from_public(count, seed):
+    def setup():
+        game = _game_at_flop(count, seed)
+        player = game.players[0]
+        # Chips 1 and 2 back in public; taking one puts the other back
+        game.return_chip_to_public(player)
+        game.return_chip_to_public(game.players[1])
+        chips = itertools.cycle([1, 2])
+        return lambda: game.take_chip_from_public(player, next(chips))
+    return setup
+
+def bench_take_chip_from_player(count, seed):
+    def setup():
+        game = _game_at_flop(count, seed)
+        # Two players steal the same chip back and forth
+        steals = itertools.cycle([game.players[:2], game.players[1::-1]])
+        return lambda: game.take_chip_from_player(*next(steals))
+    return setup
+
+def bench_return_chip_to_public(count, seed):
+    """A return and the take that makes the next return possible, per call"""
+    def setup():
+        game = _game_at_flop(count, seed)
+        player = game.players[0]
+
+        def op():
+            game.return_chip_to_public(player)
+            game.take_chip_from_public(player, 1)
+        return op
+    return setup
+
+def bench_advance_round(count, seed):
+    """One whole game's four advances, the last of which scores, per call"""
+    def setup():
+        random.seed(seed)
+        state = random.getstate()
+        players = _players(count)
+
+        def op():
+            # Every call deals the same game, so every call does the same scoring work
+            random.setstate(state)
+            game = PokerGame(players)
+            for _ in ROUND_COLORS:
+                _give_everyone_a_chip(game)
+                game.advance_round()
+        return op
+    return setup
+
+def bench_game_to_dict(count, seed):
+    def setup():
+        game = _game_at_flop(count, seed)
+        player = game.players[0]
+        return lambda: game.to_dict(player)
+    return setup
+
+def bench_room_to_dict(count, seed):
+    def setup():
+        room = _room_at_flop(count, seed)
+        player = room.players[0]
+        return lambda: room.to_dict(player)
+    return setup
+
+def bench_broadcast(count, seed):
+    """What the server does per action: a snapshot and an encode for every player"""
+    def setup():
+        room = _room_at_flop(count, seed)
+
+        def op():
+            for player in room.players:
+                json.dumps({
+                    'type': 'game_update',
+                    'room_data': room.to_dict(player),
+                    'target_player': player,
+                    'seq': 1,
+                })
+        return op
+    return setup
+
+BENCHMARKS = {
+    'take_chip_from_public': bench_take_chip_from_public,
+    'take_chip_from_player': bench_take_chip_from_player,
+    'return_chip_to_public+retake': bench_return_chip_to_public,
+    'new_game_and_4_advances': bench_advance_round,
+    'PokerGame.to_dict': bench_game_to_dict,
+    'GameRoom.to_dict': bench_room_to_dict,
+    'broadcast_game_update': bench_broadcast,
+}
+
+def _calibrate(min_time):
+    """Ops/sec of a fixed pure-Python workload; results are compared relative to it"""
+    def workload():
+        total = {}
+        for i in range(200):
+            total[i % 7] = total.get(i % 7, 0) + i
+        return sorted(total.items())
+    return _ops_per_sec(workload, min_time)
+
+def _ops_per_sec(op, min_time):
+    # Like timeit, keep collections from landing in some runs and not others
+    gc.collect()
+    gc.disable()
+    try:
+        iterations = 0
+        batch = 16
+        # CPU time rather than wall time, so time stolen by other tenants does not count
+        start = time.process_time()
+        while True:
+            for _ in range(batch):
+                op()
+            iterations += batch
+            elapsed = time.process_time() - start
+            if elapsed >= min_time:
+                return iterations / elapsed
+            batch *= 2
+    finally:
+        gc.enable()
+
+def _allocations(op, samples=200):
+    """Mean peak bytes allocated during one call, and bytes still held after it"""
+    op()
+    tracemalloc.start()
+    try:
+        peak_total = retained_total = 0
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            op()
+            current, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            retained_total += current - before
+    finally:
+        tracemalloc.stop()
+    return peak_total / samples, retained_total / samples
+
+class Command(BaseCommand):
+    help = 'Benchmark engine actions and serialization for 3 to 6 player tables, optionally against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, nargs='+', default=[3, 4, 5, 6],
+                            help='Table sizes to benchmark (default: 3 4 5 6)')
+        parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Run only these benchmarks')
+        parser.add_argument('--seed', type=int, default=1234, help='Seed for the deals (default: 1234)')
+        parser.add_argument('--min-time', type=float, default=0.1,
+                            help='Seconds per timing run (default: 0.1)')
+        parser.add_argument('--repeat', type=int, default=7,
+                            help='Timing runs per benchmark; the median is kept (default: 7)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help=f'Baseline file (default: {DEFAULT_BASELINE.relative_to(settings.BASE_DIR)})')
+        parser.add_argument('--check', action='store_true', help='Fail if any result regressed past the tolerance')
+        # Repeated clean runs on a shared host land within about 25% of the baseline
+        parser.add_argument('--tolerance', type=float, default=0.4,
+                            help='Allowed slowdown or allocation growth as a fraction (default: 0.4)')
+        parser.add_argument('--update-baseline', action='store_true', help='Save these results as the baseline')
+
+    def handle(self, *args, **options):
+        names = options['only'] or list(BENCHMARKS)
+        results = {}
+        self.stdout.write(f"{'benchmark':<36} {'ops/sec':>12} {'relative':>9} {'peak B/op':>10} {'kept B/op':>10}")
+        for name in names:
+            for count in options['players']:
+                setup = BENCHMARKS[name](count, options['seed'])
+                # Each run is paired with a calibration of the same length right before it, so a
+                # slow spell on a shared host affects both; the median pair ignores outliers
+                runs, ratios = [], []
+                for _ in range(options['repeat']):
+                    calibration = _calibrate(options['min_time'])
+                    ops = _ops_per_sec(setup(), options['min_time'])
+                    runs.append(ops)
+                    ratios.append(ops / calibration)
+                median_ops = statistics.median(runs)
+                relative = statistics.median(ratios)
+                peak, retained = _allocations(setup())
+                key = f'{name}/{count}p'
+                results[key] = {
+                    'ops_per_sec': round(median_ops, 1),
+                    'relative': round(relative, 5),
+                    'peak_bytes': round(peak),
+                    'retained_bytes': round(retained),
+                }
+                self.stdout.write(f"{key:<36} {median_ops:>12,.0f} {relative:>9.4f} {peak:>10,.0f} {retained:>10,.0f}")
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'seed': options['seed'],
+                'results': results,
+            }, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f"Saved baseline to {baseline_path}")
+        elif options['check']:
+            self._check(baseline_path, results, options['tolerance'])
+
+    def _check(self, baseline_path, results, tolerance):
+        try:
+            baseline = json.loads(baseline_path.read_text())
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read baseline {baseline_path}: {e}")
+        regressions = []
+        for key, result in results.items():
+            expected = baseline['results'].get(key)
+            if expected is None:
+                continue
+            # Throughput relative to plain Python on the same machine, so baselines travel
+            floor = expected['relative'] * (1 - tolerance)
+            if result['relative'] < floor:
+                regressions.append(f"{key}: {result['relative']:.4f} relative speed, expected at least {floor:.4f}")
+            # Allocation sizes do not depend on the machine; allow some slack for tiny values
+            ceiling = expected['peak_bytes'] * (1 + tolerance) + 256
+            if result['peak_bytes'] > ceiling:
+                regressions.append(f"{key}: {result['peak_bytes']:,} peak bytes/op, expected at most {ceiling:,.0f}")
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(f"No regressions against {baseline_path}")
@@ -0,0 +1,264 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game.memory import deep_sizeof
+from game.poker_engine import DECK_CARDS, ChipColor, GameRound
+from game.room_manager import GameRoom
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'memory_baseline.json'
+
+ROUND_COLORS = (ChipColor.WHITE, ChipColor.YELLOW, ChipColor.ORANGE, ChipColor.RED)
+
+# Rooms measured with deep_sizeof for the per-object breakdown
+SAMPLE_ROOMS = 200
+
+def _give_everyone_a_chip(game):
+    for chip, player in enumerate(game.players, 1):
+        game.take_chip_from_public(player, chip)
+
+def _waiting_room(name, count):
+    room = GameRoom(name)
+    for i in range(count):
+        room.add_player(f'player{i}')
+    return room
+
+def _midgame_room(name, count):
+    """Started, dealt to the flop, with every player holding a chip"""
+    room = _waiting_room(name, count)
+    room.start_game()
+    _give_everyone_a_chip(room.poker_game)
+    room.poker_game.advance_round()
+    _give_everyone_a_chip(room.poker_game)
+    return room
+
+def _scoring_room(name, count):
+    room = _waiting_room(name, count)
+    room.start_game()
+    for _ in ROUND_COLORS:
+        _give_everyone_a_chip(room.poker_game)
+        room.poker_game.advance_round()
+    assert room.poker_game.current_round == GameRound.SCORING
+    return room
+
+STATES = {
+    'waiting': _waiting_room,
+    'mid-game': _midgame_room,
+    'scoring': _scoring_room,
+}
+
+def _fill_replay(room):
+    """Give the room's replay buffer every state message the server would keep for it"""
+    def record(message_type, room_data, target_player=None):
+        room.replay.record(message_type, json.dumps({
+            'type': message_type,
+            'room_data': room_data,
+            'target_player': target_player,
+            'seq': room.replay.next_seq(),
+        }), target_player)
+
+    for message_type in ('room_update', 'game_ended'):
+        record(message_type, room.to_dict())
+    for player in room.players:
+        for message_type in ('game_started', 'game_update'):
+            record(message_type, room.to_dict(player), player)
+
+def _card_bytes():
+    """Bytes of one Card instance and its attributes (the suit enum is shared)"""
+    card = DECK_CARDS[0]
+    return sys.getsizeof(card) + deep_sizeof(vars(card), set())
+
+def _breakdown(rooms):
+    """Mean deep_sizeof bytes per GameRoom, PokerGame and scoring_results over a sample"""
+    sample = rooms[:SAMPLE_ROOMS]
+    games = [room.poker_game for room in sample if room.poker_game]
+    scorings = [game.scoring_results for game in games if game.scoring_results]
+
+    def mean(sizes):
+        sizes = list(sizes)
+        return round(sum(sizes) / len(sizes)) if sizes else 0
+
+    return {
+        'GameRoom': mean(deep_sizeof(room) for room in sample),
+        'PokerGame': mean(deep_sizeof(game) for game in games),
+        'scoring_results': mean(deep_sizeof(scoring) for scoring in scorings),
+    }
+
+def _top_sites(snapshot, rooms, limit):
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.statistics('lineno')
+    base = str(settings.BASE_DIR) + '/'
+    sites = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        sites.append({
+            'site': f'{frame.filename.removeprefix(base)}:{frame.lineno}',
+            'bytes_per_room': stat.size / rooms,
+            'blocks_per_room': stat.count / rooms,
+        })
+    return sites
+
+def _available_bytes():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def measure(state, rooms, players, seed, top=0):
+    """Build ``rooms`` rooms in ``state`` under tracemalloc and account for their memory.
+
+    Allocation sites need a snapshot, which copies every trace into Python
+    objects, so they are only collected when ``top`` is set; keep that to
+    the smaller runs.
+    """
+    build = STATES[state]
+    random.seed(seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        built = [build(f'bench{i}', players) for i in range(rooms)]
+        elapsed = time.perf_counter() - start
+        traced = tracemalloc.get_traced_memory()[0]
+        overhead = tracemalloc.get_tracemalloc_memory()
+        snapshot = tracemalloc.take_snapshot() if top else None
+    finally:
+        tracemalloc.stop()
+    result = {
+        'bytes_per_room': round(traced / rooms),
+        'build_seconds': elapsed,
+        # With tracemalloc's own bookkeeping; only used to size the next run
+        'traced_per_room': (traced + overhead) / rooms,
+        'sites': _top_sites(snapshot, rooms, top) if snapshot else [],
+        **_breakdown(built),
+    }
+    del snapshot
+    _fill_replay(built[0])
+    result['replay_buffer'] = deep_sizeof(built[0].replay)
+    del built
+    gc.collect()
+    return result
+
+class Command(BaseCommand):
+    help = 'Measure memory per room in the waiting, mid-game and scoring states, optionally against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Room counts to build for each state (default: 1000 10000 100000)')
+        parser.add_argument('--states', nargs='+', choices=list(STATES), default=list(STATES),
+                            help='Room states to measure (default: all)')
+        parser.add_argument('--players', type=int, default=4, choices=range(3, 7),
+                            help='Players per room, 3 to 6 (default: 4)')
+        parser.add_argument('--seed', type=int, default=1234, help='Seed for the deals (default: 1234)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Allocation sites to list, from the smallest run of each state (default: 10)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help=f'Baseline file (default: {DEFAULT_BASELINE.relative_to(settings.BASE_DIR)})')
+        parser.add_argument('--check', action='store_true', help='Fail if any per-room size grew past the tolerance')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed growth as a fraction (default: 0.1)')
+        parser.add_argument('--update-baseline', action='store_true', help='Save these results as the baseline')
+
+    def handle(self, *args, **options):
+        players = options['players']
+        results = {}
+        self.stdout.write(f"Card: {_card_bytes()} B each; the {len(DECK_CARDS)} cards are shared by every room")
+        self.stdout.write("B/room is what tracemalloc saw the rooms allocate; the per-object columns are "
+                          "deep_sizeof bytes, as the room budget counts them, and replay is a full replay buffer")
+        self.stdout.write(
+            f"{'state':<10} {'rooms':>8} {'B/room':>8} {'GameRoom':>9} {'PokerGame':>10} "
+            f"{'scoring':>8} {'replay':>8} {'rooms/GiB':>10} {'build s':>8}"
+        )
+        smallest = min(options['rooms'])
+        for state in options['states']:
+            sites = []
+            traced_per_room = None
+            for rooms in sorted(options['rooms']):
+                # Allocator fragmentation and tracemalloc resizing its trace table come on top;
+                # 100,000 scoring rooms needed over 2x their traced memory
+                needed = traced_per_room and traced_per_room * rooms * 2.5
+                available = _available_bytes()
+                if needed and available and needed > available:
+                    self.stdout.write(f"{state:<10} {rooms:>8,} skipped: needs about {needed / 2 ** 30:.1f} GiB "
+                                      f"under tracemalloc, {available / 2 ** 30:.1f} GiB available")
+                    continue
+                result = measure(state, rooms, players, options['seed'], options['top'] if rooms == smallest else 0)
+                sites = sites or result['sites']
+                traced_per_room = max(traced_per_room or 0, result['traced_per_room'])
+                per_room = result['bytes_per_room']
+                self.stdout.write(
+                    f"{state:<10} {rooms:>8,} {per_room:>8,} {result['GameRoom']:>9,} {result['PokerGame']:>10,} "
+                    f"{result['scoring_results']:>8,} {result['replay_buffer']:>8,} "
+                    f"{2 ** 30 // per_room:>10,} {result['build_seconds']:>8.2f}"
+                )
+                # Per-room sizes do not depend on the count; the largest run is kept
+                results[f'{state}/{players}p'] = {
+                    'bytes_per_room': per_room,
+                    'GameRoom': result['GameRoom'],
+                    'PokerGame': result['PokerGame'],
+                    'scoring_results': result['scoring_results'],
+                    'replay_buffer': result['replay_buffer'],
+                }
+            self.stdout.write(f"  top allocation sites, {state} ({smallest:,} rooms):")
+            for site in sites:
+                self.stdout.write(
+                    f"  {site['bytes_per_room']:>10,.1f} B/room {site['blocks_per_room']:>6.2f} blocks  {site['site']}"
+                )
+
+        self._capacity(results)
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'seed': options['seed'],
+                'results': results,
+            }, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f"Saved baseline to {baseline_path}")
+        elif options['check']:
+            self._check(baseline_path, results, options['tolerance'])
+
+    def _capacity(self, results):
+        """Tables per host, from the heaviest state with a full replay buffer per room"""
+        if not results:
+            return
+        key, worst = max(results.items(), key=lambda item: item[1]['bytes_per_room'] + item[1]['replay_buffer'])
+        per_room = worst['bytes_per_room'] + worst['replay_buffer']
+        budget = getattr(settings, 'ROOM_BUDGET_MAX_BYTES', 256 * 1024 * 1024)
+        max_rooms = getattr(settings, 'ROOM_BUDGET_MAX_ROOMS', 5000)
+        self.stdout.write(
+            f"Worst case is {key} at {per_room:,} B/room with a full replay buffer: "
+            f"{2 ** 30 // per_room:,} rooms per GiB; ROOM_BUDGET_MAX_BYTES ({budget:,}) admits "
+            f"about {budget // (worst['GameRoom'] + worst['replay_buffer']):,} (ROOM_BUDGET_MAX_ROOMS is {max_rooms:,})"
+        )
+
+    def _check(self, baseline_path, results, tolerance):
+        try:
+            baseline = json.loads(baseline_path.read_text())
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read baseline {baseline_path}: {e}")
+        regressions = []
+        for key, result in results.items():
+            expected = baseline['results'].get(key)
+            if expected is None:
+                continue
+            for measure_name in ('bytes_per_room', 'GameRoom', 'PokerGame', 'scoring_results', 'replay_buffer'):
+                # Sizes are deterministic for a seed; the slack covers allocator and Python version noise
+                ceiling = expected[measure_name] * (1 + tolerance) + 64
+                if result[measure_name] > ceiling:
+                    regressions.append(f"{key}: {measure_name} is {result[measure_name]:,} B per room, "
+                                       f"expected at most {ceiling:,.0f}")
+        if regressions:
+            raise CommandError("Memory regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(f"No memory regressions against {baseline_path}")
@@ -1,11 +1,14 @@
-from django.core.management.base import BaseCommand
-from game.room_manager import room_manager
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import json
+import urllib.error
+import urllib.request
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Clean up stale game rooms with no connected players'
+    help = 'Clean up stale game rooms on the running server via its admin endpoint'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -13,35 +16,42 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be cleaned up without actually doing it',
         )
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Base URL of the running server (default: http://127.0.0.1:8000)',
+        )
 
     def handle(self, *args, **options):
+        # Rooms live in the server process, so this command has to ask it
+        url = options['url'].rstrip('/') + '/api/api/admin/cleanup/'
+        request = urllib.request.Request(url, method='GET' if options['dry_run'] else 'POST')
+        token = getattr(settings, 'ADMIN_TOKEN', None)
+        if token:
+            request.add_header('X-Admin-Token', token)
+
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                report = json.load(response)
+        except (urllib.error.URLError, ValueError) as e:
+            raise CommandError(f"Could not reach the server at {url}: {e}")
+
         if options['dry_run']:
             self.stdout.write("DRY RUN: No rooms will actually be deleted")
-            
-        rooms_before = len(room_manager.rooms)
-        self.stdout.write(f"Found {rooms_before} total rooms before cleanup")
-        
-        if options['dry_run']:
-            # Show what would be cleaned up
-            rooms_to_clean = 0
-            current_time = __import__('time').time()
-            
-            for room_name, room in room_manager.rooms.items():
-                if (not room.has_connected_players() and 
-                    current_time - room.last_activity > 600):  # 10 minutes
-                    rooms_to_clean += 1
-                    self.stdout.write(
-                        f"WOULD CLEAN: {room_name} "
-                        f"(inactive for {int((current_time - room.last_activity) / 60)} minutes)"
-                    )
-            
-            self.stdout.write(f"Would clean up {rooms_to_clean} stale rooms")
+            self.stdout.write(f"Found {report['total_rooms']} total rooms")
+            for entry in report['would_clean']:
+                self.stdout.write(
+                    f"WOULD CLEAN: {entry['room']} "
+                    f"(inactive for {entry['idle_seconds'] // 60} minutes)"
+                )
+            self.stdout.write(f"Would clean up {len(report['would_clean'])} stale rooms")
+            for entry in report['recently_cleaned']:
+                self.stdout.write(f"RECENTLY CLEANED: {entry['room']}")
         else:
-            cleaned_count = room_manager.cleanup_stale_rooms()
-            self.stdout.write(f"Cleaned up {cleaned_count} stale rooms")
-            
-        rooms_after = len(room_manager.rooms)
-        self.stdout.write(f"Found {rooms_after} total rooms after cleanup")
-        
-        if not options['dry_run'] and cleaned_count > 0:
-            logger.info(f"Cleanup command removed {cleaned_count} stale rooms")
\ No newline at end of file
+            cleaned = report['cleaned']
+            for entry in cleaned:
+                self.stdout.write(f"CLEANED: {entry['room']}")
+            self.stdout.write(f"Cleaned up {len(cleaned)} stale rooms")
+            self.stdout.write(f"Found {report['total_rooms']} total rooms after cleanup")
+            if cleaned:
+                logger.info(f"Cleanup command removed {len(cleaned)} stale rooms")
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import json
+import urllib.error
+import urllib.request
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Drain the running server, handing its rooms to a new process or to the snapshot store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            default=None,
+            help='Handoff socket of the new process (its THEGANG_HANDOFF_SOCKET); '
+                 'without it rooms are only flushed for the next process to restore',
+        )
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Base URL of the running server (default: http://127.0.0.1:8000)',
+        )
+
+    def handle(self, *args, **options):
+        url = options['url'].rstrip('/') + '/api/api/admin/drain/'
+        body = json.dumps({'target': options['target']}).encode()
+        request = urllib.request.Request(url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        token = getattr(settings, 'ADMIN_TOKEN', None)
+        if token:
+            request.add_header('X-Admin-Token', token)
+
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                report = json.load(response)
+        except urllib.error.HTTPError as e:
+            raise CommandError(f"Drain failed: {json.load(e).get('error', e)}")
+        except (urllib.error.URLError, ValueError) as e:
+            raise CommandError(f"Could not reach the server at {url}: {e}")
+
+        if options['target']:
+            self.stdout.write(f"Handed {report['handed_off']} of {report['rooms']} rooms to {options['target']}")
+        else:
+            self.stdout.write(f"Saved {report['rooms']} rooms for the next process")
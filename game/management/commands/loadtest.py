@@ -0,0 +1,304 @@
+from django.core.management.base import BaseCommand, CommandError
+from urllib.parse import urlsplit
+import asyncio
+import base64
+import json
+import os
+import re
+import resource
+import secrets
+import statistics
+import struct
+import time
+import urllib.error
+import urllib.request
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_PREFIXES = tuple(f'{{"type": "{message_type}"'.encode() for message_type in
+                       ('game_update', 'game_started', 'room_update', 'game_ended'))
+
+class ConnectionClosed(Exception):
+    pass
+
+class WebSocketClient:
+    """Just enough of an RFC 6455 client to drive the game protocol"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    @classmethod
+    async def connect(cls, host: str, port: int, path: str) -> 'WebSocketClient':
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {host}:{port}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n'
+            f'Origin: http://{host}:{port}\r\n\r\n'
+        ).encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        if b' 101 ' not in head.split(b'\r\n', 1)[0]:
+            writer.close()
+            raise ConnectionClosed(head.split(b'\r\n', 1)[0].decode(errors='replace'))
+        return cls(reader, writer)
+
+    def _write_frame(self, opcode: int, payload: bytes) -> None:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        masked = (int.from_bytes(payload, 'big') ^ int.from_bytes((mask * (length // 4 + 1))[:length], 'big'))
+        self.writer.write(header + mask + masked.to_bytes(length, 'big'))
+        self.bytes_sent += len(header) + 4 + length
+
+    def send_nowait(self, data: dict) -> None:
+        self._write_frame(0x1, json.dumps(data).encode())
+
+    async def send(self, data: dict) -> None:
+        self.send_nowait(data)
+        await self.writer.drain()
+
+    async def recv(self) -> bytes:
+        """Next complete text message, as UTF-8 bytes"""
+        message = b''
+        while True:
+            first, second = await self.reader.readexactly(2)
+            length = second & 0x7f
+            if length == 126:
+                length, = struct.unpack('!H', await self.reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            self.bytes_received += length
+            opcode = first & 0x0f
+            if opcode == 0x8:
+                raise ConnectionClosed(struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else None)
+            if opcode == 0x9:
+                self._write_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                message += payload
+                if first & 0x80:
+                    return message
+
+    async def close(self, code: int = 1000) -> None:
+        try:
+            self._write_frame(0x8, struct.pack('!H', code))
+            await self.writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass
+        self.writer.close()
+
+class Bot:
+    """One synthetic player; a reader task queues the state frames it receives"""
+
+    def __init__(self, client: WebSocketClient, name: str):
+        self.client = client
+        self.name = name
+        self.updates = asyncio.Queue()
+        self.errors = []
+        self.received = 0
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                message = await self.client.recv()
+                # Acknowledge like the browser client does, so the server's flow control is exercised
+                self.received += 1
+                self.client.send_nowait({'type': 'ack', 'received': self.received})
+                if message.startswith(STATE_PREFIXES):
+                    self.updates.put_nowait(time.perf_counter())
+                elif message.startswith(b'{"type": "error"') or message.startswith(b'{"type": "join_error"'):
+                    self.errors.append(message.decode())
+        except (ConnectionClosed, asyncio.IncompleteReadError, ConnectionError) as e:
+            self.updates.put_nowait(e)
+
+    async def next_update(self, timeout: float) -> float:
+        received = await asyncio.wait_for(self.updates.get(), timeout)
+        if isinstance(received, Exception):
+            raise ConnectionClosed(f'{self.name}: connection closed ({received!r})')
+        return received
+
+    async def close(self):
+        await self.client.close()
+        self._reader.cancel()
+
+class Stats:
+    def __init__(self):
+        self.actions = 0
+        self.games = 0
+        self.tables_done = 0
+        self.tables_failed = 0
+        self.actor_latencies = []
+        self.fanout_latencies = []
+        self.failures = []
+
+def _percentiles(values):
+    if len(values) < 2:
+        return (values[0],) * 3 if values else (0.0,) * 3
+    quantiles = statistics.quantiles(values, n=100)
+    return quantiles[49], quantiles[94], quantiles[98]
+
+def _server_cpu_seconds(metrics_url):
+    """process_cpu_seconds_total from the server's /metrics, or None if unavailable"""
+    if not metrics_url:
+        return None
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=5) as response:
+            text = response.read().decode()
+    except (urllib.error.URLError, OSError) as e:
+        logger.warning(f"Could not read {metrics_url}: {e}")
+        return None
+    match = re.search(r'^process_cpu_seconds_total (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+class Command(BaseCommand):
+    help = 'Play complete games with synthetic WebSocket clients against a running server and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of the running server (default: http://127.0.0.1:8000)')
+        parser.add_argument('--tables', type=int, default=250, help='Tables played at once (default: 250)')
+        parser.add_argument('--players', type=int, default=4, choices=range(3, 7),
+                            help='Players per table, 3 to 6 (default: 4)')
+        parser.add_argument('--games', type=int, default=1, help='Games each table plays (default: 1)')
+        parser.add_argument('--ramp', type=float, default=5.0,
+                            help='Seconds over which table starts are spread (default: 5)')
+        parser.add_argument('--think', type=float, default=0.0,
+                            help='Seconds each table waits between actions (default: 0, as fast as possible)')
+        parser.add_argument('--connect-concurrency', type=int, default=200,
+                            help='WebSocket handshakes in flight at once (default: 200)')
+        parser.add_argument('--timeout', type=float, default=30.0,
+                            help='Seconds to wait for any update before failing a table (default: 30)')
+        parser.add_argument('--metrics-url', default=None,
+                            help='Where to read the server CPU from (default: <url>/metrics; "" to skip)')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'ws') or not url.hostname:
+            raise CommandError("--url must look like http://host:port")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.options = options
+        metrics_url = options['metrics_url']
+        if metrics_url is None:
+            metrics_url = f'http://{self.host}:{self.port}/metrics'
+
+        clients = options['tables'] * options['players']
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < clients + 100:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, clients + 100), hard))
+
+        cpu_before = _server_cpu_seconds(metrics_url)
+        client_cpu_before = time.process_time()
+        start = time.perf_counter()
+        stats, bytes_received, bytes_sent = asyncio.run(self._run())
+        elapsed = time.perf_counter() - start
+        client_cpu = time.process_time() - client_cpu_before
+        cpu_after = _server_cpu_seconds(metrics_url)
+
+        if not stats.actions:
+            raise CommandError(f"No actions completed: {stats.failures[:3]}")
+        self.stdout.write(
+            f"tables: {stats.tables_done} completed, {stats.tables_failed} failed "
+            f"({clients} clients, {options['players']} players each)"
+        )
+        self.stdout.write(
+            f"actions: {stats.actions} in {elapsed:.2f}s ({stats.actions / elapsed:.0f}/s), "
+            f"games: {stats.games}"
+        )
+        for label, latencies in (('actor', stats.actor_latencies), ('all players', stats.fanout_latencies)):
+            p50, p95, p99 = _percentiles(latencies)
+            self.stdout.write(
+                f"action-to-update ({label}): p50 {p50 * 1000:.1f}ms p95 {p95 * 1000:.1f}ms "
+                f"p99 {p99 * 1000:.1f}ms max {max(latencies) * 1000:.1f}ms"
+            )
+        self.stdout.write(
+            f"bytes per action: {bytes_received / stats.actions:.0f} received by all clients, "
+            f"{bytes_sent / stats.actions:.0f} sent"
+        )
+        if cpu_before is not None and cpu_after is not None:
+            server_cpu = cpu_after - cpu_before
+            self.stdout.write(f"server CPU: {server_cpu:.2f}s ({server_cpu / elapsed:.0%} of one core), "
+                              f"{server_cpu / stats.actions * 1e6:.0f}us per action")
+        else:
+            self.stdout.write("server CPU: unavailable (no process_cpu_seconds_total at the metrics URL)")
+        self.stdout.write(f"load generator CPU: {client_cpu:.2f}s ({client_cpu / elapsed:.0%} of one core)")
+        for failure in stats.failures[:5]:
+            self.stdout.write(f"failed table: {failure}")
+
+    async def _run(self):
+        stats = Stats()
+        connect_slots = asyncio.Semaphore(self.options['connect_concurrency'])
+        run_id = secrets.token_hex(3)
+        tables = self.options['tables']
+        bots_by_table = [[] for _ in range(tables)]
+
+        async def play(index):
+            await asyncio.sleep(self.options['ramp'] * index / tables)
+            try:
+                await self._play_table(f'load{run_id}t{index}', bots_by_table[index], connect_slots, stats)
+                stats.tables_done += 1
+            except (ConnectionClosed, asyncio.TimeoutError, OSError) as e:
+                stats.tables_failed += 1
+                stats.failures.append(f'table {index}: {e!r}')
+            finally:
+                for bot in bots_by_table[index]:
+                    await bot.close()
+
+        await asyncio.gather(*(play(i) for i in range(tables)))
+        bots = [bot for table in bots_by_table for bot in table]
+        return (stats, sum(bot.client.bytes_received for bot in bots),
+                sum(bot.client.bytes_sent for bot in bots))
+
+    async def _act(self, bots, actor, message, stats):
+        """Send one action and wait until every player has the resulting update"""
+        timeout = self.options['timeout']
+        sent_at = time.perf_counter()
+        await actor.client.send(message)
+        arrivals = [await bot.next_update(timeout) for bot in bots]
+        stats.actions += 1
+        stats.actor_latencies.append(arrivals[bots.index(actor)] - sent_at)
+        stats.fanout_latencies.append(max(arrivals) - sent_at)
+        if actor.errors:
+            raise ConnectionClosed(f'{actor.name}: {actor.errors[0]}')
+        if self.options['think']:
+            await asyncio.sleep(self.options['think'])
+
+    async def _play_table(self, room, bots, connect_slots, stats):
+        for seat in range(self.options['players']):
+            name = f'p{seat}'
+            async with connect_slots:
+                client = await asyncio.wait_for(
+                    WebSocketClient.connect(self.host, self.port, f'/ws/game/{room}/{name}/?join=1&ack=1'),
+                    self.options['timeout'])
+            bots.append(Bot(client, name))
+            # The joiner's first frame, and the room_update everyone else gets
+            for bot in bots:
+                await bot.next_update(self.options['timeout'])
+
+        first, second = bots[0], bots[1]
+        for game in range(self.options['games']):
+            await self._act(bots, first, {'type': 'start_game' if game == 0 else 'restart_game'}, stats)
+            # Every round: everyone takes a chip, one steal, the robbed player takes the
+            # chip that was put back, then the round is advanced (the river one scores)
+            for _ in range(4):
+                for seat, bot in enumerate(bots):
+                    await self._act(bots, bot, {'type': 'take_chip_public', 'chip_number': seat + 1}, stats)
+                await self._act(bots, first, {'type': 'take_chip_player', 'target_player': second.name}, stats)
+                await self._act(bots, second, {'type': 'take_chip_public', 'chip_number': 1}, stats)
+                await self._act(bots, first, {'type': 'advance_round'}, stats)
+            stats.games += 1
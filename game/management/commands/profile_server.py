@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import json
+import urllib.error
+import urllib.request
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Profile the running server for a while and save flamegraph-ready folded stacks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10, help='How long to sample (default: 10)')
+        parser.add_argument('--interval', type=float, default=0.005,
+                            help='Seconds between samples (default: 0.005)')
+        parser.add_argument('--module', default=None,
+                            help="Keep only frames from this module and its submodules, e.g. 'game'")
+        parser.add_argument('--output', default=None,
+                            help='Write the folded stacks here too (the server also saves them in PROFILE_DIR)')
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Base URL of the running server (default: http://127.0.0.1:8000)',
+        )
+
+    def handle(self, *args, **options):
+        url = options['url'].rstrip('/') + '/api/api/admin/profile/'
+        body = json.dumps({
+            'seconds': options['seconds'],
+            'interval': options['interval'],
+            'module': options['module'],
+        }).encode()
+        request = urllib.request.Request(url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        token = getattr(settings, 'ADMIN_TOKEN', None)
+        if token:
+            request.add_header('X-Admin-Token', token)
+
+        try:
+            with urllib.request.urlopen(request, timeout=options['seconds'] + 30) as response:
+                report = json.load(response)
+        except urllib.error.HTTPError as e:
+            raise CommandError(f"Profiling failed: {json.load(e).get('error', e)}")
+        except (urllib.error.URLError, ValueError) as e:
+            raise CommandError(f"Could not reach the server at {url}: {e}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report['folded'])
+        self.stdout.write(
+            f"{report['samples']} samples over {report['seconds']:.1f}s, "
+            f"{report['distinct_stacks']} distinct stacks ({report['filtered_out']} samples filtered out)"
+        )
+        for entry in report['top']:
+            self.stdout.write(f"{entry['samples']:>8}  {entry['frame']}")
+        for path in filter(None, (report.get('path'), options['output'])):
+            self.stdout.write(f"Saved {path}; render it with flamegraph.pl or speedscope")
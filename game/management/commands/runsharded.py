@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.sharding import ShardRouter
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Run N daphne workers behind a room-affinity router, one room per worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of daphne worker processes (default: number of CPUs)',
+        )
+        parser.add_argument('--bind', default='0.0.0.0', help='Address the router listens on')
+        parser.add_argument('--port', type=int, default=8000, help='Port the router listens on')
+        parser.add_argument(
+            '--socket-dir',
+            default=None,
+            help='Directory for the worker unix sockets (default: a temporary directory)',
+        )
+
+    def handle(self, *args, **options):
+        socket_dir = options['socket_dir'] or tempfile.mkdtemp(prefix='thegang-')
+        os.makedirs(socket_dir, exist_ok=True)
+        socket_paths = [os.path.join(socket_dir, f'worker-{i}.sock') for i in range(options['workers'])]
+
+        workers = []
+        for i, socket_path in enumerate(socket_paths):
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            env = dict(os.environ, THEGANG_SHARD=f"{i}/{options['workers']}")
+            workers.append(subprocess.Popen([
+                sys.executable, '-m', 'daphne',
+                '-u', socket_path,
+                '--proxy-headers',
+                '--ping-interval', '20',
+                '--ping-timeout', '30',
+                'thegang.asgi:application',
+            ], env=env))
+            self.stdout.write(f"Started worker {i} (pid {workers[-1].pid}) on {socket_path}")
+
+        try:
+            asyncio.run(self._serve(workers, socket_paths, options['bind'], options['port']))
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.wait()
+            self.stdout.write("Stopped all workers")
+
+    async def _serve(self, workers, socket_paths, host, port):
+        for worker, socket_path in zip(workers, socket_paths):
+            while not os.path.exists(socket_path):
+                if worker.poll() is not None:
+                    raise CommandError(f"Worker for {socket_path} exited with code {worker.returncode}")
+                await asyncio.sleep(0.1)
+
+        router = ShardRouter(socket_paths)
+        server = await router.serve(host, port)
+        self.stdout.write(f"Routing {host}:{port} to {len(socket_paths)} workers")
+        self.stdout.write(f"Metrics and admin requests take ?worker=0 to ?worker={len(socket_paths) - 1}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        async with server:
+            await stop.wait()
@@ -0,0 +1,177 @@
+import sys
+from collections import deque
+from enum import Enum
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Set
+import logging
+import threading
+import time
+from .poker_engine import CARD_DICTS, DECK_CARDS
+
+if TYPE_CHECKING:
+    from .room_manager import GameRoom, RoomManager
+
+logger = logging.getLogger(__name__)
+
+CONTAINERS = (list, tuple, set, frozenset, deque)
+SCALARS = (str, bytes, int, float, bool, type(None))
+
+# Objects every room points at but none of them owns
+SHARED_IDS = {id(card) for card in DECK_CARDS} | {id(card_dict) for card_dict in CARD_DICTS.values()}
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """Bytes held by obj and everything it owns.
+
+    Follows builtin containers and instances of this package's classes.
+    Shared card tables, enum members and runtime handles (timers, locks) are
+    not counted, since dropping the room would not free them.
+    """
+    if seen is None:
+        seen = set(SHARED_IDS)
+    if id(obj) in seen or isinstance(obj, Enum):
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, SCALARS):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    if isinstance(obj, CONTAINERS):
+        return sys.getsizeof(obj) + sum(deep_sizeof(item, seen) for item in obj)
+    if type(obj).__module__.startswith('game.'):
+        size = sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            size += deep_sizeof(vars(obj), seen)
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+        return size
+    return 0
+
+class RoomBudget:
+    """Per-room memory accounting and a process-wide room/memory budget.
+
+    The owning manager reports its rooms' changes and deletions to
+    on_room_change, which only notes the room name; the next check measures just those rooms with
+    deep_sizeof and adjusts a running total, so checking the budget does not
+    walk every room. When creating a room would exceed max_rooms or
+    max_bytes, the least recently active rooms with nobody connected are
+    evicted first. If that frees nothing, creation is refused, and further
+    attempts are refused without scanning again for retry_interval seconds.
+    """
+
+    def __init__(self, manager: 'RoomManager', max_rooms: int = 5000,
+                 max_bytes: int = 256 * 1024 * 1024, retry_interval: float = 1.0):
+        self.manager = manager
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self.retry_interval = retry_interval
+        self.sizes: Dict[str, int] = {}
+        self.bytes = 0
+        self.evicted = 0
+        self.refused = 0
+        self.history: Deque[Dict] = deque(maxlen=100)
+        self._dirty: Set[str] = set()
+        self._refuse_until = 0.0
+        self._lock = threading.Lock()
+        # Guards sizes and bytes; taken before a room lock, never while holding one
+        self._sizes_lock = threading.Lock()
+
+    def on_room_change(self, room_name: str, room: Optional['GameRoom']) -> None:
+        # Called with the room's lock held, so only note the name
+        self._dirty.add(room_name)
+
+    def _update(self, room_name: str) -> None:
+        """Measure one room again, or drop it if it was deleted, and adjust the total"""
+        with self._sizes_lock:
+            room = self.manager.get_room(room_name)
+            if room is None:
+                size = 0
+                old = self.sizes.pop(room_name, 0)
+            else:
+                with self.manager.lock_for(room_name):
+                    size = deep_sizeof(room)
+                old = self.sizes.get(room_name, 0)
+                self.sizes[room_name] = size
+            self.bytes += size - old
+
+    def refresh(self) -> None:
+        """Measure the rooms that changed or were deleted since the last check"""
+        while self._dirty:
+            try:
+                room_name = self._dirty.pop()
+            except KeyError:
+                break
+            self._update(room_name)
+
+    def room_bytes(self, room_name: str) -> int:
+        if room_name in self._dirty or room_name not in self.sizes:
+            self._dirty.discard(room_name)
+            self._update(room_name)
+        return self.sizes.get(room_name, 0)
+
+    def total_bytes(self) -> int:
+        self.refresh()
+        return self.bytes
+
+    def _over_budget(self, extra_rooms: int = 0) -> bool:
+        if len(self.manager.rooms) + extra_rooms > self.max_rooms:
+            return True
+        return self.bytes > self.max_bytes
+
+    def make_room(self) -> bool:
+        """Make space for one more room, evicting idle rooms if needed"""
+        self.refresh()
+        if not self._over_budget(extra_rooms=1):
+            return True
+        with self._lock:
+            if time.monotonic() < self._refuse_until:
+                self.refused += 1
+                return False
+            self.evict(extra_rooms=1)
+            if self._over_budget(extra_rooms=1):
+                self._refuse_until = time.monotonic() + self.retry_interval
+                self.refused += 1
+                logger.warning(f"Room budget exhausted ({len(self.manager.rooms)} rooms); refusing new rooms")
+                return False
+            return True
+
+    def evict(self, extra_rooms: int = 0) -> List[str]:
+        """Delete idle rooms, least recently active first, until within budget"""
+        self.refresh()
+        candidates = sorted(
+            (room.last_activity, room_name)
+            for room_name, room in list(self.manager.rooms.items())
+            if not room.has_connected_players()
+        )
+        evicted = []
+        for last_activity, room_name in candidates:
+            if not self._over_budget(extra_rooms):
+                break
+            with self.manager.lock_for(room_name):
+                room = self.manager.get_room(room_name)
+                if room is None or room.has_connected_players():
+                    continue
+                self.manager.delete_room(room_name)
+            self._dirty.discard(room_name)
+            self._update(room_name)
+            evicted.append(room_name)
+            self.history.append({'room': room_name, 'idle_seconds': int(time.time() - last_activity)})
+        if evicted:
+            self.evicted += len(evicted)
+            logger.info(f"Evicted {len(evicted)} idle rooms to stay within the room budget")
+        return evicted
+
+    def stats(self, largest: int = 10) -> Dict:
+        total = self.total_bytes()
+        sizes = sorted(((size, name) for name, size in list(self.sizes.items())), reverse=True)
+        return {
+            'rooms': len(self.manager.rooms),
+            'bytes': total,
+            'max_rooms': self.max_rooms,
+            'max_bytes': self.max_bytes,
+            'avg_room_bytes': total // len(sizes) if sizes else 0,
+            'largest_rooms': [{'room': name, 'bytes': size} for size, name in sizes[:largest]],
+            'evicted': self.evicted,
+            'refused': self.refused,
+            'recently_evicted': list(self.history),
+        }
@@ -0,0 +1,114 @@
+import bisect
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a fast in-memory handler up to a stalled one
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+FANOUT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 12, 25, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+registry: List['Metric'] = []
+
+# Called at scrape time; each returns ready-made exposition lines
+collectors: List[Callable[[], Iterable[str]]] = []
+
+def _escape(value) -> str:
+    """A label value as the text exposition format requires: backslash, quote and newline escaped"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+class Histogram(Metric):
+    """Bucketed distribution, stored as per-bucket counts and made cumulative at scrape time"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: one count per bucket, one for +Inf, then the sum
+        self.series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def timed(self, func):
+        """Decorator observing how long each call takes"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+        return wrapper
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for labels, series in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+def family(name: str, kind: str, documentation: str, samples: Dict[Tuple, float],
+           labelnames: Sequence[str] = ()) -> List[str]:
+    """Exposition lines for values read at scrape time, such as gauges"""
+    return [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}'] + [
+        f'{name}{_labels(labelnames, labels)} {value}' for labels, value in samples.items()]
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.collect())
+    for collector in collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector {collector.__name__} failed: {e}")
+    return '\n'.join(lines) + '\n'
+
+HANDLER_SECONDS = Histogram(
+    'thegang_handler_seconds', 'GameConsumer.receive handling time by message type',
+    labelnames=('message_type',))
+BROADCAST_FANOUT = Histogram(
+    'thegang_broadcast_fanout', 'Connections a room broadcast was delivered to',
+    buckets=FANOUT_BUCKETS, labelnames=('message_type',))
+BROADCAST_BYTES = Histogram(
+    'thegang_broadcast_bytes', 'Bytes sent per room broadcast across all recipients',
+    buckets=BYTES_BUCKETS, labelnames=('message_type',))
+ROOM_TO_DICT_SECONDS = Histogram('thegang_room_to_dict_seconds', 'GameRoom.to_dict duration')
+SCORING_SECONDS = Histogram('thegang_scoring_seconds', 'PokerGame._calculate_scoring duration')
+LOOP_LAG_SECONDS = Histogram('thegang_loop_lag_seconds', 'How late the event loop heartbeat woke up')
+LOOP_STALL_SECONDS = Histogram(
+    'thegang_loop_stall_seconds', 'Event loop stalls over the watchdog threshold by running handler',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0), labelnames=('handler', 'message_type'))
@@ -0,0 +1,162 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+import logging
+import time
+from .tracing import Delivery, tracer
+
+logger = logging.getLogger(__name__)
+
+# Message types that carry a complete room snapshot. A newer message of the
+# same type makes an older unsent one obsolete, so only the latest is kept.
+STATE_MESSAGE_TYPES = {'room_update', 'game_update', 'game_started', 'game_ended'}
+
+# Process-wide totals across all connections, for monitoring
+queue_stats = {
+    'sent': 0,
+    'bytes_sent': 0,
+    'superseded': 0,
+    'dropped': 0,
+    'slow_disconnects': 0,
+}
+
+class OutboundQueue:
+    """Bounded per-connection send queue drained by a single writer task.
+
+    Messages queued with a ``supersede_key`` are latest-wins: queueing one
+    removes any older unsent message with the same key. When the queue is
+    full the oldest message is dropped, and a connection that stays behind for longer than ``max_lag``
+    seconds is handed to ``on_slow`` (normally a close).
+
+    ``send`` returning says nothing about the client: the server buffers
+    whatever the socket does not take. Clients that acknowledge the number
+    of frames they have received get a ``window``: at most that many frames
+    are sent ahead of the last acknowledgement, the rest wait here where
+    they can still be superseded, and a frame left unacknowledged for
+    ``max_lag`` seconds counts as being behind.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]],
+                 on_slow: Callable[[], Awaitable[None]],
+                 max_depth: int = 32, max_lag: float = 15.0, window: Optional[int] = None):
+        self.send = send
+        self.on_slow = on_slow
+        self.max_depth = max_depth
+        self.max_lag = max_lag
+        self.window = window
+        self.pending: Deque[Tuple[str, Optional[str], Optional[Delivery]]] = deque()
+        self.behind_since: Optional[float] = None
+        # Send times of frames the client has not acknowledged yet (only with a window)
+        self.in_flight: Deque[float] = deque()
+        self.acked = 0
+        self.max_depth_seen = 0
+        self.sent = 0
+        self.superseded = 0
+        self.dropped = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self.closed = True
+        self._discard_all('closed')
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def depth(self) -> int:
+        return len(self.pending)
+
+    def lag(self, now: float) -> float:
+        """Seconds since the oldest frame still waiting to be sent or acknowledged"""
+        oldest = min(self.behind_since or now, self.in_flight[0] if self.in_flight else now)
+        return now - oldest
+
+    def ack(self, received) -> None:
+        """The client has received ``received`` frames from this queue in total"""
+        if self.window is None or not isinstance(received, int):
+            return
+        received = min(received, self.sent)
+        while self.acked < received:
+            self.acked += 1
+            self.in_flight.popleft()
+        self._wakeup.set()
+
+    def put(self, text: str, supersede_key: Optional[str] = None, delivery: Optional[Delivery] = None) -> bool:
+        """Queue a frame for sending; returns False if the queue is closed"""
+        if self.closed:
+            if delivery:
+                tracer.discarded(delivery, 'closed')
+            return False
+
+        if supersede_key is not None:
+            for i, (_, key, replaced) in enumerate(self.pending):
+                if key == supersede_key:
+                    del self.pending[i]
+                    self.superseded += 1
+                    queue_stats['superseded'] += 1
+                    if replaced:
+                        tracer.discarded(replaced, 'superseded')
+                    break
+
+        if len(self.pending) >= self.max_depth:
+            _, _, oldest = self.pending.popleft()
+            self.dropped += 1
+            queue_stats['dropped'] += 1
+            if oldest:
+                tracer.discarded(oldest, 'dropped')
+
+        self.pending.append((text, supersede_key, delivery))
+        self.max_depth_seen = max(self.max_depth_seen, len(self.pending))
+
+        now = time.monotonic()
+        if self.behind_since is None:
+            self.behind_since = now
+        if self.lag(now) > self.max_lag:
+            self._give_up()
+            return False
+
+        self._wakeup.set()
+        return True
+
+    def _give_up(self):
+        logger.warning("Closing slow connection: %s messages pending and %s unacknowledged for over %ss",
+                       len(self.pending), len(self.in_flight), self.max_lag)
+        queue_stats['slow_disconnects'] += 1
+        self.closed = True
+        self._discard_all('slow')
+        asyncio.ensure_future(self.on_slow())
+
+    def _discard_all(self, reason: str):
+        for _, _, delivery in self.pending:
+            if delivery:
+                tracer.discarded(delivery, reason)
+        self.pending.clear()
+
+    async def _run(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending and not self.closed:
+                if self.window is not None and len(self.in_flight) >= self.window:
+                    break
+                text, _, delivery = self.pending.popleft()
+                if delivery:
+                    send_start = time.perf_counter()
+                    await self.send(text)
+                    tracer.sent(delivery, send_start, time.perf_counter())
+                else:
+                    await self.send(text)
+                self.sent += 1
+                if self.window is not None:
+                    self.in_flight.append(time.monotonic())
+                queue_stats['sent'] += 1
+                queue_stats['bytes_sent'] += len(text)
+            if not self.pending:
+                self.behind_since = None
@@ -0,0 +1,178 @@
+import atexit
+import os
+import pickle
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set
+import logging
+import time
+from django.conf import settings
+from .room_manager import GameRoom, RoomManager, room_change_listeners, room_manager
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = 'rooms.snapshot'
+JOURNAL_FILE = 'rooms.journal'
+
+# Journal record header: operation, room name length, payload length
+RECORD_HEADER = struct.Struct('>BHI')
+OP_PUT = 1
+OP_DELETE = 2
+
+class RoomStore:
+    """Crash-safe persistence of every room as a snapshot plus a journal.
+
+    Rooms report changes through room_change_listeners; only their names are
+    recorded on the hot path. A background thread wakes every
+    flush_interval seconds, captures the changed rooms under their locks,
+    and appends one pickled record per changed or deleted room to an
+    append-only journal, so each flush costs O(dirty rooms). Once the
+    journal grows past compact_bytes, the thread rewrites the snapshot from
+    the latest encoded record of every room (nothing is re-serialized) and
+    truncates the journal. On startup, restore() loads the snapshot, replays
+    the journal and stops at a torn final record.
+    """
+
+    def __init__(self, directory, manager: RoomManager = room_manager,
+                 flush_interval: float = 1.0, compact_bytes: int = 8 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+        self.encoded: Dict[str, bytes] = {}
+        self._dirty: Set[str] = set()
+        self._dirty_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._journal = None
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.directory / SNAPSHOT_FILE
+
+    @property
+    def journal_path(self) -> Path:
+        return self.directory / JOURNAL_FILE
+
+    def enable(self) -> int:
+        """Restore persisted rooms, then start recording changes; returns rooms restored"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        restored = self.restore()
+        self.compact()
+        room_change_listeners.append(self._on_change)
+        self._thread = threading.Thread(target=self._run, name='room-store', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return restored
+
+    def close(self, persist: bool = True) -> None:
+        """Stop recording changes, writing a final snapshot unless persist is False"""
+        if self._thread is None:
+            # Never enabled; compacting would overwrite the snapshot with nothing
+            return
+        atexit.unregister(self.close)
+        if self._on_change in room_change_listeners:
+            room_change_listeners.remove(self._on_change)
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        if persist:
+            self.flush()
+            self.compact()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        self._thread = None
+
+    def _on_change(self, room_name: str, room: Optional[GameRoom]) -> None:
+        with self._dirty_lock:
+            self._dirty.add(room_name)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Room snapshot flush failed: {e}")
+
+    def flush(self) -> int:
+        """Journal every room changed since the last flush; returns records written"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+
+        records = []
+        for room_name in dirty:
+            with self.manager.lock_for(room_name):
+                room = self.manager.get_room(room_name)
+                state = room.to_snapshot() if room else None
+            if state is None:
+                records.append((OP_DELETE, room_name, b''))
+            else:
+                records.append((OP_PUT, room_name, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+
+        with self._io_lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'ab')
+            for op, room_name, payload in records:
+                name = room_name.encode()
+                self._journal.write(RECORD_HEADER.pack(op, len(name), len(payload)) + name + payload)
+                if op == OP_PUT:
+                    self.encoded[room_name] = payload
+                else:
+                    self.encoded.pop(room_name, None)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            journal_size = self._journal.tell()
+
+        if journal_size > self.compact_bytes:
+            self.compact()
+        return len(records)
+
+    def compact(self) -> None:
+        """Write a fresh snapshot of every room and empty the journal"""
+        with self._io_lock:
+            tmp_path = self.snapshot_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self.encoded, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if self._journal:
+                self._journal.close()
+            self._journal = open(self.journal_path, 'wb')
+
+    def restore(self) -> int:
+        start = time.monotonic()
+        encoded: Dict[str, bytes] = {}
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, 'rb') as f:
+                encoded = pickle.load(f)
+        if self.journal_path.exists():
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(data):
+                op, name_len, payload_len = RECORD_HEADER.unpack_from(data, offset)
+                end = offset + RECORD_HEADER.size + name_len + payload_len
+                if end > len(data):
+                    logger.warning(f"Ignoring torn journal record at offset {offset}")
+                    break
+                name = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + name_len].decode()
+                if op == OP_PUT:
+                    encoded[name] = data[end - payload_len:end]
+                else:
+                    encoded.pop(name, None)
+                offset = end
+
+        for payload in encoded.values():
+            self.manager.add_restored_room(GameRoom.from_snapshot(pickle.loads(payload)))
+        self.encoded = encoded
+        if encoded:
+            logger.info(f"Restored {len(encoded)} rooms in {time.monotonic() - start:.3f}s")
+        return len(encoded)
+
+room_store = RoomStore(settings.ROOM_SNAPSHOT_DIR) if getattr(settings, 'ROOM_SNAPSHOT_DIR', None) else None
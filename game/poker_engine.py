@@ -2,6 +2,8 @@ import random
 from enum import Enum
 from typing import Dict, List, Optional, Tuple
 import logging
+from .metrics import SCORING_SECONDS
+from .tracing import tracer
 from .poker_scoring import find_best_hand, check_cooperative_win, format_hand_for_display, validate_round_chips
 
 logger = logging.getLogger(__name__)
@@ -19,24 +21,35 @@ class GameRound(Enum):
     RIVER = "river"
     SCORING = "scoring"
 
+RANK_NAMES = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
+
 class Card:
     def __init__(self, rank: int, suit: Suit):
         self.rank = rank  # 2-14 (2-10, J=11, Q=12, K=13, A=14)
         self.suit = suit
     
     def to_dict(self) -> Dict:
-        rank_names = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
-        rank_str = rank_names.get(self.rank, str(self.rank))
-        return {
-            'rank': self.rank,
-            'rank_str': rank_str,
-            'suit': self.suit.value
-        }
+        """Shared, interned card dict - callers must not mutate it"""
+        return CARD_DICTS[(self.rank, self.suit)]
     
     def __str__(self):
-        rank_names = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
-        rank_str = rank_names.get(self.rank, str(self.rank))
-        return f"{rank_str}{self.suit.value[0].upper()}"
+        return CARD_STRS[(self.rank, self.suit)]
+
+# Process-wide tables for the 52 cards, built once at import time so that
+# serializing game state never rebuilds card representations.
+CARD_DICTS: Dict[Tuple[int, Suit], Dict] = {}
+CARD_STRS: Dict[Tuple[int, Suit], str] = {}
+for _suit in Suit:
+    for _rank in range(2, 15):
+        _rank_str = RANK_NAMES.get(_rank, str(_rank))
+        _card_dict = {'rank': _rank, 'rank_str': _rank_str, 'suit': _suit.value}
+        CARD_DICTS[(_rank, _suit)] = _card_dict
+        CARD_STRS[(_rank, _suit)] = f"{_rank_str}{_suit.value[0].upper()}"
+
+# One shared Card instance per rank/suit; cards are never mutated after creation
+DECK_CARDS: Tuple[Card, ...] = tuple(Card(rank, suit) for suit in Suit for rank in range(2, 15))
+
+CARDS_BY_KEY: Dict[Tuple[int, str], Card] = {(card.rank, card.suit.value): card for card in DECK_CARDS}
 
 class Deck:
     def __init__(self):
@@ -44,10 +57,7 @@ class Deck:
         self.reset()
     
     def reset(self):
-        self.cards = []
-        for suit in Suit:
-            for rank in range(2, 15):  # 2 through Ace
-                self.cards.append(Card(rank, suit))
+        self.cards = list(DECK_CARDS)
         self.shuffle()
     
     def shuffle(self):
@@ -106,7 +116,7 @@ class PokerGame:
         # Place white chips 1 to N in public area
         self.available_chips[ChipColor.WHITE] = list(range(1, self.num_players + 1))
         
-        logger.info(f"Started pre-flop round with {self.num_players} players")
+        logger.info("Started pre-flop round with %s players", self.num_players)
     
     def _advance_to_round(self, target_round: GameRound, expected_current: GameRound, 
                          chip_color: ChipColor, cards_to_deal: int = 0) -> bool:
@@ -126,7 +136,7 @@ class PokerGame:
         # Clear any recent steal event when advancing rounds
         self.recent_steal_event = None
         
-        logger.info(f"Started {target_round.value} round, total community cards: {len(self.community_cards)}")
+        logger.info("Started %s round, total community cards: %s", target_round.value, len(self.community_cards))
         return True
 
     def start_flop(self):
@@ -166,6 +176,7 @@ class PokerGame:
         """Helper to assign a chip to a player"""
         self.player_chips[player][chip_color] = chip_number
 
+    @tracer.traced
     def take_chip_from_public(self, player: str, chip_number: int) -> bool:
         """Player takes a chip from the public area"""
         chip_color = self.get_current_chip_color()
@@ -182,9 +193,10 @@ class PokerGame:
         # Clear any recent steal event
         self.recent_steal_event = None
         
-        logger.info(f"{player} took {chip_color.value} chip {chip_number}")
+        logger.info("%s took %s chip %s", player, chip_color.value, chip_number)
         return True
     
+    @tracer.traced
     def take_chip_from_player(self, taking_player: str, target_player: str) -> bool:
         """Player takes a chip from another player"""
         chip_color = self.get_current_chip_color()
@@ -210,9 +222,10 @@ class PokerGame:
             'chip_color': chip_color.value
         }
         
-        logger.info(f"{taking_player} took {chip_color.value} chip {target_chip} from {target_player}")
+        logger.info("%s took %s chip %s from %s", taking_player, chip_color.value, target_chip, target_player)
         return True
     
+    @tracer.traced
     def return_chip_to_public(self, player: str) -> bool:
         """Player returns their chip to the public area"""
         chip_color = self.get_current_chip_color()
@@ -226,7 +239,7 @@ class PokerGame:
         # Clear any recent steal event
         self.recent_steal_event = None
         
-        logger.info(f"{player} returned {chip_color.value} chip {returned_chip} to public")
+        logger.info("%s returned %s chip %s to public", player, chip_color.value, returned_chip)
         return True
     
     def all_players_have_chip(self) -> bool:
@@ -244,6 +257,7 @@ class PokerGame:
         """Check if the round can be advanced"""
         return self.all_players_have_chip()
     
+    @tracer.traced
     def advance_round(self) -> bool:
         """Advance to the next round"""
         if not self.can_advance_round():
@@ -263,6 +277,8 @@ class PokerGame:
         
         return False
     
+    @tracer.traced
+    @SCORING_SECONDS.timed
     def _calculate_scoring(self):
         """Calculate scoring results for the game"""
         if len(self.community_cards) != 5:
@@ -275,7 +291,7 @@ class PokerGame:
             all_cards = self.pocket_cards[player] + self.community_cards
             best_hand = find_best_hand(all_cards)
             player_hands[player] = best_hand
-            logger.info(f"{player}'s best hand: {best_hand}")
+            logger.debug("%s's best hand: %s", player, best_hand)
         
         # Get red chip assignments
         red_chips = {}
@@ -325,7 +341,7 @@ class PokerGame:
             'round_validations': round_validations
         }
         
-        logger.info(f"Scoring complete: {'WIN' if win_status else 'LOSS'}")
+        logger.info("Scoring complete: %s", 'WIN' if win_status else 'LOSS')
     
     def to_dict(self, player_perspective: Optional[str] = None) -> Dict:
         """Convert game state to dictionary for JSON serialization"""
@@ -381,4 +397,35 @@ class PokerGame:
         if self.current_round == GameRound.SCORING and self.scoring_results:
             result['scoring'] = self.scoring_results
         
-        return result
\ No newline at end of file
+        return result
+
+    def to_snapshot(self) -> Dict:
+        """Complete game state as plain builtins, for persistence"""
+        return {
+            'players': list(self.players),
+            'round': self.current_round.value,
+            'deck': [(card.rank, card.suit.value) for card in self.deck.cards],
+            'pocket_cards': {p: [(c.rank, c.suit.value) for c in cards] for p, cards in self.pocket_cards.items()},
+            'community_cards': [(card.rank, card.suit.value) for card in self.community_cards],
+            'available_chips': {color.value: list(chips) for color, chips in self.available_chips.items()},
+            'player_chips': {p: {color.value: chip for color, chip in chips.items()} for p, chips in self.player_chips.items()},
+            'scoring_results': self.scoring_results,
+            'recent_steal_event': self.recent_steal_event,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict) -> 'PokerGame':
+        """Rebuild a game from to_snapshot() output without dealing new cards"""
+        game = cls.__new__(cls)
+        game.players = list(data['players'])
+        game.num_players = len(game.players)
+        game.deck = Deck.__new__(Deck)
+        game.deck.cards = [CARDS_BY_KEY[tuple(key)] for key in data['deck']]
+        game.current_round = GameRound(data['round'])
+        game.pocket_cards = {p: [CARDS_BY_KEY[tuple(key)] for key in cards] for p, cards in data['pocket_cards'].items()}
+        game.community_cards = [CARDS_BY_KEY[tuple(key)] for key in data['community_cards']]
+        game.available_chips = {ChipColor(color): list(chips) for color, chips in data['available_chips'].items()}
+        game.player_chips = {p: {ChipColor(color): chip for color, chip in chips.items()} for p, chips in data['player_chips'].items()}
+        game.scoring_results = data['scoring_results']
+        game.recent_steal_event = data['recent_steal_event']
+        return game
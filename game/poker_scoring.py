@@ -18,6 +18,20 @@ class HandRank(Enum):
     STRAIGHT_FLUSH = 9
     ROYAL_FLUSH = 10
 
+# Display strings for each hand rank, shared by every serialization path
+HAND_RANK_DISPLAY: Dict[HandRank, str] = {
+    HandRank.HIGH_CARD: "High Card",
+    HandRank.ONE_PAIR: "One Pair",
+    HandRank.TWO_PAIR: "Two Pair",
+    HandRank.THREE_OF_A_KIND: "Three of a Kind",
+    HandRank.STRAIGHT: "Straight",
+    HandRank.FLUSH: "Flush",
+    HandRank.FULL_HOUSE: "Full House",
+    HandRank.FOUR_OF_A_KIND: "Four of a Kind",
+    HandRank.STRAIGHT_FLUSH: "Straight Flush",
+    HandRank.ROYAL_FLUSH: "Royal Flush"
+}
+
 class PokerHand:
     def __init__(self, cards):
         self.cards = sorted(cards, key=lambda c: c.rank, reverse=True)
@@ -117,19 +131,7 @@ class PokerHand:
         return self.rank == other.rank and self.tie_breakers == other.tie_breakers
     
     def __str__(self):
-        rank_names = {
-            HandRank.HIGH_CARD: "High Card",
-            HandRank.ONE_PAIR: "One Pair", 
-            HandRank.TWO_PAIR: "Two Pair",
-            HandRank.THREE_OF_A_KIND: "Three of a Kind",
-            HandRank.STRAIGHT: "Straight",
-            HandRank.FLUSH: "Flush",
-            HandRank.FULL_HOUSE: "Full House",
-            HandRank.FOUR_OF_A_KIND: "Four of a Kind",
-            HandRank.STRAIGHT_FLUSH: "Straight Flush",
-            HandRank.ROYAL_FLUSH: "Royal Flush"
-        }
-        return rank_names[self.rank]
+        return HAND_RANK_DISPLAY[self.rank]
 
 def find_best_hand(cards):
     """
@@ -266,12 +268,12 @@ def check_cooperative_win(player_hands: Dict[str, PokerHand], red_chips: Dict[st
             valid_chips = list(range(min_pos, max_pos + 1))
             
             if actual_chip not in valid_chips:
-                logger.info(f"Player {player} has chip {actual_chip}, but should have one of {valid_chips} due to tie")
+                logger.info("Player %s has chip %s, but should have one of %s due to tie", player, actual_chip, valid_chips)
                 win = False
         else:
             # No tie - chip must match exactly
             if actual_chip != expected_chip:
-                logger.info(f"Player {player} has chip {actual_chip}, but should have chip {expected_chip}")
+                logger.info("Player %s has chip %s, but should have chip %s", player, actual_chip, expected_chip)
                 win = False
     
     return win, ranked_players, red_chips
@@ -280,18 +282,9 @@ def format_hand_for_display(hand: PokerHand) -> Dict:
     """
     Format a poker hand for frontend display.
     """
-    card_names = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
-    
     return {
         'rank': hand.rank.name,
-        'rank_display': str(hand),
-        'cards': [
-            {
-                'rank': card.rank,
-                'rank_str': card_names.get(card.rank, str(card.rank)),
-                'suit': card.suit.value
-            }
-            for card in hand.cards
-        ],
+        'rank_display': HAND_RANK_DISPLAY[hand.rank],
+        'cards': [card.to_dict() for card in hand.cards],
         'tie_breakers': hand.tie_breakers
     }
\ No newline at end of file
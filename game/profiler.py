@@ -0,0 +1,103 @@
+from collections import Counter
+import sys
+import threading
+from typing import Dict, List, Optional
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# At most one profile at a time; they would only sample each other
+_running = threading.Lock()
+
+class ProfilerBusy(Exception):
+    pass
+
+class Profile:
+    def __init__(self, stacks: Counter, samples: int, filtered: int, seconds: float, interval: float,
+                 module_prefix: Optional[str]):
+        self.stacks = stacks
+        self.samples = samples
+        self.filtered = filtered
+        self.seconds = seconds
+        self.interval = interval
+        self.module_prefix = module_prefix
+
+    def collapsed(self) -> str:
+        """Folded stacks, one ``root;...;leaf count`` line each, for flamegraph.pl or speedscope"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        """Leaf frames that were running in the most samples"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [{'frame': frame, 'samples': count} for frame, count in leaves.most_common(limit)]
+
+    def summary(self) -> Dict:
+        return {
+            'seconds': self.seconds,
+            'interval': self.interval,
+            'module_prefix': self.module_prefix,
+            'samples': self.samples,
+            'filtered_out': self.filtered,
+            'distinct_stacks': len(self.stacks),
+            'top': self.top(),
+        }
+
+def _in_module(name: str, prefix: str) -> bool:
+    return name == prefix or name.startswith(prefix + '.')
+
+def _fold(thread_name: str, frame, module_prefix: Optional[str]) -> Optional[str]:
+    labels = []
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '?')
+        if module_prefix is None or _in_module(module, module_prefix):
+            labels.append(f'{module}:{frame.f_code.co_qualname}')
+        frame = frame.f_back
+    if not labels:
+        return None
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+def profile(seconds: float, interval: float = 0.005, module_prefix: Optional[str] = None) -> Profile:
+    """Sample every thread's stack each ``interval`` seconds for ``seconds``.
+
+    This runs in the calling thread and blocks it, so call it off the event
+    loop. With ``module_prefix`` (e.g. 'game') only frames from those
+    modules are kept, and samples with none of them are dropped.
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        samples = filtered = 0
+        start = time.monotonic()
+        deadline = start + seconds
+        next_sample = start
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                samples += 1
+                stack = _fold(names.get(thread_id, f'thread-{thread_id}'), frame, module_prefix)
+                if stack is None:
+                    filtered += 1
+                else:
+                    stacks[stack] += 1
+            next_sample += interval
+            now = time.monotonic()
+            if next_sample >= deadline:
+                break
+            if next_sample > now:
+                time.sleep(next_sample - now)
+            else:
+                # Fell behind; sample again straight away rather than catching up
+                next_sample = now
+        elapsed = time.monotonic() - start
+    finally:
+        _running.release()
+    logger.info("Profiled for %.1fs: %s samples, %s distinct stacks", elapsed, samples, len(stacks))
+    return Profile(stacks, samples, filtered, elapsed, interval, module_prefix)
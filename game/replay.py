@@ -0,0 +1,52 @@
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+from .outbound import STATE_MESSAGE_TYPES
+
+class ReplayEntry(NamedTuple):
+    seq: int
+    message_type: str
+    text: str
+    target_player: Optional[str]
+
+class ReplayBuffer:
+    """The broadcasts a reconnecting client may have missed, for one room.
+
+    Every broadcast gets the next sequence number. A reconnecting client that
+    reports the last sequence number it saw can be sent just the messages it
+    missed. State messages are complete snapshots, so only the newest one
+    per message type and recipient is kept; any other messages go in a small
+    ring buffer, and once one of those is evicted, clients that missed it
+    get the full state instead.
+    """
+
+    def __init__(self, size: int = 16, last_seq: int = 0):
+        self.latest: Dict[Tuple[str, Optional[str]], ReplayEntry] = {}
+        self.entries: Deque[ReplayEntry] = deque(maxlen=size)
+        self.last_seq = last_seq
+        # Messages up to this sequence number can no longer be replayed
+        self.lost_through = last_seq
+
+    def record(self, message_type: str, text: str, target_player: Optional[str] = None) -> int:
+        self.last_seq += 1
+        entry = ReplayEntry(self.last_seq, message_type, text, target_player)
+        if message_type in STATE_MESSAGE_TYPES:
+            self.latest[(message_type, target_player)] = entry
+        else:
+            if len(self.entries) == self.entries.maxlen:
+                self.lost_through = self.entries[0].seq
+            self.entries.append(entry)
+        return self.last_seq
+
+    def next_seq(self) -> int:
+        return self.last_seq + 1
+
+    def since(self, last_seq: int, player_name: str) -> Optional[List[ReplayEntry]]:
+        """Messages for player_name after last_seq, or None if some were lost"""
+        if last_seq > self.last_seq or last_seq < self.lost_through:
+            return None
+        missed = [
+            entry for entry in (*self.latest.values(), *self.entries)
+            if entry.seq > last_seq and entry.target_player in (None, player_name)
+        ]
+        missed.sort()
+        return missed
@@ -1,8 +1,20 @@
+import asyncio
 from enum import Enum
-from typing import Dict, List, Optional, Set
+import itertools
+from typing import Callable, Dict, List, Optional, Set
 import logging
+import secrets
+import threading
 import time
+import weakref
+from django.conf import settings
+from .expiry import ExpiryScheduler
+from .memory import RoomBudget
+from .metrics import ROOM_TO_DICT_SECONDS
 from .poker_engine import PokerGame
+from .replay import ReplayBuffer
+from .sessions import PlayerRoster, SessionIndex
+from .tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -10,15 +22,28 @@ class RoomState(Enum):
     WAITING = "waiting"
     STARTED = "started"
 
+# Called with (room_name, room) whenever a room's persistent state changes,
+# and with (room_name, None) when a room is deleted
+room_change_listeners: List[Callable[[str, Optional['GameRoom']], None]] = []
+
+# Room versions are unique across the process, so a room deleted and created
+# again never repeats a version an HTTP client may have cached
+_versions = itertools.count(1)
+
 class GameRoom:
     def __init__(self, name: str):
         self.name = name
-        self.players: List[str] = []
+        self.players = PlayerRoster()
         self.connected_players: Set[str] = set()
         self.state = RoomState.WAITING
         self.game_state = {}
         self.poker_game: Optional[PokerGame] = None
         self.last_activity = time.time()
+        self.replay = ReplayBuffer()
+        self.session_tokens: Dict[str, str] = {}
+        self.player_channels: Dict[str, str] = {}
+        self.seat_holds: Dict[str, asyncio.TimerHandle] = {}
+        self.version = next(_versions)
 
     def add_player(self, player_name: str) -> bool:
         if self.state != RoomState.WAITING:
@@ -26,7 +51,8 @@ class GameRoom:
         if player_name not in self.players:
             self.players.append(player_name)
             self.last_activity = time.time()
-            logger.info(f"Player {player_name} joined room {self.name}")
+            self.mark_changed()
+            logger.info("Player %s joined room %s", player_name, self.name)
             return True
         return False
 
@@ -34,21 +60,52 @@ class GameRoom:
         if player_name in self.players:
             self.players.remove(player_name)
             self.connected_players.discard(player_name)
+            self.session_tokens.pop(player_name, None)
+            self.player_channels.pop(player_name, None)
+            self._cancel_seat_hold(player_name)
             self.last_activity = time.time()
-            logger.info(f"Player {player_name} left room {self.name}")
+            self.mark_changed()
+            logger.info("Player %s left room %s", player_name, self.name)
             return True
         return False
 
-    def connect_player(self, player_name: str) -> None:
+    def connect_player(self, player_name: str, channel_name: Optional[str] = None) -> None:
         if player_name in self.players:
             self.connected_players.add(player_name)
+            if channel_name:
+                self.player_channels[player_name] = channel_name
+            self._cancel_seat_hold(player_name)
             self.last_activity = time.time()
-            logger.info(f"Player {player_name} connected to room {self.name}")
+            logger.info("Player %s connected to room %s", player_name, self.name)
 
-    def disconnect_player(self, player_name: str) -> None:
+    def disconnect_player(self, player_name: str, channel_name: Optional[str] = None) -> None:
+        # A reconnect may have replaced this channel already; the newer one wins
+        if channel_name and self.player_channels.get(player_name, channel_name) != channel_name:
+            return
+        self.player_channels.pop(player_name, None)
         self.connected_players.discard(player_name)
         self.last_activity = time.time()
-        logger.info(f"Player {player_name} disconnected from room {self.name}")
+        logger.info("Player %s disconnected from room %s", player_name, self.name)
+
+    def session_token(self, player_name: str) -> str:
+        """Return the player's resume token, issuing one on first use"""
+        token = self.session_tokens.get(player_name)
+        if token is None:
+            token = secrets.token_urlsafe(16)
+            self.session_tokens[player_name] = token
+            self.mark_changed()
+        return token
+
+    def mark_changed(self) -> None:
+        """Record that the room's state changed and notify listeners"""
+        self.version = next(_versions)
+        for listener in room_change_listeners:
+            listener(self.name, self)
+
+    def _cancel_seat_hold(self, player_name: str) -> None:
+        handle = self.seat_holds.pop(player_name, None)
+        if handle:
+            handle.cancel()
 
     def is_empty(self) -> bool:
         return len(self.players) == 0
@@ -64,7 +121,8 @@ class GameRoom:
             self.state = RoomState.STARTED
             self.poker_game = PokerGame(self.players.copy())
             self.game_state = {}
-            logger.info(f"Game started in room {self.name}")
+            self.mark_changed()
+            logger.info("Game started in room %s", self.name)
             return True
         return False
 
@@ -72,7 +130,8 @@ class GameRoom:
         if self.state == RoomState.STARTED:
             self.state = RoomState.WAITING
             self.poker_game = None
-            logger.info(f"Game ended in room {self.name}")
+            self.mark_changed()
+            logger.info("Game ended in room %s", self.name)
             return True
         return False
 
@@ -89,14 +148,17 @@ class GameRoom:
             self.state = RoomState.STARTED
             self.poker_game = PokerGame(self.players.copy())
             self.game_state = {}
-            logger.info(f"Game restarted in room {self.name}")
+            self.mark_changed()
+            logger.info("Game restarted in room %s", self.name)
             return True
         return False
 
+    @tracer.traced
+    @ROOM_TO_DICT_SECONDS.timed
     def to_dict(self, player_perspective: Optional[str] = None) -> Dict:
         base_data = {
             'name': self.name,
-            'players': self.players,
+            'players': list(self.players),
             'state': self.state.value,
             'player_count': len(self.players),
             'can_start': self.can_start_game()
@@ -108,84 +170,199 @@ class GameRoom:
         
         return base_data
 
+    def to_snapshot(self) -> Dict:
+        """Persistent room state as plain builtins; connections are not included"""
+        return {
+            'name': self.name,
+            'players': list(self.players),
+            'state': self.state.value,
+            'last_activity': self.last_activity,
+            'session_tokens': dict(self.session_tokens),
+            'seq': self.replay.last_seq,
+            'poker_game': self.poker_game.to_snapshot() if self.poker_game else None,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict) -> 'GameRoom':
+        room = cls(data['name'])
+        room.players = PlayerRoster(data['players'])
+        room.state = RoomState(data['state'])
+        room.last_activity = data['last_activity']
+        room.session_tokens = dict(data['session_tokens'])
+        # Replay history is not persisted; resuming clients fall back to full state
+        room.replay = ReplayBuffer(last_seq=data['seq'])
+        if data['poker_game']:
+            room.poker_game = PokerGame.from_snapshot(data['poker_game'])
+        return room
+
 class RoomManager:
+    """Registry of live rooms, safe to use from the event loop and view threads.
+
+    Each room is guarded by one of a fixed set of re-entrant locks chosen by
+    hashing the room name, so operations on different rooms rarely contend.
+    Code that mutates a GameRoom or its PokerGame outside these methods
+    should hold ``lock_for(room_name)`` while doing so, and must not await
+    while holding it.
+    """
+
+    LOCK_STRIPES = 64
+
     def __init__(self):
         self.rooms: Dict[str, GameRoom] = {}
+        self._locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+        self.expiry = ExpiryScheduler(self, getattr(settings, 'ROOM_IDLE_TIMEOUT', 600))
+        self.budget = RoomBudget(
+            self,
+            max_rooms=getattr(settings, 'ROOM_BUDGET_MAX_ROOMS', 5000),
+            max_bytes=getattr(settings, 'ROOM_BUDGET_MAX_BYTES', 256 * 1024 * 1024),
+        )
+        _managers.add(self)
+        self.sessions = SessionIndex()
+        # Set while handing rooms over to another process; rooms are frozen
+        self.draining = False
+        # Set while waiting for another process to hand its rooms over; new rooms are refused
+        self.awaiting_handoff = False
+
+    def lock_for(self, room_name: str) -> threading.RLock:
+        return self._locks[hash(room_name) % len(self._locks)]
 
     def create_room(self, room_name: str) -> GameRoom:
-        if room_name not in self.rooms:
-            self.rooms[room_name] = GameRoom(room_name)
-            logger.info(f"Created room {room_name}")
-        return self.rooms[room_name]
+        with self.lock_for(room_name):
+            if room_name not in self.rooms:
+                room = GameRoom(room_name)
+                self.rooms[room_name] = room
+                self.expiry.schedule(room_name, room.last_activity)
+                self.budget.on_room_change(room_name, room)
+                logger.info("Created room %s", room_name)
+            return self.rooms[room_name]
 
     def get_room(self, room_name: str) -> Optional[GameRoom]:
         return self.rooms.get(room_name)
 
+    def add_restored_room(self, room: GameRoom) -> None:
+        """Register a room rebuilt from persisted state"""
+        with self.lock_for(room.name):
+            self.rooms[room.name] = room
+            self.expiry.schedule(room.name, room.last_activity)
+            self.budget.on_room_change(room.name, room)
+
+    def delete_room(self, room_name: str) -> None:
+        with self.lock_for(room_name):
+            room = self.rooms.pop(room_name, None)
+            if room is not None:
+                for channel_name in room.player_channels.values():
+                    self.sessions.unbind(channel_name)
+                self.budget.on_room_change(room_name, None)
+                for listener in room_change_listeners:
+                    listener(room_name, None)
+
     def join_room(self, room_name: str, player_name: str) -> tuple[bool, str]:
-        room = self.get_room(room_name)
-        if not room:
-            room = self.create_room(room_name)
-        
-        if room.state != RoomState.WAITING:
-            return False, f"Room {room_name} is not accepting new players"
-        
-        success = room.add_player(player_name)
-        if success:
-            return True, f"Successfully joined room {room_name}"
-        else:
-            return False, f"Player {player_name} is already in the room"
+        if self.draining or (self.awaiting_handoff and self.get_room(room_name) is None):
+            return False, "Server is restarting, please try again shortly"
+        # Checked before taking the room lock, since eviction takes other rooms' locks
+        if self.get_room(room_name) is None and not self.budget.make_room():
+            return False, "Server is full, please try again later"
+        with self.lock_for(room_name):
+            room = self.get_room(room_name)
+            if not room:
+                room = self.create_room(room_name)
+            
+            if room.state != RoomState.WAITING:
+                return False, f"Room {room_name} is not accepting new players"
+            
+            success = room.add_player(player_name)
+            if success:
+                return True, f"Successfully joined room {room_name}"
+            else:
+                return False, f"Player {player_name} is already in the room"
 
     def leave_room(self, room_name: str, player_name: str) -> bool:
-        room = self.get_room(room_name)
-        if room:
-            success = room.remove_player(player_name)
-            if success:
+        with self.lock_for(room_name):
+            room = self.get_room(room_name)
+            if room:
+                channel_name = room.player_channels.get(player_name)
+                success = room.remove_player(player_name)
+                if success and channel_name:
+                    self.sessions.unbind(channel_name)
+                if success:
+                    self._cleanup_room_if_needed(room_name, room)
+                return success
+            return False
+
+    def connect_to_room(self, room_name: str, player_name: str, channel_name: Optional[str] = None) -> bool:
+        with self.lock_for(room_name):
+            room = self.get_room(room_name)
+            if room and player_name in room.players:
+                previous = room.player_channels.get(player_name)
+                room.connect_player(player_name, channel_name)
+                if channel_name:
+                    if previous and previous != channel_name:
+                        self.sessions.unbind(previous)
+                    self.sessions.bind(channel_name, room_name, player_name)
+                return True
+            return False
+
+    def disconnect_from_room(self, room_name: str, player_name: str, channel_name: Optional[str] = None) -> bool:
+        with self.lock_for(room_name):
+            room = self.get_room(room_name)
+            if room:
+                if channel_name and self.sessions.lookup(channel_name) == (room_name, player_name):
+                    self.sessions.unbind(channel_name)
+                room.disconnect_player(player_name, channel_name)
                 self._cleanup_room_if_needed(room_name, room)
-            return success
-        return False
+                return True
+            return False
 
-    def connect_to_room(self, room_name: str, player_name: str) -> bool:
-        room = self.get_room(room_name)
-        if room and player_name in room.players:
-            room.connect_player(player_name)
-            return True
-        return False
+    def hold_seat(self, room_name: str, player_name: str, grace: float,
+                  on_release: Callable[[str, str], None]) -> bool:
+        """Keep a disconnected player's seat for grace seconds before calling on_release"""
+        with self.lock_for(room_name):
+            room = self.get_room(room_name)
+            if not room or player_name not in room.players:
+                return False
+            room._cancel_seat_hold(player_name)
+            loop = asyncio.get_running_loop()
+            room.seat_holds[player_name] = loop.call_later(grace, self._release_seat, room_name, player_name, on_release)
+        logger.info("Holding seat for %s in room %s for %ss", player_name, room_name, grace)
+        return True
 
-    def disconnect_from_room(self, room_name: str, player_name: str) -> bool:
-        room = self.get_room(room_name)
-        if room:
-            room.disconnect_player(player_name)
-            self._cleanup_room_if_needed(room_name, room)
-            return True
-        return False
+    def _release_seat(self, room_name: str, player_name: str, on_release: Callable[[str, str], None]):
+        with self.lock_for(room_name):
+            room = self.get_room(room_name)
+            if not room:
+                return
+            room.seat_holds.pop(player_name, None)
+            if player_name in room.connected_players:
+                return
+        on_release(room_name, player_name)
 
     def _cleanup_room_if_needed(self, room_name: str, room):
         # Clean up room if it's completely empty
         if room.is_empty():
-            del self.rooms[room_name]
-            logger.info(f"Deleted empty room {room_name}")
+            self.delete_room(room_name)
+            logger.info("Deleted empty room %s", room_name)
         # Or if no players are connected and room is in waiting state for more than 5 minutes
         elif (room.state == RoomState.WAITING and 
               not room.has_connected_players() and 
               time.time() - room.last_activity > 300):  # 5 minutes
-            del self.rooms[room_name]
-            logger.info(f"Deleted stale room {room_name} (no connected players for 5 minutes)")
+            self.delete_room(room_name)
+            logger.info("Deleted stale room %s (no connected players for 5 minutes)", room_name)
 
     def cleanup_stale_rooms(self) -> int:
         """Clean up rooms with no connected players for extended periods"""
-        rooms_to_delete = []
-        current_time = time.time()
-        
-        for room_name, room in self.rooms.items():
-            # Delete rooms with no connected players for more than 10 minutes
-            if (not room.has_connected_players() and 
-                current_time - room.last_activity > 600):  # 10 minutes
-                rooms_to_delete.append(room_name)
-        
-        for room_name in rooms_to_delete:
-            del self.rooms[room_name]
-            logger.info(f"Cleaned up stale room {room_name}")
-        
-        return len(rooms_to_delete)
+        return len(self.expiry.expire_due())
+
+# Live managers, so a room's changes reach only the budget of the manager holding it
+_managers: 'weakref.WeakSet[RoomManager]' = weakref.WeakSet()
+
+def _notify_owner(room_name: str, room: Optional[GameRoom]) -> None:
+    # Creation and deletion are reported by the manager itself
+    if room is None:
+        return
+    for manager in list(_managers):
+        if manager.rooms.get(room_name) is room:
+            manager.budget.on_room_change(room_name, room)
+
+room_change_listeners.append(_notify_owner)
 
 room_manager = RoomManager()
\ No newline at end of file
@@ -1,6 +1,18 @@
+from channels.routing import URLRouter
+from django.conf import settings
 from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/game/(?P<room_name>\w+)/(?P<player_name>\w+)/$', consumers.GameConsumer.as_asgi()),
-]
\ No newline at end of file
+    re_path(r'ws/spectate/(?P<room_name>\w+)/$', consumers.SpectatorConsumer.as_asgi()),
+]
+
+def websocket_application():
+    """The WebSocket router, behind the auth middleware only if WEBSOCKET_AUTH is set"""
+    application = URLRouter(websocket_urlpatterns)
+    if getattr(settings, 'WEBSOCKET_AUTH', True):
+        # Loads the session and user from the database on every connect
+        from channels.auth import AuthMiddlewareStack
+        application = AuthMiddlewareStack(application)
+    return application
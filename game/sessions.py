@@ -0,0 +1,88 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import threading
+
+class PlayerRoster:
+    """Players in seat order with O(1) membership, append and remove.
+
+    Backed by an insertion-ordered dict. Supports the parts of the list API
+    rooms use, so it can stand in for the old players list.
+    """
+
+    __slots__ = ('_seats',)
+
+    def __init__(self, players: Iterable[str] = ()):
+        self._seats: Dict[str, None] = dict.fromkeys(players)
+
+    def append(self, player_name: str) -> None:
+        self._seats[player_name] = None
+
+    def remove(self, player_name: str) -> None:
+        try:
+            del self._seats[player_name]
+        except KeyError:
+            raise ValueError(f"{player_name} is not in the roster")
+
+    def copy(self) -> List[str]:
+        return list(self._seats)
+
+    def __contains__(self, player_name) -> bool:
+        return player_name in self._seats
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._seats)
+
+    def __len__(self) -> int:
+        return len(self._seats)
+
+    def __getitem__(self, index):
+        return list(self._seats)[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PlayerRoster):
+            return list(self._seats) == list(other._seats)
+        if isinstance(other, list):
+            return list(self._seats) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"PlayerRoster({list(self._seats)!r})"
+
+class SessionIndex:
+    """Reverse index from live WebSocket channels to their room and player.
+
+    RoomManager keeps it in step with connects, disconnects, leaves and room
+    deletion, so a channel can be resolved, and a player's connected rooms
+    found, without scanning rooms.
+    """
+
+    def __init__(self):
+        self.channels: Dict[str, Tuple[str, str]] = {}
+        self.players: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, channel_name: str, room_name: str, player_name: str) -> None:
+        with self._lock:
+            self.channels[channel_name] = (room_name, player_name)
+            self.players.setdefault(player_name, set()).add(room_name)
+
+    def unbind(self, channel_name: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            session = self.channels.pop(channel_name, None)
+            if session:
+                room_name, player_name = session
+                rooms = self.players.get(player_name)
+                if rooms is not None:
+                    rooms.discard(room_name)
+                    if not rooms:
+                        del self.players[player_name]
+            return session
+
+    def lookup(self, channel_name: str) -> Optional[Tuple[str, str]]:
+        return self.channels.get(channel_name)
+
+    def rooms_for(self, player_name: str) -> Set[str]:
+        with self._lock:
+            return set(self.players.get(player_name, ()))
+
+    def __len__(self) -> int:
+        return len(self.channels)
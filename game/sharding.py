@@ -0,0 +1,162 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import re
+from urllib.parse import parse_qs
+from typing import List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Paths whose room name is part of the URL
+ROOM_PATH_PATTERNS = [
+    re.compile(r'^/ws/game/(?P<room_name>\w+)/\w+/'),
+    re.compile(r'^/ws/spectate/(?P<room_name>\w+)/'),
+    re.compile(r'^/api/api/room-status/(?P<room_name>[^/]+)/'),
+]
+JOIN_ROOM_PATH = '/api/api/join-room/'
+MAX_HEAD_SIZE = 64 * 1024
+MAX_JOIN_BODY_SIZE = 64 * 1024
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent hash ring mapping room names to worker nodes"""
+
+    def __init__(self, nodes: Sequence[str], replicas: int = 100):
+        self.nodes = list(nodes)
+        self._ring: List[Tuple[int, str]] = sorted(
+            (_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+def room_for_request(path: str, body: bytes = b'') -> Optional[str]:
+    """Room name a request belongs to, or None for room-independent requests"""
+    path = path.split('?', 1)[0]
+    for pattern in ROOM_PATH_PATTERNS:
+        match = pattern.match(path)
+        if match:
+            return match.group('room_name')
+    if path == JOIN_ROOM_PATH and body:
+        try:
+            room_name = json.loads(body).get('room_name', '')
+        except (ValueError, AttributeError):
+            return None
+        return room_name.strip() or None
+    return None
+
+class ShardRouter:
+    """Front process that pins every room's traffic to one worker.
+
+    Each client connection's first request is parsed far enough to find the
+    room (URL or join-room body) and the connection is then spliced to the
+    owning worker's unix socket. Plain HTTP requests are forced to
+    ``Connection: close`` so the next request is routed afresh; WebSocket
+    upgrades stay on their worker for the life of the socket.
+
+    Join requests whose body cannot be read up front (chunked, or larger
+    than MAX_JOIN_BODY_SIZE) are refused rather than routed without their
+    room. Requests that belong to no room, such as /metrics and the admin
+    API, go to one worker chosen by path; add ``?worker=N`` (0-based) to
+    reach a particular worker, since each one only reports on its own rooms.
+    """
+
+    def __init__(self, socket_paths: Sequence[str]):
+        self.socket_paths = list(socket_paths)
+        self.ring = HashRing(self.socket_paths)
+
+    def worker_for(self, path: str, body: bytes = b'') -> str:
+        room_name = room_for_request(path, body)
+        if room_name is not None:
+            return self.ring.node_for(room_name)
+        worker = parse_qs(path.partition('?')[2]).get('worker', [''])[0]
+        if worker.isdigit() and int(worker) < len(self.socket_paths):
+            return self.socket_paths[int(worker)]
+        return self.ring.node_for(path)
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        worker_writer = None
+        try:
+            head = await client_reader.readuntil(b'\r\n\r\n')
+            request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+            path = request_line.split(' ')[1]
+
+            content_length = 0
+            is_upgrade = False
+            chunked = False
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                name = name.strip().lower()
+                if name == 'content-length':
+                    content_length = int(value.strip())
+                elif name == 'transfer-encoding':
+                    chunked = True
+                elif name == 'upgrade' and value.strip().lower() == 'websocket':
+                    is_upgrade = True
+
+            # The room is in the join body; one the router cannot read would land on the wrong worker
+            if path.split('?', 1)[0] == JOIN_ROOM_PATH:
+                if chunked:
+                    await _reject(client_writer, '411 Length Required')
+                    return
+                if content_length > MAX_JOIN_BODY_SIZE:
+                    await _reject(client_writer, '413 Content Too Large')
+                    return
+
+            dropped = ('x-forwarded-for',) if is_upgrade else ('x-forwarded-for', 'connection')
+            headers = [line for line in header_lines if line.partition(':')[0].strip().lower() not in dropped]
+            if not is_upgrade:
+                headers.append('Connection: close')
+            peer = client_writer.get_extra_info('peername')
+            if peer:
+                headers.append(f'X-Forwarded-For: {peer[0]}')
+
+            body = b''
+            if path.split('?', 1)[0] == JOIN_ROOM_PATH and content_length:
+                body = await client_reader.readexactly(content_length)
+
+            socket_path = self.worker_for(path, body)
+            worker_reader, worker_writer = await asyncio.open_unix_connection(socket_path)
+            worker_writer.write(('\r\n'.join([request_line] + headers) + '\r\n\r\n').encode('latin-1') + body)
+            await worker_writer.drain()
+
+            # The exchange is over once the worker is done, whatever the client does
+            upstream = asyncio.ensure_future(_pipe(client_reader, worker_writer))
+            try:
+                await _pipe(worker_reader, client_writer)
+            finally:
+                upstream.cancel()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, IndexError, ValueError) as e:
+            logger.debug(f"Router connection ended: {e!r}")
+        finally:
+            if worker_writer:
+                worker_writer.close()
+            client_writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD_SIZE)
+        logger.info(f"Shard router listening on {host}:{port} for {len(self.socket_paths)} workers")
+        return server
+
+async def _reject(writer: asyncio.StreamWriter, status: str):
+    writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except ConnectionError:
+        writer.close()
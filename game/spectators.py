@@ -0,0 +1,90 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set
+import logging
+from .outbound import OutboundQueue
+from .room_manager import room_change_listeners, room_manager
+
+logger = logging.getLogger(__name__)
+
+class SpectatorRegistry:
+    """Read-only subscribers per room, kept apart from players and channel groups.
+
+    Publishing only marks a room dirty. Dirty rooms are flushed once per
+    event loop iteration: the public snapshot is encoded a single time and
+    the same text is queued on every spectator's outbound queue, so the
+    cost of an update barely grows with the number of watchers. Deleting a
+    room (from any thread) publishes it too, so spectators get room_closed,
+    or reconnect when the room was handed to a new process.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[OutboundQueue]] = {}
+        self.snapshots: Dict[str, str] = {}
+        self.dirty: Set[str] = set()
+        self._flush_scheduled = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, room_name: str, queue: OutboundQueue) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.subscribers.setdefault(room_name, set()).add(queue)
+        logger.info("Spectator joined room %s (%s watching)", room_name, len(self.subscribers[room_name]))
+
+    def unsubscribe(self, room_name: str, queue: OutboundQueue) -> None:
+        queues = self.subscribers.get(room_name)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[room_name]
+            self.snapshots.pop(room_name, None)
+            self.dirty.discard(room_name)
+
+    def count(self, room_name: Optional[str] = None) -> int:
+        if room_name is not None:
+            return len(self.subscribers.get(room_name, ()))
+        return sum(len(queues) for queues in self.subscribers.values())
+
+    def snapshot(self, room_name: str) -> str:
+        """Encoded public snapshot of the room, cached until the next publish"""
+        text = self.snapshots.get(room_name)
+        if text is None:
+            room = room_manager.get_room(room_name)
+            if room:
+                text = json.dumps({'type': 'spectator_update', 'room_data': room.to_dict()})
+            elif room_manager.draining:
+                # Handed to a new process; watch it there
+                text = json.dumps({'type': 'reconnect'})
+            else:
+                text = json.dumps({'type': 'room_closed'})
+            self.snapshots[room_name] = text
+        return text
+
+    def publish(self, room_name: str) -> None:
+        if room_name not in self.subscribers:
+            return
+        self.snapshots.pop(room_name, None)
+        self.dirty.add(room_name)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def on_room_change(self, room_name: str, room) -> None:
+        # Updates are published by the broadcasts; deletions have none
+        loop = self.loop
+        if room is None and room_name in self.subscribers and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.publish, room_name)
+
+    def flush(self) -> None:
+        self._flush_scheduled = False
+        dirty, self.dirty = self.dirty, set()
+        for room_name in dirty:
+            queues = self.subscribers.get(room_name)
+            if not queues:
+                continue
+            text = self.snapshot(room_name)
+            for queue in queues:
+                queue.put(text, 'spectator_update')
+
+spectators = SpectatorRegistry()
+room_change_listeners.append(spectators.on_room_change)
@@ -1,15 +1,46 @@
+import io
 import json
 import asyncio
+import gc
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import weakref
 from unittest.mock import AsyncMock, patch, MagicMock
-from django.test import TestCase, TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from channels.testing import WebsocketCommunicator
 from channels.db import database_sync_to_async
 from django.urls import reverse
-from django.test.client import Client
-
-from .consumers import GameConsumer
-from .room_manager import room_manager, GameRoom, RoomState
-from .poker_engine import PokerGame, Card, Suit, GameRound, ChipColor
+from django.test.client import AsyncClient, Client, RequestFactory
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+
+from .consumers import GameConsumer, broadcast_to_room
+from .handoff import drain, receive_rooms, send_rooms, serialize_rooms
+from .persistence import RoomStore
+from .replay import ReplayBuffer
+from .sharding import HashRing, ShardRouter, room_for_request
+from .sessions import PlayerRoster
+from .spectators import spectators
+from .timer_wheel import TimerWheel
+from .tracing import tracer
+from .views import _waiters
+from .watchdog import LoopWatchdog
+from .routing import websocket_application, websocket_urlpatterns
+from .expiry import ExpiryScheduler
+from .liveness import LivenessMonitor, liveness
+from .memory import deep_sizeof
+from .metrics import Histogram, family, registry
+from .outbound import OutboundQueue
+from .profiler import ProfilerBusy, profile
+from thegang.log_queue import QueuedHandler, RateLimitFilter
+from thegang.static_assets import StaticAssetIndex, serve_asset
+from .room_manager import room_manager, GameRoom, RoomManager, RoomState
+from .poker_engine import PokerGame, Card, Deck, Suit, GameRound, ChipColor, DECK_CARDS
 from .poker_scoring import PokerHand, HandRank, find_best_hand, check_cooperative_win
 
 
@@ -86,6 +117,210 @@ class RoomManagerTestCase(TestCase):
         self.assertFalse(success)
 
 
+class RoomBudgetTestCase(TestCase):
+    def setUp(self):
+        self.manager = RoomManager()
+        self.budget = self.manager.budget
+
+    def test_room_size_is_measured_and_cached(self):
+        for player in ['alice', 'bob', 'carol']:
+            self.manager.join_room('table', player)
+        waiting = self.budget.room_bytes('table')
+        room = self.manager.get_room('table')
+        room.start_game()
+        started = self.budget.room_bytes('table')
+        self.assertGreater(started, waiting)
+        # Shared card objects are not charged to the room
+        self.assertLess(started - waiting, deep_sizeof(room.poker_game, set()))
+
+        room.poker_game.take_chip_from_public('alice', 1)
+        self.assertEqual(self.budget.room_bytes('table'), started)
+        self.assertEqual(self.budget.total_bytes(), started)
+
+    def test_only_changed_rooms_are_measured_again(self):
+        for i in range(20):
+            self.manager.join_room(f'table{i}', 'alice')
+        self.budget.total_bytes()
+        self.assertEqual(set(self.budget.sizes), set(self.manager.rooms))
+
+        with patch('game.memory.deep_sizeof', wraps=deep_sizeof) as measure:
+            self.manager.join_room('table3', 'bob')
+            self.manager.join_room('new', 'alice')
+            grown = self.budget.total_bytes()
+        measured = [call.args[0].name for call in measure.call_args_list if isinstance(call.args[0], GameRoom)]
+        self.assertEqual(measured, ['table3', 'new'])
+        self.assertEqual(grown, sum(self.budget.sizes.values()))
+
+        table3 = self.budget.sizes['table3']
+        self.manager.delete_room('table3')
+        self.assertEqual(self.budget.total_bytes(), grown - table3)
+        self.assertNotIn('table3', self.budget.sizes)
+
+    def test_only_the_owning_managers_budget_hears_of_changes(self):
+        other = RoomManager()
+        self.manager.join_room('table', 'alice')
+        other.join_room('table', 'alice')
+        self.budget.total_bytes()
+        other.budget.total_bytes()
+
+        other.get_room('table').add_player('bob')
+        other.delete_room('table')
+        self.assertEqual(self.budget._dirty, set())
+        self.assertEqual(set(self.budget.sizes), {'table'})
+
+        # Nothing keeps a discarded manager alive
+        other = weakref.ref(other)
+        gc.collect()
+        self.assertIsNone(other())
+
+    def test_evicts_least_recently_active_idle_rooms(self):
+        self.budget.max_rooms = 3
+        for room_name in ['old', 'busy', 'recent']:
+            self.manager.join_room(room_name, 'alice')
+        self.manager.get_room('old').last_activity -= 100
+        self.manager.get_room('busy').last_activity -= 200
+        self.manager.connect_to_room('busy', 'alice')
+
+        success, _ = self.manager.join_room('new', 'bob')
+        self.assertTrue(success)
+        self.assertEqual(set(self.manager.rooms), {'busy', 'recent', 'new'})
+        self.assertEqual(self.budget.evicted, 1)
+
+    def test_refuses_new_rooms_when_nothing_can_be_evicted(self):
+        self.budget.max_rooms = 1
+        self.manager.join_room('busy', 'alice')
+        self.manager.connect_to_room('busy', 'alice')
+
+        success, message = self.manager.join_room('new', 'bob')
+        self.assertFalse(success)
+        self.assertIn('full', message)
+        self.assertTrue(self.manager.join_room('busy', 'bob')[0])
+        self.assertFalse(self.manager.join_room('other', 'bob')[0])
+        self.assertEqual(self.budget.refused, 2)
+
+
+class SessionIndexTestCase(TestCase):
+    def setUp(self):
+        self.manager = RoomManager()
+
+    def test_roster_keeps_seat_order(self):
+        roster = PlayerRoster(['alice', 'bob', 'carol'])
+        roster.remove('bob')
+        roster.append('dave')
+        roster.append('bob')
+        self.assertEqual(roster, ['alice', 'carol', 'dave', 'bob'])
+        self.assertIn('dave', roster)
+        self.assertEqual(roster[0], 'alice')
+        self.assertEqual(len(roster), 4)
+        with self.assertRaises(ValueError):
+            roster.remove('erin')
+
+    def test_channels_resolve_to_room_and_player(self):
+        self.manager.join_room('table', 'alice')
+        self.manager.join_room('lobby', 'alice')
+        self.manager.connect_to_room('table', 'alice', 'chan-1')
+        self.manager.connect_to_room('lobby', 'alice', 'chan-2')
+        self.assertEqual(self.manager.sessions.lookup('chan-1'), ('table', 'alice'))
+        self.assertEqual(self.manager.sessions.rooms_for('alice'), {'table', 'lobby'})
+
+        # A reconnect replaces the old channel
+        self.manager.connect_to_room('table', 'alice', 'chan-3')
+        self.assertIsNone(self.manager.sessions.lookup('chan-1'))
+        self.manager.disconnect_from_room('table', 'alice', 'chan-1')
+        self.assertEqual(self.manager.sessions.lookup('chan-3'), ('table', 'alice'))
+
+        self.manager.leave_room('lobby', 'alice')
+        self.assertIsNone(self.manager.sessions.lookup('chan-2'))
+        self.manager.delete_room('table')
+        self.assertEqual(len(self.manager.sessions), 0)
+        self.assertEqual(self.manager.sessions.rooms_for('alice'), set())
+
+
+class RoomManagerConcurrencyTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+
+    def test_concurrent_join_burst(self):
+        def join_many(thread_id):
+            for i in range(50):
+                room_manager.join_room(f'room{i % 5}', f't{thread_id}p{i}')
+                room_manager.join_room('shared', f't{thread_id}p{i}')
+
+        threads = [threading.Thread(target=join_many, args=(t,)) for t in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(room_manager.get_room('shared').players), 400)
+        for i in range(5):
+            players = room_manager.get_room(f'room{i}').players
+            self.assertEqual(len(players), 80)
+            self.assertEqual(len(set(players)), 80)
+
+    def test_different_rooms_use_different_stripes(self):
+        stripes = {id(room_manager.lock_for(f'room{i}')) for i in range(200)}
+        self.assertGreater(len(stripes), RoomManager.LOCK_STRIPES // 2)
+
+        lock = room_manager.lock_for('busy')
+        other = next(f'room{i}' for i in range(200) if room_manager.lock_for(f'room{i}') is not lock)
+        acquired = []
+        with lock:
+            thread = threading.Thread(target=lambda: acquired.append(room_manager.join_room(other, 'p1')[0]))
+            thread.start()
+            thread.join(timeout=1)
+        self.assertEqual(acquired, [True])
+
+
+class ExpirySchedulerTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+        self.scheduler = ExpiryScheduler(room_manager, idle_timeout=600)
+        room_manager.expiry, self.original_expiry = self.scheduler, room_manager.expiry
+
+    def tearDown(self):
+        room_manager.expiry = self.original_expiry
+
+    def test_stale_room_expires_at_deadline(self):
+        room_manager.join_room('stale', 'player1')
+        now = time.time()
+        self.assertEqual(self.scheduler.expire_due(now + 300), [])
+        self.assertEqual([e['room'] for e in self.scheduler.due(now + 700)], ['stale'])
+        self.assertIn('stale', room_manager.rooms)
+
+        cleaned = self.scheduler.expire_due(now + 700)
+        self.assertEqual([e['room'] for e in cleaned], ['stale'])
+        self.assertNotIn('stale', room_manager.rooms)
+        self.assertEqual(len(self.scheduler.history), 1)
+
+    def test_active_room_is_rescheduled(self):
+        room_manager.join_room('active', 'player1')
+        room_manager.connect_to_room('active', 'player1')
+        now = time.time()
+        self.assertEqual(self.scheduler.expire_due(now + 700), [])
+        self.assertIn('active', room_manager.rooms)
+        self.assertIn('active', self.scheduler.scheduled)
+
+        room_manager.disconnect_from_room('active', 'player1')
+        self.assertEqual(self.scheduler.expire_due(now + 702)[0]['room'], 'active')
+
+    def test_admin_cleanup_endpoint(self):
+        room_manager.join_room('stale', 'player1')
+        room_manager.get_room('stale').last_activity -= 700
+        self.scheduler.heap[0] = (time.time() - 100, 'stale')
+
+        response = Client().get(reverse('admin_cleanup'))
+        self.assertEqual(response.json()['would_clean'][0]['room'], 'stale')
+        self.assertIn('stale', room_manager.rooms)
+
+        response = Client().post(reverse('admin_cleanup'))
+        self.assertEqual(response.json()['cleaned'][0]['room'], 'stale')
+        self.assertNotIn('stale', room_manager.rooms)
+
+        response = Client(REMOTE_ADDR='10.0.0.5').get(reverse('admin_cleanup'))
+        self.assertEqual(response.status_code, 403)
+
+
 class GameRoomTestCase(TestCase):
     def setUp(self):
         self.room = GameRoom("test_room")
@@ -360,6 +595,260 @@ class PokerEngineTestCase(TestCase):
         self.game.advance_round()
 
 
+class RoomSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manager = RoomManager()
+        for player in ['alice', 'bob', 'carol']:
+            self.manager.join_room('table', player)
+        self.manager.join_room('lobby', 'dave')
+        room = self.manager.get_room('table')
+        room.start_game()
+        room.poker_game.take_chip_from_public('alice', 2)
+        room.poker_game.take_chip_from_player('bob', 'alice')
+        room.session_token('alice')
+
+    def _restored_manager(self):
+        manager = RoomManager()
+        RoomStore(self.directory, manager).restore()
+        return manager
+
+    def test_poker_game_round_trip(self):
+        room = self.manager.get_room('table')
+        game = PokerGame.from_snapshot(room.poker_game.to_snapshot())
+        for player in room.players:
+            self.assertEqual(game.to_dict(player), room.poker_game.to_dict(player))
+        self.assertEqual([str(card) for card in game.deck.cards], [str(card) for card in room.poker_game.deck.cards])
+
+    def test_journal_restores_changed_rooms(self):
+        store = RoomStore(self.directory, self.manager)
+        for room_name in self.manager.rooms:
+            store._on_change(room_name, self.manager.get_room(room_name))
+        self.assertEqual(store.flush(), 2)
+        self.assertFalse(store.snapshot_path.exists())
+
+        restored = self._restored_manager()
+        self.assertEqual(set(restored.rooms), {'table', 'lobby'})
+        original = self.manager.get_room('table')
+        room = restored.get_room('table')
+        self.assertEqual(room.to_dict('alice'), original.to_dict('alice'))
+        self.assertEqual(room.session_tokens, original.session_tokens)
+        self.assertEqual(room.connected_players, set())
+
+        self.manager.delete_room('lobby')
+        store._on_change('lobby', None)
+        store.flush()
+        store.compact()
+        self.assertEqual(store.journal_path.stat().st_size, 0)
+        self.assertEqual(set(self._restored_manager().rooms), {'table'})
+
+    def test_torn_journal_record_is_ignored(self):
+        store = RoomStore(self.directory, self.manager)
+        store._on_change('table', self.manager.get_room('table'))
+        store.flush()
+        with open(store.journal_path, 'ab') as f:
+            f.write(b'\x01\x00\x05lob')
+        self.assertEqual(set(self._restored_manager().rooms), {'table'})
+
+    def test_listener_tracks_only_changed_rooms(self):
+        store = RoomStore(self.directory, self.manager, flush_interval=60)
+        store.enable()
+        try:
+            self.manager.join_room('lobby', 'erin')
+            self.assertEqual(store._dirty, {'lobby'})
+        finally:
+            store.close()
+        self.assertIn('erin', self._restored_manager().get_room('lobby').players)
+
+
+class HandoffTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+        self.application = URLRouter(websocket_urlpatterns)
+
+    def tearDown(self):
+        room_manager.draining = False
+
+    def test_rooms_move_over_socket(self):
+        source = RoomManager()
+        for player in ['alice', 'bob', 'carol']:
+            source.join_room('table', player)
+        source.get_room('table').start_game()
+        source.get_room('table').session_token('alice')
+        source.join_room('lobby', 'dave')
+
+        target = RoomManager()
+        socket_path = os.path.join(tempfile.mkdtemp(), 'handoff.sock')
+        completed = []
+        thread = receive_rooms(socket_path, target, on_complete=lambda: completed.append(True))
+        self.assertEqual(send_rooms(socket_path, serialize_rooms(source)), 2)
+        thread.join(timeout=5)
+
+        self.assertEqual(completed, [True])
+        self.assertEqual(set(target.rooms), {'table', 'lobby'})
+        room = target.get_room('table')
+        self.assertEqual(room.to_dict('alice'), source.get_room('table').to_dict('alice'))
+        self.assertEqual(room.session_tokens, source.get_room('table').session_tokens)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_no_rooms_are_created_while_waiting_for_the_handoff(self):
+        source = RoomManager()
+        source.join_room('table', 'alice')
+        source.join_room('lobby', 'bob')
+
+        target = RoomManager()
+        target.join_room('lobby', 'carol')
+        socket_path = os.path.join(tempfile.mkdtemp(), 'handoff.sock')
+        thread = receive_rooms(socket_path, target)
+        self.assertEqual(target.join_room('table', 'dave'), (False, "Server is restarting, please try again shortly"))
+        self.assertTrue(target.join_room('lobby', 'dave')[0])
+        send_rooms(socket_path, serialize_rooms(source))
+        thread.join(timeout=5)
+
+        self.assertEqual(target.get_room('table').players, ['alice'])
+        self.assertEqual(target.get_room('lobby').players, ['carol', 'dave'])
+        self.assertFalse(target.awaiting_handoff)
+        self.assertTrue(target.join_room('fresh', 'erin')[0])
+
+    async def test_handed_off_rooms_are_deleted(self):
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('handoff', player)
+        alice = WebsocketCommunicator(self.application, '/ws/game/handoff/alice/')
+        await alice.connect()
+        self.assertEqual((await alice.receive_json_from())['type'], 'session')
+        watcher = WebsocketCommunicator(self.application, '/ws/spectate/handoff/')
+        await watcher.connect()
+        self.assertEqual((await watcher.receive_json_from())['type'], 'spectator_update')
+        room_manager.budget.total_bytes()
+
+        target = RoomManager()
+        socket_path = os.path.join(tempfile.mkdtemp(), 'handoff.sock')
+        thread = await asyncio.to_thread(receive_rooms, socket_path, target)
+        report = await drain(socket_path)
+        await asyncio.to_thread(thread.join, 5)
+
+        self.assertEqual(report, {'rooms': 1, 'handed_off': 1})
+        self.assertEqual(set(target.rooms), {'handoff'})
+        self.assertIsNone(room_manager.get_room('handoff'))
+        self.assertNotIn('handoff', room_manager.sessions.rooms_for('alice'))
+        room_manager.budget.total_bytes()
+        self.assertNotIn('handoff', room_manager.budget.sizes)
+        self.assertEqual(await watcher.receive_json_from(), {'type': 'reconnect'})
+        await alice.disconnect(code=1006)
+        await watcher.disconnect()
+
+    def test_bad_handoff_still_completes(self):
+        target = RoomManager()
+        socket_path = os.path.join(tempfile.mkdtemp(), 'handoff.sock')
+        completed = []
+        thread = receive_rooms(socket_path, target, on_complete=lambda: completed.append(True))
+        self.assertEqual(os.stat(socket_path).st_mode & 0o777, 0o600)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(b'not a handoff record at all')
+        thread.join(timeout=5)
+        self.assertEqual(completed, [True])
+        self.assertEqual(target.rooms, {})
+
+    def test_socket_directory_must_be_private(self):
+        directory = tempfile.mkdtemp()
+        os.chmod(directory, 0o777)
+        with self.assertRaises(PermissionError):
+            receive_rooms(os.path.join(directory, 'handoff.sock'), RoomManager())
+
+    async def test_drain_sends_clients_away(self):
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('handoff', player)
+        alice = WebsocketCommunicator(self.application, '/ws/game/handoff/alice/')
+        await alice.connect()
+        self.assertEqual((await alice.receive_json_from())['type'], 'session')
+
+        report = await drain()
+        self.assertEqual(report, {'rooms': 1, 'handed_off': 0})
+        while (message := await alice.receive_output())['type'] == 'websocket.send':
+            last = json.loads(message['text'])
+        self.assertEqual(last, {'type': 'reconnect'})
+        self.assertEqual(message, {'type': 'websocket.close', 'code': 4001})
+        self.assertEqual(room_manager.get_room('handoff').players, ['alice', 'bob', 'carol'])
+        self.assertEqual(room_manager.join_room('fresh', 'dave')[0], False)
+        self.assertIsNone(room_manager.get_room('fresh'))
+
+
+class StaticAssetsTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'js'))
+        with open(os.path.join(self.root, 'js', 'main.0123abcd.js'), 'w') as f:
+            f.write('console.log("the gang");\n' * 200)
+        self.blob = os.urandom(4096)
+        with open(os.path.join(self.root, 'blob.bin'), 'wb') as f:
+            f.write(self.blob)
+        self.index = StaticAssetIndex(self.root, manifest=None, max_cached_bytes=1024)
+        self.index.refresh()
+        self.factory = RequestFactory()
+
+    def _get(self, name, **headers):
+        return serve_asset(self.factory.get(f'/static/{name}', headers=headers), self.index.get(name))
+
+    def test_hashed_bundle_is_precompressed_and_immutable(self):
+        response = self._get('js/main.0123abcd.js', accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertLess(len(response.content), self.index.get('js/main.0123abcd.js').size)
+
+        plain = self._get('js/main.0123abcd.js')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+
+        not_modified = self._get('js/main.0123abcd.js', accept_encoding='gzip', if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIsNone(self.index.get('../tests.py'))
+
+    def test_app_shell_gets_preload_hints_and_reloads(self):
+        build = tempfile.mkdtemp()
+        with open(os.path.join(build, 'index.html'), 'w') as f:
+            f.write('<!doctype html><html><head><title>The Gang</title>'
+                    '<script defer="defer" src="/static/js/main.0123abcd.js"></script>'
+                    '<link href="/static/css/main.89abcdef.css" rel="stylesheet"></head>'
+                    '<body><div id="root"></div></body></html>')
+        with open(os.path.join(build, 'asset-manifest.json'), 'w') as f:
+            f.write('{}')
+        index = StaticAssetIndex(build, check_interval=0)
+        index.refresh()
+
+        shell = index.get('index.html')
+        self.assertEqual(shell.cache_control, 'no-cache')
+        self.assertIn(b'<head><link rel="preload" href="/static/js/main.0123abcd.js" as="script">'
+                      b'<link rel="preload" href="/static/css/main.89abcdef.css" as="style"><title>', shell.body)
+        self.assertIn('gzip', shell.encoded)
+
+        with open(os.path.join(build, 'index.html'), 'w') as f:
+            f.write('<html><head></head><body>rebuilt</body></html>')
+        self.assertIs(index.get('index.html'), shell)
+        os.utime(os.path.join(build, 'asset-manifest.json'), ns=(0, 0))
+        # Re-indexing runs in a thread; requests are served from the old index meanwhile
+        index.refresh_if_changed().join()
+        self.assertIn(b'rebuilt', index.get('index.html').body)
+
+    async def _body(self, response):
+        self.assertTrue(response.is_async)
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_large_files_stream_with_ranges(self):
+        response = self._get('blob.bin')
+        self.assertEqual(response['Content-Length'], '4096')
+        self.assertEqual(await self._body(response), self.blob)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        partial = self._get('blob.bin', range='bytes=100-199')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], 'bytes 100-199/4096')
+        self.assertEqual(await self._body(partial), self.blob[100:200])
+        self.assertEqual(await self._body(self._get('blob.bin', range='bytes=-10')), self.blob[-10:])
+        self.assertEqual(self._get('blob.bin', range='bytes=5000-').status_code, 416)
+
+
 class APIViewTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -407,6 +896,219 @@ class APIViewTestCase(TestCase):
         self.assertIn('error', data)
 
 
+class RoomStatusTestCase(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        room_manager.rooms.clear()
+        room_manager.join_room('status', 'alice')
+
+    async def test_unchanged_room_returns_304(self):
+        response = await self.client.get('/api/api/room-status/status/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['room_data']['players'], ['alice'])
+        etag = response['ETag']
+
+        response = await self.client.get('/api/api/room-status/status/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        room_manager.join_room('status', 'bob')
+        response = await self.client.get('/api/api/room-status/status/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['room_data']['players'], ['alice', 'bob'])
+
+    async def test_long_poll_returns_on_change(self):
+        etag = (await self.client.get('/api/api/room-status/status/'))['ETag']
+        poll = asyncio.ensure_future(self.client.get(
+            '/api/api/room-status/status/?wait=5', headers={'If-None-Match': etag}))
+        await asyncio.sleep(0.05)
+        self.assertFalse(poll.done())
+        room_manager.join_room('status', 'bob')
+        response = await asyncio.wait_for(poll, 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('bob', response.json()['room_data']['players'])
+
+    async def test_long_poll_times_out_with_304(self):
+        etag = (await self.client.get('/api/api/room-status/status/'))['ETag']
+        response = await self.client.get('/api/api/room-status/status/?wait=0.05', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('status', _waiters)
+
+    async def test_changes_from_other_threads_wake_every_poll(self):
+        etag = (await self.client.get('/api/api/room-status/status/'))['ETag']
+        polls = [asyncio.ensure_future(self.client.get(
+            '/api/api/room-status/status/?wait=5', headers={'If-None-Match': etag})) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        await asyncio.gather(*(asyncio.to_thread(room_manager.join_room, 'status', f'player{i}') for i in range(8)))
+        responses = await asyncio.wait_for(asyncio.gather(*polls), 2)
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertNotIn('status', _waiters)
+
+
+class LogQueueTestCase(TestCase):
+    def _record(self, level=logging.INFO, lineno=10):
+        return logging.LogRecord('game', level, 'game/consumers.py', lineno, 'connected %s', ('alice',), None)
+
+    def test_rate_limit_bursts_then_samples(self):
+        rate_limit = RateLimitFilter(burst=3, period=60, sample_every=5)
+        passed = [rate_limit.filter(self._record()) for _ in range(13)]
+        self.assertEqual(passed, [True] * 3 + [False] * 4 + [True] + [False] * 4 + [True])
+        self.assertTrue(rate_limit.filter(self._record(lineno=11)))
+        self.assertTrue(rate_limit.filter(self._record(level=logging.WARNING)))
+
+        rate_limit.sites[('game/consumers.py', 10)][0] -= 60
+        record = self._record()
+        self.assertTrue(rate_limit.filter(record))
+        self.assertEqual(record.getMessage(), 'connected alice [8 similar messages suppressed]')
+
+    def test_records_are_formatted_on_the_writer_thread(self):
+        formatted_on = []
+
+        class Recorder(logging.Formatter):
+            def format(self, record):
+                formatted_on.append(threading.current_thread())
+                return super().format(record)
+
+        stream = io.StringIO()
+        handler = QueuedHandler(stream=stream)
+        handler.setFormatter(Recorder('%(message)s'))
+        handler.handle(self._record())
+        handler.close()
+        self.assertEqual(stream.getvalue(), 'connected alice\n')
+        self.assertEqual(len(formatted_on), 1)
+        self.assertIsNot(formatted_on[0], threading.current_thread())
+
+
+class LoopWatchdogTestCase(TestCase):
+    def _block_in_scoring(self):
+        time.sleep(0.2)
+
+    async def test_stall_reports_stack_and_handler(self):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+        consumer = MagicMock(room_name='stalled', player_name='alice')
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            watchdog.track(consumer, 'websocket_receive')
+            consumer.message_type = 'advance_round'
+            with self.assertLogs('game.watchdog', 'WARNING') as logs:
+                self._block_in_scoring()
+                await asyncio.sleep(0.1)
+        finally:
+            watchdog.stop()
+
+        stall = watchdog.stalls[-1]
+        self.assertGreater(stall['duration'], 0.1)
+        self.assertEqual((stall['handler'], stall['message_type'], stall['room']),
+                         ('websocket_receive', 'advance_round', 'stalled'))
+        self.assertIn('_block_in_scoring', stall['stack'])
+        self.assertIn('advance_round', logs.output[0])
+
+    async def test_unknown_message_types_get_a_fixed_label(self):
+        consumer = GameConsumer()
+        consumer.room_name, consumer.player_name, consumer.channel_name = 'stalled', 'alice', 'test.channel'
+        await consumer.receive(json.dumps({'type': 'made_up\n"label"'}))
+        self.assertEqual(consumer.message_type, 'unknown')
+
+    async def test_no_stall_reported_for_a_responsive_loop(self):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+        watchdog.start()
+        try:
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+        finally:
+            watchdog.stop()
+        self.assertEqual(len(watchdog.stalls), 0)
+
+
+class ProfilerTestCase(TestCase):
+    def test_samples_game_frames_from_other_threads(self):
+        stop = threading.Event()
+        cards = [Card(rank, Suit.HEARTS) for rank in range(2, 9)]
+
+        def score_hands():
+            while not stop.is_set():
+                find_best_hand(cards)
+
+        worker = threading.Thread(target=score_hands, name='scorer')
+        worker.start()
+        try:
+            result = profile(0.1, interval=0.002, module_prefix='game')
+        finally:
+            stop.set()
+            worker.join()
+
+        lines = [line for line in result.collapsed().splitlines() if line.startswith('scorer;')]
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('scorer;game.tests:'))
+        self.assertIn('game.poker_scoring:find_best_hand', stack)
+        self.assertTrue(all(frame.startswith('game.') for frame in stack.split(';')[1:]))
+        self.assertGreater(int(count), 0)
+        self.assertGreater(result.filtered, 0)
+
+    def test_one_profile_at_a_time(self):
+        thread = threading.Thread(target=profile, args=(0.2,))
+        thread.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(ProfilerBusy):
+                profile(0.01)
+        finally:
+            thread.join()
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        room_manager.rooms.clear()
+        room_manager.join_room('metrics', 'alice')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1.0), labelnames=('kind',))
+        registry.remove(histogram)
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value, 'a')
+        lines = histogram.collect()
+        self.assertIn('test_seconds_bucket{kind="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{kind="a",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{kind="a",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{kind="a"} 4', lines)
+
+    def test_label_values_are_escaped(self):
+        lines = family('test_rooms', 'gauge', 'Test gauge', {('a"b\\c\nd',): 1}, ('room',))
+        self.assertEqual(lines[-1], 'test_rooms{room="a\\"b\\\\c\\nd"} 1')
+
+    async def test_metrics_endpoint(self):
+        response = await self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('thegang_rooms{state="waiting"} 1', body)
+        self.assertIn('# TYPE thegang_handler_seconds histogram', body)
+        self.assertIn('thegang_connected_sockets{kind="player"}', body)
+        self.assertIn('process_cpu_seconds_total', body)
+
+    async def test_room_budget_totals_are_exported_without_measuring(self):
+        budget = room_manager.budget
+        budget.total_bytes()
+        with patch('game.memory.deep_sizeof') as measure:
+            body = (await self.client.get('/metrics')).content.decode()
+        measure.assert_not_called()
+        self.assertIn(f'thegang_room_memory_bytes {budget.bytes}', body)
+        self.assertIn(f'thegang_room_memory_rooms {len(budget.sizes)}', body)
+        self.assertIn(f'thegang_room_budget_limit{{resource="rooms"}} {budget.max_rooms}', body)
+        self.assertIn(f'thegang_room_evictions_total {budget.evicted}', body)
+        self.assertIn(f'thegang_room_refusals_total {budget.refused}', body)
+
+    def test_metrics_require_admin(self):
+        client = Client(REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        with override_settings(ADMIN_TOKEN='secret'):
+            response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+
 class WebSocketConsumerTestCase(TestCase):
     def setUp(self):
         room_manager.rooms.clear()
@@ -433,6 +1135,544 @@ class WebSocketConsumerTestCase(TestCase):
         self.assertTrue(success)
 
 
+class OutboundQueueTestCase(TestCase):
+    async def test_latest_state_wins(self):
+        sent = []
+        queue = OutboundQueue(AsyncMock(side_effect=sent.append), AsyncMock())
+        queue.put('update-1', 'game_update')
+        queue.put('error', None)
+        queue.put('update-2', 'game_update')
+        self.assertEqual(list(queue.pending), [('error', None, None), ('update-2', 'game_update', None)])
+        self.assertEqual(queue.superseded, 1)
+
+        queue.start()
+        await asyncio.sleep(0)
+        self.assertEqual(sent, ['error', 'update-2'])
+        self.assertIsNone(queue.behind_since)
+        await queue.stop()
+
+    async def test_depth_is_bounded(self):
+        queue = OutboundQueue(AsyncMock(), AsyncMock(), max_depth=3)
+        for i in range(5):
+            queue.put(f'message-{i}')
+        self.assertEqual(queue.depth(), 3)
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(queue.pending[0][0], 'message-2')
+
+    async def test_slow_consumer_is_disconnected(self):
+        on_slow = AsyncMock()
+        queue = OutboundQueue(AsyncMock(), on_slow, max_lag=5.0)
+        queue.put('message-1')
+        queue.behind_since -= 10
+        self.assertFalse(queue.put('message-2'))
+        await asyncio.sleep(0)
+        on_slow.assert_awaited_once()
+        self.assertTrue(queue.closed)
+        self.assertEqual(queue.depth(), 0)
+
+    async def test_window_holds_frames_until_acknowledged(self):
+        sent = []
+        # Returns at once, like daphne handing the frame to the transport
+        queue = OutboundQueue(AsyncMock(side_effect=sent.append), AsyncMock(), window=2)
+        queue.start()
+        for i in range(4):
+            queue.put(f'update-{i}', 'game_update')
+            await asyncio.sleep(0)
+        self.assertEqual(sent, ['update-0', 'update-1'])
+        self.assertEqual([text for text, _, _ in queue.pending], ['update-3'])
+
+        queue.ack(1)
+        await asyncio.sleep(0)
+        self.assertEqual(sent, ['update-0', 'update-1', 'update-3'])
+        await queue.stop()
+
+    async def test_unacknowledged_client_is_disconnected(self):
+        on_slow = AsyncMock()
+        queue = OutboundQueue(AsyncMock(), on_slow, max_lag=5.0, window=4)
+        queue.start()
+        queue.put('message-1')
+        await asyncio.sleep(0)
+        self.assertEqual(queue.depth(), 0)
+        queue.in_flight[0] -= 10
+        self.assertFalse(queue.put('message-2'))
+        await asyncio.sleep(0)
+        on_slow.assert_awaited_once()
+        await queue.stop()
+
+    @override_settings(OUTBOUND_ACK_WINDOW=2, OUTBOUND_QUEUE_MAX_LAG=0.2)
+    async def test_reader_that_stops_reading_is_disconnected(self):
+        room_manager.rooms.clear()
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('stalled', player)
+        room = room_manager.get_room('stalled')
+        room.start_game()
+        alice = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/stalled/alice/?ack=1')
+        connected, _ = await alice.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await alice.receive_json_from())['type'], 'session')
+        self.assertEqual((await alice.receive_json_from())['type'], 'game_update')
+
+        await alice.send_json_to({'type': 'ack', 'received': 2})
+
+        # The client stops acking: only the window goes out, the rest waits on the server
+        for player, chip in (('alice', 1), ('bob', 2), ('carol', 3)):
+            room.poker_game.take_chip_from_public(player, chip)
+            await broadcast_to_room(get_channel_layer(), 'stalled', 'game_update', room.to_dict('alice'), 'alice')
+        self.assertEqual(len((await alice.receive_json_from())['room_data']['poker_game']['player_chips']), 1)
+        self.assertEqual(len((await alice.receive_json_from())['room_data']['poker_game']['player_chips']), 2)
+        self.assertTrue(await alice.receive_nothing(0.05))
+
+        await asyncio.sleep(0.25)
+        await broadcast_to_room(get_channel_layer(), 'stalled', 'game_update', room.to_dict('alice'), 'alice')
+        self.assertEqual(await alice.receive_output(), {'type': 'websocket.close', 'code': 4008})
+        await alice.disconnect()
+
+
+class ReplayBufferTestCase(TestCase):
+    def test_since_filters_by_player(self):
+        buffer = ReplayBuffer()
+        buffer.record('room_update', 'all-1')
+        buffer.record('game_update', 'alice-2', 'alice')
+        buffer.record('game_update', 'bob-3', 'bob')
+        self.assertEqual([e.text for e in buffer.since(1, 'alice')], ['alice-2'])
+        self.assertEqual([e.text for e in buffer.since(0, 'bob')], ['all-1', 'bob-3'])
+        self.assertEqual(buffer.since(3, 'bob'), [])
+
+    def test_since_reports_gaps(self):
+        buffer = ReplayBuffer(size=2)
+        for i in range(4):
+            buffer.record('notice', f'notice-{i}')
+        self.assertIsNone(buffer.since(1, 'alice'))
+        self.assertEqual(len(buffer.since(2, 'alice')), 2)
+        self.assertIsNone(buffer.since(10, 'alice'))
+        self.assertIsNone(ReplayBuffer(last_seq=5).since(3, 'alice'))
+
+    def test_only_latest_state_is_kept(self):
+        buffer = ReplayBuffer()
+        for i in range(100):
+            buffer.record('game_update', f'alice-{i}', 'alice')
+            buffer.record('game_update', f'bob-{i}', 'bob')
+        buffer.record('room_update', 'all')
+        self.assertEqual(len(buffer.latest), 3)
+        self.assertEqual([e.text for e in buffer.since(0, 'alice')], ['alice-99', 'all'])
+        self.assertEqual([e.text for e in buffer.since(199, 'alice')], ['all'])
+
+
+class ReconnectTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def _connect(self, player, query=''):
+        communicator = WebsocketCommunicator(self.application, f'/ws/game/resume/{player}/{query}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_resume_replays_only_missed_updates(self):
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('resume', player)
+        room = room_manager.get_room('resume')
+        room.start_game()
+
+        alice = await self._connect('alice')
+        session = await alice.receive_json_from()
+        self.assertEqual(session['type'], 'session')
+        initial = await alice.receive_json_from()
+        self.assertEqual(initial['type'], 'game_update')
+        await alice.disconnect(code=1006)
+        self.assertIn('alice', room.players)
+
+        room.poker_game.take_chip_from_public('bob', 1)
+        await broadcast_to_room(get_channel_layer(), 'resume', 'game_update', room.to_dict('alice'), 'alice')
+        await broadcast_to_room(get_channel_layer(), 'resume', 'game_update', room.to_dict('bob'), 'bob')
+
+        alice = await self._connect('alice', f"?session={session['session']}&last_seq={initial['seq']}")
+        self.assertEqual((await alice.receive_json_from())['type'], 'session')
+        missed = await alice.receive_json_from()
+        self.assertEqual(missed['room_data']['poker_game']['player_chips'], {'bob': 1})
+        self.assertTrue(await alice.receive_nothing())
+        await alice.disconnect(code=1000)
+
+    async def test_seat_held_after_abnormal_close(self):
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('resume', player)
+        room = room_manager.get_room('resume')
+        room.start_game()
+
+        alice = await self._connect('alice')
+        session = (await alice.receive_json_from())['session']
+        await alice.disconnect(code=1006)
+        self.assertIn('alice', room.players)
+        self.assertIn('alice', room.seat_holds)
+
+        alice = await self._connect('alice', f'?session={session}')
+        self.assertNotIn('alice', room.seat_holds)
+        self.assertIn('alice', room.connected_players)
+        await alice.disconnect(code=1000)
+
+    async def test_seated_name_without_session_is_refused(self):
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('resume', player)
+        room = room_manager.get_room('resume')
+        room.start_game()
+
+        alice = await self._connect('alice')
+        token = (await alice.receive_json_from())['session']
+        channel = room.player_channels['alice']
+
+        for query in ('', '?session=guess'):
+            impostor = await self._connect('alice', query)
+            self.assertEqual(await impostor.receive_json_from(),
+                             {'type': 'join_error', 'message': 'Player alice is already in the room'})
+            self.assertEqual((await impostor.receive_output())['code'], 4003)
+            await impostor.disconnect(code=1006)
+        self.assertEqual(room.player_channels['alice'], channel)
+        self.assertEqual(room.session_tokens['alice'], token)
+        self.assertIn('alice', room.connected_players)
+        await alice.disconnect(code=1000)
+
+
+class TracingTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+        tracer.recent.clear()
+        tracer.open.clear()
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def _start_game(self):
+        communicators = {}
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('traced', player)
+        room_manager.get_room('traced').start_game()
+        for player in ['alice', 'bob', 'carol']:
+            communicator = WebsocketCommunicator(self.application, f'/ws/game/traced/{player}/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            communicators[player] = communicator
+        for communicator in communicators.values():
+            while (await communicator.receive_json_from())['type'] != 'game_update':
+                pass
+        return communicators
+
+    async def test_trace_follows_action_to_every_send(self):
+        communicators = await self._start_game()
+        with patch.object(tracer, 'sample_rate', 1.0):
+            await communicators['alice'].send_json_to({'type': 'take_chip_public', 'chip_number': 1})
+            for communicator in communicators.values():
+                self.assertEqual((await communicator.receive_json_from())['type'], 'game_update')
+        await asyncio.sleep(0.05)
+
+        trace = tracer.traces(limit=1)[0]
+        self.assertFalse(trace['incomplete'])
+        root = trace['root']
+        self.assertEqual(root['name'], 'receive')
+        self.assertEqual(root['attrs']['message_type'], 'take_chip_public')
+        names = [child['name'] for child in root['children']]
+        self.assertIn('PokerGame.take_chip_from_public', names)
+        self.assertIn('GameRoom.to_dict', names)
+        broadcasts = [child for child in root['children'] if child['name'] == 'broadcast']
+        self.assertEqual(len(broadcasts), 3)
+        delivered = []
+        for broadcast in broadcasts:
+            self.assertEqual([child['name'] for child in broadcast['children'][:2]], ['json.dumps', 'group_send'])
+            for deliver in broadcast['children'][2:]:
+                self.assertEqual([child['name'] for child in deliver['children']],
+                                 ['channel_layer', 'queue_wait', 'send'])
+                delivered.append(deliver['attrs']['player'])
+        self.assertEqual(sorted(delivered), ['alice', 'bob', 'carol'])
+
+        for communicator in communicators.values():
+            await communicator.disconnect(code=1000)
+
+    async def test_unsampled_messages_are_not_traced(self):
+        communicators = await self._start_game()
+        await communicators['alice'].send_json_to({'type': 'take_chip_public', 'chip_number': 1})
+        await communicators['alice'].receive_json_from()
+        self.assertEqual(len(tracer.recent), 0)
+        self.assertEqual(tracer.open, {})
+        for communicator in communicators.values():
+            await communicator.disconnect(code=1000)
+
+
+class HandshakeJoinTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def _join(self, player):
+        communicator = WebsocketCommunicator(self.application, f'/ws/game/handshake/{player}/?join=1')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_first_frame_carries_state_and_session(self):
+        alice = await self._join('alice')
+        first = await alice.receive_json_from()
+        self.assertEqual(first['type'], 'room_update')
+        self.assertEqual(first['room_data']['players'], ['alice'])
+        self.assertEqual(first['session'], room_manager.get_room('handshake').session_tokens['alice'])
+        self.assertTrue(await alice.receive_nothing())
+
+        bob = await self._join('bob')
+        self.assertEqual((await bob.receive_json_from())['room_data']['players'], ['alice', 'bob'])
+        self.assertTrue(await bob.receive_nothing())
+        self.assertEqual((await alice.receive_json_from())['room_data']['players'], ['alice', 'bob'])
+        await alice.disconnect(code=1000)
+        await bob.disconnect(code=1000)
+
+    async def test_refused_join_closes_with_reason(self):
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('handshake', player)
+        room_manager.get_room('handshake').start_game()
+
+        dave = await self._join('dave')
+        self.assertEqual((await dave.receive_json_from())['type'], 'join_error')
+        self.assertEqual((await dave.receive_output())['code'], 4003)
+        self.assertNotIn('dave', room_manager.get_room('handshake').players)
+
+    async def _connect(self, player, query):
+        communicator = WebsocketCommunicator(self.application, f'/ws/game/handshake/{player}/{query}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_seat_is_only_rejoined_with_its_session(self):
+        alice = await self._join('alice')
+        token = (await alice.receive_json_from())['session']
+        channel = room_manager.get_room('handshake').player_channels['alice']
+
+        # With or without join=1, taking a seated name needs its session token
+        for query in ('?join=1', '', '?join=1&session=guess', '?session=guess'):
+            impostor = await self._connect('alice', query)
+            self.assertEqual(await impostor.receive_json_from(),
+                             {'type': 'join_error', 'message': 'Player alice is already in the room'})
+            self.assertEqual((await impostor.receive_output())['code'], 4003)
+            await impostor.disconnect(code=1006)
+        self.assertEqual(room_manager.get_room('handshake').player_channels['alice'], channel)
+
+        rejoin = await self._connect('alice', f'?join=1&session={token}')
+        first = await rejoin.receive_json_from()
+        self.assertEqual(first['type'], 'room_update')
+        self.assertEqual(first['session'], token)
+        resume = await self._connect('alice', f'?session={token}')
+        self.assertEqual(await resume.receive_json_from(), {'type': 'session', 'session': token, 'seq': first['seq']})
+        await alice.disconnect(code=1006)
+        await rejoin.disconnect(code=1006)
+        await resume.disconnect(code=1000)
+
+
+class LeanProfileTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+
+    def test_auth_middleware_is_optional(self):
+        self.assertNotIsInstance(websocket_application(), URLRouter)
+        with override_settings(WEBSOCKET_AUTH=False):
+            self.assertIsInstance(websocket_application(), URLRouter)
+
+    async def test_lean_connect_never_leaves_the_event_loop(self):
+        with override_settings(WEBSOCKET_AUTH=False):
+            application = websocket_application()
+        with patch('channels.db.close_old_connections') as close_old_connections:
+            communicator = WebsocketCommunicator(application, '/ws/game/lean/alice/?join=1')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual((await communicator.receive_json_from())['type'], 'room_update')
+            await communicator.disconnect(code=1000)
+        close_old_connections.assert_not_called()
+
+
+class TimerWheelTestCase(TestCase):
+    def test_expires_after_timeout(self):
+        wheel = TimerWheel(tick=1.0, slots=8)
+        wheel.schedule('a', 2)
+        wheel.schedule('b', 3)
+        self.assertEqual(wheel.advance(), [])
+        self.assertEqual(wheel.advance(), ['a'])
+        self.assertEqual(wheel.advance(), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_reschedule_and_cancel(self):
+        wheel = TimerWheel(tick=1.0, slots=8)
+        wheel.schedule('a', 1)
+        wheel.schedule('a', 3)
+        wheel.schedule('b', 1)
+        self.assertTrue(wheel.cancel('b'))
+        self.assertEqual(wheel.advance(), [])
+        self.assertEqual(wheel.advance(), [])
+        self.assertEqual(wheel.advance(), ['a'])
+
+    def test_timeout_longer_than_one_turn(self):
+        wheel = TimerWheel(tick=1.0, slots=4)
+        wheel.schedule('a', 6)
+        expired = [wheel.advance() for _ in range(6)]
+        self.assertEqual(expired, [[], [], [], [], [], ['a']])
+
+
+class LivenessMonitorTestCase(TestCase):
+    async def test_idle_connection_expires(self):
+        monitor = LivenessMonitor(timeout=2)
+        on_expire = AsyncMock()
+        monitor.register('conn', on_expire)
+        start = monitor._last_tick
+
+        monitor.expire_due(start + 1)
+        monitor.touch('conn')
+        self.assertEqual(monitor.expire_due(start + 2), [])
+        self.assertEqual(monitor.expire_due(start + 3), ['conn'])
+        await asyncio.sleep(0)
+        on_expire.assert_awaited_once()
+        self.assertNotIn('conn', monitor.callbacks)
+
+    async def test_only_pinging_clients_are_watched(self):
+        room_manager.rooms.clear()
+        room_manager.join_room('quiet', 'alice')
+        application = URLRouter(websocket_urlpatterns)
+        alice = WebsocketCommunicator(application, '/ws/game/quiet/alice/')
+        spectator = WebsocketCommunicator(application, '/ws/spectate/quiet/')
+        await alice.connect()
+        await spectator.connect()
+        self.assertEqual(len(liveness.callbacks), 0)
+
+        await alice.send_json_to({'type': 'ping'})
+        while (await alice.receive_json_from())['type'] != 'pong':
+            pass
+        self.assertEqual(len(liveness.callbacks), 1)
+        await alice.disconnect()
+        await spectator.disconnect()
+        self.assertEqual(len(liveness.callbacks), 0)
+
+
+class SpectatorTestCase(TestCase):
+    def setUp(self):
+        room_manager.rooms.clear()
+        spectators.subscribers.clear()
+        spectators.snapshots.clear()
+        self.application = URLRouter(websocket_urlpatterns)
+        for player in ['alice', 'bob', 'carol']:
+            room_manager.join_room('table', player)
+        self.room = room_manager.get_room('table')
+        self.room.start_game()
+
+    async def test_publish_encodes_once_for_all_spectators(self):
+        queues = [OutboundQueue(AsyncMock(), AsyncMock()) for _ in range(3)]
+        for queue in queues:
+            spectators.subscribe('table', queue)
+        with patch('game.spectators.json.dumps', wraps=json.dumps) as dumps:
+            spectators.publish('table')
+            spectators.publish('table')
+            await asyncio.sleep(0)
+        self.assertEqual(dumps.call_count, 1)
+        texts = {queue.pending[0][0] for queue in queues}
+        self.assertEqual(len(texts), 1)
+        for queue in queues:
+            spectators.unsubscribe('table', queue)
+        self.assertEqual(spectators.count(), 0)
+
+    async def test_spectator_sees_public_state_only(self):
+        spectator = WebsocketCommunicator(self.application, '/ws/spectate/table/')
+        connected, _ = await spectator.connect()
+        self.assertTrue(connected)
+        initial = await spectator.receive_json_from()
+        self.assertEqual(initial['type'], 'spectator_update')
+        self.assertEqual(initial['room_data']['poker_game']['pocket_cards'], [])
+        self.assertNotIn('spectator', self.room.players)
+
+        self.room.poker_game.take_chip_from_public('alice', 2)
+        await broadcast_to_room(get_channel_layer(), 'table', 'game_update', self.room.to_dict('alice'), 'alice')
+        update = await spectator.receive_json_from()
+        self.assertEqual(update['room_data']['poker_game']['player_chips'], {'alice': 2})
+        self.assertEqual(update['room_data']['poker_game']['pocket_cards'], [])
+        await spectator.disconnect()
+        self.assertEqual(spectators.count('table'), 0)
+
+    async def test_deleting_the_room_closes_it_for_spectators(self):
+        spectator = WebsocketCommunicator(self.application, '/ws/spectate/table/')
+        await spectator.connect()
+        self.assertEqual((await spectator.receive_json_from())['type'], 'spectator_update')
+        # Expiry and eviction delete rooms off the event loop
+        await asyncio.to_thread(room_manager.delete_room, 'table')
+        self.assertEqual(await spectator.receive_json_from(), {'type': 'room_closed'})
+        await spectator.disconnect()
+
+
+class ShardingTestCase(TestCase):
+    def test_hash_ring_is_stable_and_spread(self):
+        ring = HashRing(['w0', 'w1', 'w2'])
+        owners = {ring.node_for(f'room{i}') for i in range(200)}
+        self.assertEqual(owners, {'w0', 'w1', 'w2'})
+        self.assertEqual(ring.node_for('abc'), HashRing(['w0', 'w1', 'w2']).node_for('abc'))
+
+    def test_adding_a_worker_moves_few_rooms(self):
+        before = HashRing(['w0', 'w1', 'w2'])
+        after = HashRing(['w0', 'w1', 'w2', 'w3'])
+        moved = sum(before.node_for(f'room{i}') != after.node_for(f'room{i}') for i in range(1000))
+        self.assertLess(moved, 400)
+
+    def test_room_for_request(self):
+        self.assertEqual(room_for_request('/ws/game/table1/alice/'), 'table1')
+        self.assertEqual(room_for_request('/ws/spectate/table1/'), 'table1')
+        self.assertEqual(room_for_request('/api/api/room-status/table1/?wait=1'), 'table1')
+        self.assertEqual(room_for_request('/api/api/join-room/', b'{"room_name": " table1 "}'), 'table1')
+        self.assertIsNone(room_for_request('/api/api/join-room/', b'not json'))
+        self.assertIsNone(room_for_request('/static/js/main.js'))
+
+    async def _route(self, *requests):
+        """Send each raw request through a router in front of three echoing workers"""
+        socket_dir = tempfile.mkdtemp()
+        socket_paths = [os.path.join(socket_dir, f'w{i}.sock') for i in range(3)]
+
+        def backend(name):
+            async def handle(reader, writer):
+                head = await reader.readuntil(b'\r\n\r\n')
+                writer.write(name.encode() + b'\n' + head)
+                await writer.drain()
+                writer.close()
+            return handle
+
+        servers = [await asyncio.start_unix_server(backend(path), path) for path in socket_paths]
+        router = ShardRouter(socket_paths)
+        server = await router.serve('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        responses = []
+        try:
+            for request in requests:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request)
+                responses.append((await reader.read()).decode())
+                writer.close()
+        finally:
+            server.close()
+            for backend_server in servers:
+                backend_server.close()
+        return router, responses
+
+    async def test_router_sends_room_to_owning_worker(self):
+        router, [response] = await self._route(
+            b'GET /api/api/room-status/table1/ HTTP/1.1\r\nHost: x\r\nConnection: keep-alive\r\n\r\n')
+
+        owner, _, forwarded = response.partition('\n')
+        self.assertEqual(owner, router.ring.node_for('table1'))
+        self.assertIn('Connection: close', forwarded)
+        self.assertNotIn('keep-alive', forwarded)
+        self.assertIn('X-Forwarded-For: 127.0.0.1', forwarded)
+
+    async def test_unreadable_join_bodies_are_refused(self):
+        _, responses = await self._route(
+            b'POST /api/api/join-room/ HTTP/1.1\r\nHost: x\r\nContent-Length: 70000\r\n\r\n',
+            b'POST /api/api/join-room/ HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n',
+        )
+        self.assertTrue(responses[0].startswith('HTTP/1.1 413 '))
+        self.assertTrue(responses[1].startswith('HTTP/1.1 411 '))
+
+    async def test_requests_without_a_room_can_pick_a_worker(self):
+        router, responses = await self._route(*(
+            f'GET /metrics?worker={i} HTTP/1.1\r\nHost: x\r\n\r\n'.encode() for i in range(3)))
+        self.assertEqual([response.partition('\n')[0] for response in responses], router.socket_paths)
+        self.assertEqual(router.worker_for('/ws/game/table1/alice/?worker=0'), router.ring.node_for('table1'))
+
+
 class CardTestCase(TestCase):
     def test_card_creation(self):
         card = Card(14, Suit.HEARTS)
@@ -457,6 +1697,14 @@ class CardTestCase(TestCase):
         number = Card(7, Suit.DIAMONDS)
         self.assertEqual(str(number), '7D')
 
+    def test_card_to_dict_is_interned(self):
+        self.assertIs(Card(14, Suit.HEARTS).to_dict(), Card(14, Suit.HEARTS).to_dict())
+
+    def test_deck_reuses_shared_cards(self):
+        deck = Deck()
+        self.assertEqual(len(deck.cards), 52)
+        self.assertEqual(set(map(id, deck.cards)), set(map(id, DECK_CARDS)))
+
 
 class IntegrationTestCase(TestCase):
     def setUp(self):
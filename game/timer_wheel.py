@@ -0,0 +1,47 @@
+import math
+from typing import Dict, Hashable, List
+
+class TimerWheel:
+    """Hashed timer wheel keyed by arbitrary hashable keys.
+
+    Scheduling, rescheduling and cancelling are O(1) dict operations. Each
+    tick looks at a single slot, so expiring timers costs O(1) per expired
+    key rather than a scan of every timer. Timeouts longer than one turn of
+    the wheel stay in their slot until their expiry tick comes round.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 1024):
+        self.tick = tick
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self.deadlines: Dict[Hashable, int] = {}
+        self.current_tick = 0
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.deadlines
+
+    def schedule(self, key: Hashable, timeout: float) -> None:
+        """(Re)schedule key to expire timeout seconds from the current tick"""
+        self.cancel(key)
+        expiry = self.current_tick + max(1, math.ceil(timeout / self.tick))
+        self.deadlines[key] = expiry
+        self.slots[expiry % len(self.slots)][key] = expiry
+
+    def cancel(self, key: Hashable) -> bool:
+        expiry = self.deadlines.pop(key, None)
+        if expiry is None:
+            return False
+        del self.slots[expiry % len(self.slots)][key]
+        return True
+
+    def advance(self) -> List[Hashable]:
+        """Move forward one tick and return the keys that expired"""
+        self.current_tick += 1
+        slot = self.slots[self.current_tick % len(self.slots)]
+        expired = [key for key, expiry in slot.items() if expiry <= self.current_tick]
+        for key in expired:
+            del slot[key]
+            del self.deadlines[key]
+        return expired
@@ -0,0 +1,259 @@
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+import itertools
+import json
+import random
+import secrets
+from typing import Deque, Dict, List, Optional, Tuple
+import logging
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The span the running code belongs to; None almost always, so the
+# untraced hot path costs one ContextVar lookup per instrumented call
+_current: ContextVar[Optional['Span']] = ContextVar('trace_span', default=None)
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attrs', 'start', 'end', '_token')
+
+    def __init__(self, trace: 'Trace', parent_id: Optional[int], name: str, attrs: Dict,
+                 start: Optional[float] = None, end: Optional[float] = None):
+        self.trace = trace
+        self.span_id = next(trace.ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = start
+        self.end = end
+        self._token = None
+        trace.spans.append(self)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        _current.reset(self._token)
+        if exc is not None:
+            self.attrs['error'] = repr(exc)
+        if self.parent_id is None:
+            self.trace.tracer._root_finished(self.trace)
+        return False
+
+class Trace:
+    def __init__(self, tracer: 'Tracer', name: str, attrs: Dict):
+        self.tracer = tracer
+        self.trace_id = secrets.token_hex(8)
+        self.wall_start = time.time()
+        self.ids = itertools.count()
+        self.spans: List[Span] = []
+        # Frames expected to be sent that have not been sent or discarded yet
+        self.outstanding = 0
+        self.root_done = False
+        self.root = Span(self, None, name, attrs)
+
+    def to_dict(self, incomplete: bool = False) -> Dict:
+        origin = self.root.start
+        nodes = {}
+        for span in list(self.spans):
+            if span.start is None:
+                continue
+            nodes[span.span_id] = {
+                'name': span.name,
+                'start_ms': round((span.start - origin) * 1000, 3),
+                'duration_ms': round((span.end - span.start) * 1000, 3) if span.end is not None else None,
+                **({'attrs': span.attrs} if span.attrs else {}),
+                'children': [],
+            }
+        for span in self.spans:
+            parent = nodes.get(span.parent_id)
+            if parent is not None and span.span_id in nodes:
+                parent['children'].append(nodes[span.span_id])
+        last_end = max((span.end for span in self.spans if span.end is not None), default=origin)
+        return {
+            'trace_id': self.trace_id,
+            'timestamp': self.wall_start,
+            'duration_ms': round((last_end - origin) * 1000, 3),
+            'incomplete': incomplete,
+            'root': nodes[self.root.span_id],
+        }
+
+class _NoopSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+class Delivery:
+    """A traced frame on its way to one connection"""
+
+    __slots__ = ('trace_id', 'parent_id', 'dispatched_at', 'queued_at', 'attrs')
+
+    def __init__(self, trace_id: str, parent_id: int, dispatched_at: float, attrs: Dict):
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.dispatched_at = dispatched_at
+        self.queued_at = time.perf_counter()
+        self.attrs = attrs
+
+class Tracer:
+    """Opt-in, sampled tracing of one inbound message through to the frames it sends.
+
+    A sampled message gets a root span; code running under it records child
+    spans through ``span()`` and ``traced()``. Broadcasts carry the trace
+    context through the channel layer (``context()``), and each recipient's
+    outbound queue reports when the frame was actually written, so a trace
+    ends at the last frame sent, or after ``settle_seconds`` if some never
+    are. Finished traces go to an in-memory ring buffer and, optionally, are
+    appended as JSON lines to ``export_path``.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, buffer_size: int = 200,
+                 export_path: Optional[str] = None, settle_seconds: float = 2.0):
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self.settle_seconds = settle_seconds
+        self.recent: Deque[Dict] = deque(maxlen=buffer_size)
+        self.open: Dict[str, Trace] = {}
+        self.sampled = 0
+        self.incomplete = 0
+
+    def start(self, name: str, **attrs):
+        """Root span for a sampled message, or a no-op context when not sampled"""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return _NOOP
+        trace = Trace(self, name, attrs)
+        self.open[trace.trace_id] = trace
+        self.sampled += 1
+        return trace.root
+
+    def span(self, name: str, **attrs):
+        parent = _current.get()
+        if parent is None:
+            return _NOOP
+        return Span(parent.trace, parent.span_id, name, attrs)
+
+    def traced(self, func):
+        """Decorator recording each call as a span when running inside a trace"""
+        name = func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = _current.get()
+            if parent is None:
+                return func(*args, **kwargs)
+            with Span(parent.trace, parent.span_id, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def context(self, recipients: int = 0) -> Optional[Tuple[str, int, float]]:
+        """Trace context to put in a channel layer message sent to ``recipients`` connections"""
+        parent = _current.get()
+        if parent is None:
+            return None
+        parent.trace.outstanding += recipients
+        return parent.trace.trace_id, parent.span_id, time.perf_counter()
+
+    def delivery(self, context: Optional[Tuple[str, int, float]] = None, **attrs) -> Optional[Delivery]:
+        """Delivery token for a frame queued from ``context``, or from the current span"""
+        if context is None:
+            parent = _current.get()
+            if parent is None:
+                return None
+            # Sent directly rather than through the channel layer, so not counted yet
+            parent.trace.outstanding += 1
+            return Delivery(parent.trace.trace_id, parent.span_id, time.perf_counter(), attrs)
+        trace_id, parent_id, dispatched_at = context
+        if trace_id not in self.open:
+            return None
+        return Delivery(trace_id, parent_id, dispatched_at, attrs)
+
+    def sent(self, delivery: Delivery, send_start: float, send_end: float) -> None:
+        trace = self.open.get(delivery.trace_id)
+        if trace is None:
+            return
+        deliver = Span(trace, delivery.parent_id, 'deliver', delivery.attrs, delivery.dispatched_at, send_end)
+        Span(trace, deliver.span_id, 'channel_layer', {}, delivery.dispatched_at, delivery.queued_at)
+        Span(trace, deliver.span_id, 'queue_wait', {}, delivery.queued_at, send_start)
+        Span(trace, deliver.span_id, 'send', {}, send_start, send_end)
+        self._settle(trace)
+
+    def discarded(self, delivery: Delivery, reason: str) -> None:
+        trace = self.open.get(delivery.trace_id)
+        if trace is None:
+            return
+        now = time.perf_counter()
+        Span(trace, delivery.parent_id, 'deliver', {**delivery.attrs, 'discarded': reason},
+             delivery.dispatched_at, now)
+        self._settle(trace)
+
+    def _settle(self, trace: Trace) -> None:
+        trace.outstanding -= 1
+        if trace.root_done and trace.outstanding <= 0:
+            self._finish(trace)
+
+    def _root_finished(self, trace: Trace) -> None:
+        trace.root_done = True
+        if trace.outstanding <= 0:
+            self._finish(trace)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._finish(trace, incomplete=True)
+            return
+        loop.call_later(self.settle_seconds, self._expire, trace.trace_id)
+
+    def _expire(self, trace_id: str) -> None:
+        trace = self.open.get(trace_id)
+        if trace is not None:
+            self._finish(trace, incomplete=True)
+
+    def _finish(self, trace: Trace, incomplete: bool = False) -> None:
+        if self.open.pop(trace.trace_id, None) is None:
+            return
+        if incomplete:
+            self.incomplete += 1
+        record = trace.to_dict(incomplete)
+        self.recent.append(record)
+        if self.export_path:
+            try:
+                with open(self.export_path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            except OSError as e:
+                logger.error(f"Failed to export trace {trace.trace_id}: {e}")
+
+    def traces(self, limit: int = 50, min_ms: float = 0.0) -> List[Dict]:
+        """Finished traces, newest first"""
+        found = []
+        for record in reversed(self.recent):
+            if record['duration_ms'] >= min_ms:
+                found.append(record)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def stats(self) -> Dict:
+        return {
+            'sample_rate': self.sample_rate,
+            'sampled': self.sampled,
+            'incomplete': self.incomplete,
+            'open': len(self.open),
+            'buffered': len(self.recent),
+            'export_path': str(self.export_path) if self.export_path else None,
+        }
+
+tracer = Tracer(
+    sample_rate=getattr(settings, 'TRACE_SAMPLE_RATE', 0.0),
+    buffer_size=getattr(settings, 'TRACE_BUFFER_SIZE', 200),
+    export_path=getattr(settings, 'TRACE_EXPORT_PATH', None),
+)
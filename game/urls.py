@@ -1,7 +1,13 @@
 from django.urls import path
-from . import views
+from . import admin_views, views
 
 urlpatterns = [
     path('api/join-room/', views.join_room, name='join_room'),
     path('api/room-status/<str:room_name>/', views.room_status, name='room_status'),
+    path('api/admin/cleanup/', admin_views.cleanup_rooms, name='admin_cleanup'),
+    path('api/admin/memory/', admin_views.memory_stats, name='admin_memory'),
+    path('api/admin/sessions/', admin_views.sessions, name='admin_sessions'),
+    path('api/admin/drain/', admin_views.drain_server, name='admin_drain'),
+    path('api/admin/traces/', admin_views.traces, name='admin_traces'),
+    path('api/admin/profile/', admin_views.profile_server, name='admin_profile'),
 ]
\ No newline at end of file
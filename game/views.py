@@ -1,38 +1,101 @@
-from django.http import JsonResponse
+import asyncio
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
 import logging
-from .room_manager import room_manager, RoomState
+import secrets
+import threading
+import weakref
+from .room_manager import room_change_listeners, room_manager, RoomState
 
 logger = logging.getLogger(__name__)
 
+# Part of every ETag, so versions from an earlier process never match
+BOOT_ID = secrets.token_hex(4)
+
+MAX_WAIT_SECONDS = 30
+
+# Encoded room-status body per room, reused until the room's version changes
+_status_bodies = weakref.WeakKeyDictionary()
+
+# Long-polling requests waiting for a room to change, by room name. Rooms
+# change on view, expiry and manager threads as well as the event loop.
+_waiters = {}
+_waiters_lock = threading.Lock()
+
+def _wake_waiters(room_name, room):
+    with _waiters_lock:
+        waiters = _waiters.pop(room_name, ())
+    for loop, future in waiters:
+        loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+room_change_listeners.append(_wake_waiters)
+
+def _etag(version):
+    return f'"{BOOT_ID}-{version}"'
+
+def _status_body(room):
+    """Return (version, encoded body), serializing only when the room changed"""
+    cached = _status_bodies.get(room)
+    if cached and cached[0] == room.version:
+        return cached
+    with room_manager.lock_for(room.name):
+        cached = (room.version, json.dumps({'exists': True, 'room_data': room.to_dict()}).encode())
+    _status_bodies[room] = cached
+    return cached
+
+async def _wait_for_change(room_name, version, timeout):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    waiter = (loop, future)
+    with _waiters_lock:
+        _waiters.setdefault(room_name, []).append(waiter)
+    room = room_manager.get_room(room_name)
+    if room is None or room.version != version:
+        # Changed from another thread before we were registered
+        future.set_result(None)
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        # Timed out or cancelled; a wakeup has already removed it
+        with _waiters_lock:
+            waiters = _waiters.get(room_name)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del _waiters[room_name]
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def join_room(request):
+async def join_room(request):
     try:
         data = json.loads(request.body)
         room_name = data.get('room_name', '').strip()
         player_name = data.get('player_name', '').strip()
-        
+
         if not room_name or not player_name:
             return JsonResponse({'error': 'Room name and player name are required'}, status=400)
-        
+
         if not room_name.isalnum() or not player_name.isalnum():
             return JsonResponse({'error': 'Room name and player name must be alphanumeric'}, status=400)
-        
+
         success, message = room_manager.join_room(room_name, player_name)
-        
+
         if success:
             room = room_manager.get_room(room_name)
+            with room_manager.lock_for(room_name):
+                room_data = room.to_dict()
             return JsonResponse({
                 'success': True,
                 'message': message,
-                'room_data': room.to_dict()
+                'room_data': room_data
             })
         else:
             return JsonResponse({'error': message}, status=400)
-            
+
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
@@ -40,18 +103,37 @@ def join_room(request):
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
 @require_http_methods(["GET"])
-def room_status(request, room_name):
+async def room_status(request, room_name):
+    """Room state with a strong ETag; ?wait=N holds a matching request until the room changes"""
     try:
         room = room_manager.get_room(room_name)
-        if room:
-            return JsonResponse({
-                'exists': True,
-                'room_data': room.to_dict()
-            })
-        else:
+        if not room:
             return JsonResponse({
                 'exists': False
             })
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if _etag(room.version) in if_none_match:
+            try:
+                wait = min(float(request.GET.get('wait', 0)), MAX_WAIT_SECONDS)
+            except ValueError:
+                wait = 0
+            if wait > 0:
+                await _wait_for_change(room_name, room.version, wait)
+                room = room_manager.get_room(room_name)
+                if not room:
+                    return JsonResponse({'exists': False})
+            if _etag(room.version) in if_none_match:
+                response = HttpResponseNotModified()
+                response['ETag'] = _etag(room.version)
+                response['Cache-Control'] = 'no-cache'
+                return response
+
+        version, body = _status_body(room)
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = _etag(version)
+        response['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error in room_status: {e}")
         return JsonResponse({'error': 'Internal server error'}, status=500)
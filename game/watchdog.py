@@ -0,0 +1,147 @@
+import asyncio
+from collections import deque
+import sys
+import threading
+import traceback
+from typing import Deque, Dict, Optional
+import logging
+import time
+import weakref
+from django.conf import settings
+from .metrics import Histogram, LOOP_LAG_SECONDS, LOOP_STALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class LoopWatchdog:
+    """Measures event loop lag and reports callbacks that block it.
+
+    A heartbeat task on the loop wakes every ``interval`` seconds and
+    records how late it was. A monitor thread watches the heartbeat; when it
+    is more than ``threshold`` seconds overdue, the loop is stuck in some
+    synchronous code, so the monitor captures the loop thread's stack and
+    the consumer handler, room and message type of the running task. The
+    stall is logged and counted once the loop recovers, or straight away if
+    it is still blocked after ``report_after`` seconds.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.02, report_after: float = 5.0,
+                 stack_limit: int = 15, lag_histogram: Optional[Histogram] = LOOP_LAG_SECONDS,
+                 stall_histogram: Optional[Histogram] = LOOP_STALL_SECONDS):
+        self.threshold = threshold
+        self.interval = interval
+        self.report_after = report_after
+        self.stack_limit = stack_limit
+        self.lag_histogram = lag_histogram
+        self.stall_histogram = stall_histogram
+        self.stalls: Deque[Dict] = deque(maxlen=50)
+        # Consumer running in each connection's task, to name what blocked
+        self.consumers = weakref.WeakKeyDictionary()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._stall: Optional[Dict] = None
+
+    def start(self) -> None:
+        """Watch the running loop; cheap to call on every connect"""
+        if not self.threshold:
+            return
+        loop = asyncio.get_running_loop()
+        if self._task and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self.loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._stall = None
+        self._task = loop.create_task(self._heartbeat())
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._monitor, name='loop-watchdog', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    def track(self, consumer, handler: str) -> None:
+        """Record which handler the consumer in the current task is running"""
+        consumer.handling = handler
+        consumer.message_type = None
+        task = asyncio.current_task()
+        if task is not None and self.consumers.get(task) is not consumer:
+            self.consumers[task] = consumer
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_beat = now
+            if self.lag_histogram:
+                self.lag_histogram.observe(max(now - expected, 0.0))
+
+    def _monitor(self):
+        while not self._stopped.wait(self.interval):
+            loop = self.loop
+            if loop is None or loop.is_closed() or not loop.is_running():
+                self._stall = None
+                continue
+            overdue = time.monotonic() - self.last_beat - self.interval
+            stall = self._stall
+            if overdue > self.threshold:
+                if stall is None:
+                    self._stall = self._capture(loop)
+                elif overdue > self.report_after and not stall['reported']:
+                    stall['reported'] = True
+                    logger.warning("Event loop blocked for %.1fs so far in %s\n%s",
+                                   overdue, self._describe(stall), stall['stack'])
+            elif stall is not None and self.last_beat > stall['beat']:
+                self._stall = None
+                self._report(stall, self.last_beat - stall['beat'] - self.interval)
+
+    def _capture(self, loop) -> Dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame, limit=-self.stack_limit)) if frame else ''
+        task = asyncio.current_task(loop)
+        consumer = self.consumers.get(task) if task is not None else None
+        if consumer is not None:
+            context = {
+                'handler': getattr(consumer, 'handling', None) or 'unknown',
+                'message_type': getattr(consumer, 'message_type', None) or '',
+                'room': getattr(consumer, 'room_name', None),
+                'player': getattr(consumer, 'player_name', None),
+            }
+        else:
+            coro = task.get_coro() if task is not None else None
+            context = {
+                'handler': getattr(coro, '__qualname__', None) or ('task' if task else 'callback'),
+                'message_type': '',
+                'room': None,
+                'player': None,
+            }
+        return {'beat': self.last_beat, 'stack': stack, 'reported': False, **context}
+
+    def _describe(self, stall: Dict) -> str:
+        where = stall['handler']
+        if stall['message_type']:
+            where += f" ({stall['message_type']})"
+        if stall['room']:
+            where += f" for {stall['player']} in room {stall['room']}"
+        return where
+
+    def _report(self, stall: Dict, duration: float) -> None:
+        record = {key: stall[key] for key in ('handler', 'message_type', 'room', 'player', 'stack')}
+        record['duration'] = duration
+        record['timestamp'] = time.time()
+        self.stalls.append(record)
+        if self.stall_histogram:
+            self.stall_histogram.observe(duration, stall['handler'], stall['message_type'])
+        if stall['reported']:
+            logger.warning("Event loop unblocked after %.3fs in %s", duration, self._describe(stall))
+        else:
+            logger.warning("Event loop blocked for %.3fs in %s\n%s", duration, self._describe(stall), stall['stack'])
+
+watchdog = LoopWatchdog(getattr(settings, 'LOOP_STALL_THRESHOLD', 0.1))
@@ -5,6 +5,8 @@ echo "Starting The Gang server..."
 # Function to handle cleanup
 cleanup() {
     echo "Stopping server..."
+    # Save rooms and send clients away so they resume on the next start
+    python manage.py drain_server --url http://127.0.0.1:80 || echo "Drain failed; rooms were not saved"
     kill $DJANGO_PID 2>/dev/null
     exit 0
 }
@@ -17,9 +19,12 @@ echo "Building React frontend..."
 cd frontend && npm run build
 cd ..
 
+# Activate the venv here so the drain on Ctrl+C runs in it too
+source venv/bin/activate
+
 # Start Django server with ASGI support (serves both frontend and API)
 echo "Starting Django server with ASGI (serving frontend and API)..."
-source venv/bin/activate && daphne -b 0.0.0.0 -p 80 thegang.asgi:application &
+DJANGO_SETTINGS_MODULE=thegang.settings_lean daphne -b 0.0.0.0 -p 80 --ping-interval 20 --ping-timeout 30 thegang.asgi:application &
 DJANGO_PID=$!
 
 echo "Production server started!"
@@ -9,17 +9,31 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from game.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thegang.settings')
 
+# Set up Django before importing anything that reads settings or models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter
+from game.routing import websocket_application
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            websocket_urlpatterns
-        )
-    ),
+    "http": django_asgi_app,
+    "websocket": websocket_application(),
 })
+
+# Index and precompress the frontend build before the first request
+from thegang.static_assets import static_assets
+static_assets.refresh()
+
+# Bring back rooms from the previous process and keep persisting them. When
+# taking over from a draining process, wait for its rooms before touching
+# the snapshot store it is still writing.
+from game.persistence import room_store
+handoff_socket = os.environ.get('THEGANG_HANDOFF_SOCKET')
+if handoff_socket:
+    from game.handoff import receive_rooms
+    receive_rooms(handoff_socket, on_complete=room_store.enable if room_store else None)
+elif room_store:
+    room_store.enable()
@@ -0,0 +1,89 @@
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Dict, Tuple
+
+# Process-wide totals, for monitoring
+log_stats = {
+    'queued': 0,
+    'dropped': 0,
+    'suppressed': 0,
+}
+
+class QueuedHandler(logging.handlers.QueueHandler):
+    """Hands records to a background thread that formats and writes them.
+
+    The stock QueueHandler formats each record in the calling thread before
+    queueing it; this one queues the record untouched, so formatting and
+    the write both happen on the writer thread. The queue is bounded and
+    never blocks: when the writer falls behind, records are dropped and
+    counted instead of stalling the event loop.
+    """
+
+    def __init__(self, maxsize: int = 10000, stream=None):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def close(self):
+        # Called by logging.shutdown at exit; drains what is still queued
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            log_stats['queued'] += 1
+        except queue.Full:
+            log_stats['dropped'] += 1
+
+class RateLimitFilter(logging.Filter):
+    """Limits each logging call site to a burst per period, then samples it.
+
+    Within each period of ``period`` seconds a call site (file and line)
+    passes its first ``burst`` records, then one in every ``sample_every``.
+    The first record let through in the next period notes how many were
+    suppressed. Warnings and errors always pass.
+    """
+
+    def __init__(self, burst: int = 20, period: float = 1.0, sample_every: int = 100):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.sample_every = sample_every
+        # Call site -> [period start, records this period, suppressed this period]
+        self.sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            site = self.sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self.sites[(record.pathname, record.lineno)] = [now, 0, 0]
+            elif now - site[0] >= self.period:
+                if site[2]:
+                    record.msg = f"{record.msg} [{site[2]} similar messages suppressed]"
+                site[:] = [now, 0, 0]
+            site[1] += 1
+            over = site[1] - self.burst
+            if over <= 0:
+                return True
+            if over % self.sample_every == 0:
+                return True
+            site[2] += 1
+        log_stats['suppressed'] += 1
+        return False
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -125,7 +126,6 @@ STATICFILES_DIRS = [
     BASE_DIR / 'frontend' / 'build' / 'static',
 ]
 
-TEMPLATES[0]['DIRS'] = [BASE_DIR / 'frontend' / 'build']
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -144,3 +144,88 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels.layers.InMemoryChannelLayer"
     }
 }
+
+
+# Per-connection outbound WebSocket queue: maximum queued frames, and how many
+# seconds a connection may stay behind before it is disconnected
+OUTBOUND_QUEUE_MAX_DEPTH = 32
+OUTBOUND_QUEUE_MAX_LAG = 15.0
+# Frames sent ahead of the client's last acknowledgement, for clients that ack
+OUTBOUND_ACK_WINDOW = 8
+
+# Seconds a disconnected player's seat is held for a resumable reconnect
+RECONNECT_GRACE_SECONDS = 30
+
+# Seconds without any inbound traffic before the server closes a connection
+# from an older client that sends JSON pings; everything else is left to
+# daphne's protocol pings
+WEBSOCKET_IDLE_TIMEOUT = 600
+
+# Seconds a room may go without activity or connected players before the
+# in-process expiry scheduler deletes it
+ROOM_IDLE_TIMEOUT = 600
+
+# Token accepted in the X-Admin-Token header for admin endpoints called from
+# other hosts; requests from localhost are always allowed
+ADMIN_TOKEN = None
+
+# Directory for crash-safe room snapshots restored on server start (None to
+# disable). Each shard started by runsharded persists to its own directory.
+ROOM_SNAPSHOT_DIR = BASE_DIR / 'var' / 'rooms' / os.environ.get('THEGANG_SHARD', 'single').replace('/', '-of-')
+
+# Process-wide room budget. Past either limit, idle rooms (nobody connected)
+# are evicted least recently active first, then new rooms are refused.
+ROOM_BUDGET_MAX_ROOMS = 5000
+ROOM_BUDGET_MAX_BYTES = 256 * 1024 * 1024
+
+# Wrap WebSocket connections in channels' AuthMiddlewareStack. The consumers
+# never read scope['user'], so the lean profile turns this off.
+WEBSOCKET_AUTH = True
+
+# Fraction of inbound game messages traced from receive to the last frame
+# sent (0 to disable; can be changed at runtime through api/admin/traces/).
+# Finished traces are kept in memory and, if set, appended to TRACE_EXPORT_PATH.
+TRACE_SAMPLE_RATE = 0.0
+TRACE_BUFFER_SIZE = 200
+TRACE_EXPORT_PATH = None
+
+# Seconds the event loop may be blocked before the watchdog logs the stack
+# and handler that blocked it (0 to disable)
+LOOP_STALL_THRESHOLD = 0.1
+
+# Where profiles taken through api/admin/profile/ are saved (None to only
+# return them)
+PROFILE_DIR = BASE_DIR / 'var' / 'profiles'
+
+# Logs go through a bounded queue to a writer thread, so formatting and I/O
+# never run on the event loop; each call site gets 20 INFO records per second
+# before it is sampled. The root level is left to the server (daphne -v).
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'rate_limit': {
+            '()': 'thegang.log_queue.RateLimitFilter',
+            'burst': 20,
+            'period': 1.0,
+            'sample_every': 100,
+        },
+    },
+    'formatters': {
+        'plain': {
+            'format': '%(asctime)s %(levelname)-8s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'queued': {
+            '()': 'thegang.log_queue.QueuedHandler',
+            'maxsize': 10000,
+            'stream': 'ext://sys.stderr',
+            'formatter': 'plain',
+            'filters': ['rate_limit'],
+        },
+    },
+    'root': {
+        'handlers': ['queued'],
+    },
+}
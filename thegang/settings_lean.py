@@ -0,0 +1,32 @@
+"""
+Lean production profile: DJANGO_SETTINGS_MODULE=thegang.settings_lean
+
+The game keeps all of its state in memory and has no models, so this
+profile drops the admin, auth, sessions and messages apps and their
+middleware. WebSocket connects then run without a session or user lookup
+in the database, and DEBUG query bookkeeping is off.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+INSTALLED_APPS = [
+    'django.contrib.staticfiles',
+    'channels',
+    'corsheaders',
+    'game',
+]
+
+MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    'django.template.context_processors.request',
+]
+
+WEBSOCKET_AUTH = False
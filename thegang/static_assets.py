@@ -0,0 +1,243 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+import logging
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Build tools put a content hash in the name of every file that may be cached forever
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+SHELL_NAME = 'index.html'
+SCRIPT_TAG = re.compile(rb'<script\b[^>]*>')
+STYLESHEET_TAG = re.compile(rb'<link\b[^>]*\brel="stylesheet"[^>]*>')
+SRC_ATTR = re.compile(rb'\b(?:src|href)="([^"]+)"')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+class StaticAsset(NamedTuple):
+    path: Path
+    content_type: str
+    size: int
+    etag: str
+    cache_control: str
+    # Whole file when small enough to keep in memory, otherwise streamed from disk
+    body: Optional[bytes]
+    # Precompressed representations by content coding, only where they are smaller
+    encoded: Dict[str, bytes]
+
+def add_preload_hints(html: bytes) -> bytes:
+    """Add preload hints for the hashed bundles at the top of <head>"""
+    hints = []
+    for tag in SCRIPT_TAG.findall(html):
+        src = SRC_ATTR.search(tag)
+        if src and HASHED_NAME.search(src.group(1).decode()):
+            if b'type="module"' in tag:
+                hints.append(b'<link rel="modulepreload" href="%s">' % src.group(1))
+            else:
+                hints.append(b'<link rel="preload" href="%s" as="script">' % src.group(1))
+    for tag in STYLESHEET_TAG.findall(html):
+        href = SRC_ATTR.search(tag)
+        if href and HASHED_NAME.search(href.group(1).decode()):
+            hints.append(b'<link rel="preload" href="%s" as="style">' % href.group(1))
+    hints = [hint for hint in hints if hint not in html]
+    if not hints:
+        return html
+    # After <meta charset>, which has to come first, or else right after <head>
+    anchor = re.search(rb'<meta charset[^>]*>', html) or re.search(rb'<head[^>]*>', html)
+    if anchor is None:
+        return html
+    return html[:anchor.end()] + b''.join(hints) + html[anchor.end():]
+
+class StaticAssetIndex:
+    """Serves a build directory from an index built once, not from disk per request.
+
+    Every file is hashed for a strong ETag, and compressible files are
+    precompressed (gzip, plus brotli when the package is installed). Files
+    up to max_cached_bytes are kept in memory; larger ones are streamed.
+    The top-level index.html gets preload hints for its bundles. The index
+    is rebuilt when the build's manifest changes, checked at most once per
+    check_interval seconds; the rebuild runs in a thread, and the old index
+    is served until it finishes.
+    """
+
+    def __init__(self, root, manifest: Optional[str] = 'asset-manifest.json',
+                 max_cached_bytes: int = 1024 * 1024, check_interval: float = 2.0):
+        self.root = Path(root)
+        self.manifest = self.root / manifest if manifest else None
+        self.max_cached_bytes = max_cached_bytes
+        self.check_interval = check_interval
+        self.assets: Dict[str, StaticAsset] = {}
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+        self._refreshing: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _build_asset(self, path: Path) -> StaticAsset:
+        data = path.read_bytes()
+        if path == self.root / SHELL_NAME:
+            data = add_preload_hints(data)
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        encoded = {}
+        if content_type.startswith(COMPRESSIBLE_TYPES) or path.suffix == '.map':
+            candidates = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli:
+                candidates['br'] = brotli.compress(data)
+            # Only keep codings that save at least a few percent
+            encoded = {coding: body for coding, body in candidates.items() if len(body) < len(data) * 0.95}
+        return StaticAsset(
+            path=path,
+            content_type=content_type,
+            size=len(data),
+            etag=hashlib.blake2b(data, digest_size=12).hexdigest(),
+            cache_control=IMMUTABLE if HASHED_NAME.search(path.name) else REVALIDATE,
+            body=data if len(data) <= self.max_cached_bytes else None,
+            encoded=encoded,
+        )
+
+    def _manifest_stat(self):
+        try:
+            return os.stat(self.manifest).st_mtime_ns if self.manifest else None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> int:
+        """Re-index the directory; returns the number of assets"""
+        start = time.monotonic()
+        assets = {}
+        if self.root.is_dir():
+            for path in self.root.rglob('*'):
+                if path.is_file():
+                    assets[path.relative_to(self.root).as_posix()] = self._build_asset(path)
+        with self._lock:
+            self.assets = assets
+            self._manifest_mtime = self._manifest_stat()
+            self._checked_at = time.monotonic()
+        logger.info(f"Indexed {len(assets)} static assets in {time.monotonic() - start:.3f}s")
+        return len(assets)
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Failed to re-index static assets")
+        finally:
+            self._refreshing = None
+
+    def refresh_if_changed(self) -> Optional[threading.Thread]:
+        """Start re-indexing in a thread if the manifest changed; returns that thread"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return None
+        self._checked_at = now
+        if self._manifest_stat() == self._manifest_mtime:
+            return None
+        with self._lock:
+            if self._refreshing is None:
+                self._refreshing = threading.Thread(
+                    target=self._refresh_in_background, name='static-assets-refresh', daemon=True)
+                self._refreshing.start()
+            return self._refreshing
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        self.refresh_if_changed()
+        return self.assets.get(name)
+
+def _choose_coding(asset: StaticAsset, accept_encoding: str) -> Optional[str]:
+    accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+    for coding in ('br', 'gzip'):
+        if coding in asset.encoded and coding in accepted:
+            return coding
+    return None
+
+def _parse_range(header: str, size: int):
+    """Return (start, end) inclusive for a single byte range, or None if unsatisfiable"""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        return None
+    return start, end
+
+async def _read_range(path: Path, start: int, length: int, chunk_size: int = 64 * 1024):
+    """Yield the file's bytes in chunks, reading in a thread so the event loop never blocks.
+
+    Django consumes a sync iterator under ASGI by collecting all of it in a
+    thread first, which would hold the whole file in memory.
+    """
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+def serve_asset(request, asset: StaticAsset):
+    coding = _choose_coding(asset, request.headers.get('Accept-Encoding', ''))
+    # Each representation needs its own strong validator
+    etag = f'"{asset.etag}-{coding}"' if coding else f'"{asset.etag}"'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in if_none_match or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+    elif coding:
+        response = HttpResponse(asset.encoded[coding], content_type=asset.content_type)
+        response['Content-Encoding'] = coding
+    elif 'Range' in request.headers:
+        byte_range = _parse_range(request.headers['Range'], asset.size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{asset.size}'
+            return response
+        start, end = byte_range
+        if asset.body is not None:
+            response = HttpResponse(asset.body[start:end + 1], content_type=asset.content_type, status=206)
+        else:
+            response = StreamingHttpResponse(
+                _read_range(asset.path, start, end - start + 1), content_type=asset.content_type, status=206)
+            response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{asset.size}'
+    elif asset.body is not None:
+        response = HttpResponse(asset.body, content_type=asset.content_type)
+    else:
+        response = StreamingHttpResponse(_read_range(asset.path, 0, asset.size), content_type=asset.content_type)
+        response['Content-Length'] = str(asset.size)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = asset.cache_control
+    response['Accept-Ranges'] = 'bytes'
+    if asset.encoded:
+        response['Vary'] = 'Accept-Encoding'
+    return response
+
+static_assets = StaticAssetIndex(settings.BASE_DIR / 'frontend' / 'build')
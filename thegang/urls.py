@@ -14,30 +14,36 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include, re_path
-from django.views.generic import TemplateView
 from django.conf import settings
-from django.views.static import serve
 from django.http import HttpResponse
-import mimetypes
-import os
+from django.views.decorators.http import require_http_methods
+from game.admin_views import prometheus_metrics
+from .static_assets import SHELL_NAME, serve_asset, static_assets
 
-def serve_static(request, path):
-    document_root = settings.BASE_DIR / 'frontend' / 'build' / 'static'
-    full_path = os.path.join(document_root, path)
-    
-    if os.path.exists(full_path):
-        mime_type, _ = mimetypes.guess_type(full_path)
-        with open(full_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=mime_type)
-            return response
-    else:
+@require_http_methods(["GET", "HEAD"])
+async def serve_static(request, path):
+    asset = static_assets.get(f'static/{path}')
+    if asset is None:
         return HttpResponse(status=404)
+    return serve_asset(request, asset)
+
+@require_http_methods(["GET", "HEAD"])
+async def serve_app_shell(request):
+    """The built index.html, served from memory"""
+    asset = static_assets.get(SHELL_NAME)
+    if asset is None:
+        return HttpResponse("Frontend not built; run npm run build in frontend/", status=404)
+    return serve_asset(request, asset)
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('game.urls')),
+    path('metrics', prometheus_metrics, name='metrics'),
     re_path(r'^static/(?P<path>.*)$', serve_static),
-    path('', TemplateView.as_view(template_name='index.html'), name='frontend'),
+    path('', serve_app_shell, name='frontend'),
 ]
+
+# The lean settings profile leaves the admin out
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))